@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+يقيس تكلفة المعالجة المسبقة لكل رسالة قبل وبعد PreprocessMiddleware، بدون تيليجرام ولا MongoDB.
+
+الاستخدام (من جذر المشروع):
+    python -m benchmarks.preprocess_overhead [عدد_الرسائل]
+
+المسار القديم هنا هو نسخة طبق الأصل من BanMiddleware و AntiFloodMiddleware (مع قائمة الطوابع الزمنية في FSM)
+وفحوصات الأمان المكررة في handle_user_message. التخزين في الذاكرة، لذلك الأرقام تقيس تكلفة المعالج فقط؛
+في الإنتاج كان المسار القديم يضيف ثلاث رحلات إلى MongoDB لكل رسالة.
+"""
+
+import os
+import sys
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:benchmark")
+os.environ.setdefault("ADMIN_USER_ID", "1")
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from aiogram import types
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher.handler import CancelHandler
+
+from bot.core.flood_control import FLOOD_RING_MAX_CAPACITY
+from bot.database.manager import db
+from bot.middlewares.preprocess_middleware import PreprocessMiddleware
+
+USERS = 10_000
+
+
+def make_message(user_id: int) -> types.Message:
+    return types.Message(**{
+        "message_id": 1, "date": 0, "text": "السلام عليكم",
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Benchmark"},
+    })
+
+
+async def legacy_preprocess(message: types.Message, storage: MemoryStorage):
+    # BanMiddleware.on_pre_process_update
+    user = message.from_user
+    if await db.is_user_banned(user.id):
+        raise CancelHandler()
+    # AntiFloodMiddleware.on_pre_process_message (FSM timestamps list)
+    settings = await db.get_antiflood_settings()
+    if settings.get("enabled", True):
+        user_id = user.id
+        user_data = await storage.get_data(chat=user_id, user=user_id) or {}
+        mute_until = user_data.get("mute_until")
+        now = datetime.now()
+        if mute_until and now < datetime.fromisoformat(mute_until):
+            raise CancelHandler()
+        timestamps = user_data.get("antiflood_timestamps", [])
+        timestamps.append(now)
+        recent_timestamps = [ts for ts in timestamps if now - ts < timedelta(seconds=settings.get("time_window", 2))]
+        if len(recent_timestamps) >= settings.get("rate_limit", 7):
+            raise CancelHandler()
+        current_data = await storage.get_data(chat=user_id, user=user_id) or {}
+        current_data['antiflood_timestamps'] = recent_timestamps
+        await storage.set_data(chat=user_id, user=user_id, data=current_data)
+    # handle_user_message: bot status and media checks
+    security = await db.get_security_settings()
+    if security.get("bot_status") == "inactive":
+        return
+    blocked_media = security.get("blocked_media", {})
+    if (message.photo and blocked_media.get("photo")) or \
+       ((message.entities and any(e.type in ['url', 'text_link'] for e in message.entities)) and blocked_media.get("link")):
+        raise CancelHandler()
+
+
+async def measure(label: str, messages: list, preprocess) -> float:
+    started_at = time.perf_counter()
+    for message in messages:
+        await preprocess(message)
+    per_update_us = (time.perf_counter() - started_at) / len(messages) * 1e6
+    print(f"{label:<28} {per_update_us:8.2f} µs/update")
+    return per_update_us
+
+
+async def main(iterations: int):
+    await db.connect_to_database(None)
+    # The highest accepted limit keeps both paths on the normal-user route (no penalties, no Telegram calls)
+    await db.update_antiflood_setting("rate_limit", FLOOD_RING_MAX_CAPACITY)
+    messages = [make_message(2 + i % USERS) for i in range(iterations)]
+
+    storage = MemoryStorage()
+    middleware = PreprocessMiddleware()
+    before = await measure("before (3 middlewares)", messages, lambda m: legacy_preprocess(m, storage))
+    after = await measure("after (PreprocessMiddleware)", messages, lambda m: middleware.on_pre_process_message(m, {}))
+    print(f"speed-up: x{before / after:.1f} over {iterations} messages from {USERS} users")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000))
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+from aiogram import Bot, types
+from aiogram.utils.exceptions import TelegramAPIError
+
+from config import ADMIN_USER_ID
+
+logger = logging.getLogger(__name__)
+
+# More than this many notifications within the window switches to digests
+ADMIN_DIGEST_THRESHOLD = int(os.getenv("ADMIN_DIGEST_THRESHOLD", 10))
+ADMIN_DIGEST_WINDOW = float(os.getenv("ADMIN_DIGEST_WINDOW", 10))
+# Seconds between two digest messages while the burst lasts
+ADMIN_DIGEST_INTERVAL = float(os.getenv("ADMIN_DIGEST_INTERVAL", 5))
+# Telegram limits: 4096 characters per message, 100 inline buttons per keyboard
+DIGEST_MAX_LENGTH = 4000
+DIGEST_MAX_BUTTONS = 100
+DIGEST_SEPARATOR = "\n\n➖➖➖\n\n"
+
+
+class AdminNotifier:
+    """
+    يجمع إشعارات المدير (مستخدم جديد، رسالة مستخدم، كتم، حظر) بدلاً من إرسال رسالة لكل حدث.
+    في الحمل المنخفض يُرسل كل إشعار فوراً، وإذا تجاوز المعدل الحد تُرسل ملخصات كل بضع ثوانٍ
+    حتى لا نصطدم بحدود تيليجرام لكل محادثة ولا نؤخر الردود الحقيقية.
+    """
+
+    def __init__(self):
+        self.bot = None
+        # (html_text, [InlineKeyboardButton])
+        self.pending = []
+        self.recent = deque()
+        self._flush_task = None
+
+    def _is_busy(self, now: float) -> bool:
+        while self.recent and now - self.recent[0] > ADMIN_DIGEST_WINDOW:
+            self.recent.popleft()
+        return len(self.recent) >= ADMIN_DIGEST_THRESHOLD
+
+    async def notify(self, bot: Bot, text: str, buttons: list = None):
+        """Queues or sends one HTML notification for the admin, with optional inline buttons."""
+        self.bot = bot
+        now = time.monotonic()
+        busy = self._is_busy(now)
+        self.recent.append(now)
+        if not busy and not self.pending:
+            await self._send(text, buttons or [])
+            return
+        self.pending.append((text, buttons or []))
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while self.pending:
+            await asyncio.sleep(ADMIN_DIGEST_INTERVAL)
+            await self.flush()
+
+    async def flush(self):
+        """Sends everything queued so far as one or more digest messages."""
+        pending, self.pending = self.pending, []
+        if not pending or self.bot is None: return
+        if len(pending) == 1:
+            await self._send(*pending[0])
+            return
+        header = f"📬 <b>ملخص الإشعارات ({len(pending)})</b>"
+        chunk_texts, chunk_buttons = [header], []
+        for text, buttons in pending:
+            chunk_length = sum(len(part) for part in chunk_texts) + len(DIGEST_SEPARATOR) * len(chunk_texts)
+            if len(chunk_texts) > 1 and (chunk_length + len(text) > DIGEST_MAX_LENGTH or len(chunk_buttons) + len(buttons) > DIGEST_MAX_BUTTONS):
+                await self._send(DIGEST_SEPARATOR.join(chunk_texts), chunk_buttons)
+                chunk_texts, chunk_buttons = [header], []
+            chunk_texts.append(text)
+            chunk_buttons.extend(buttons)
+        await self._send(DIGEST_SEPARATOR.join(chunk_texts), chunk_buttons)
+
+    async def shutdown(self):
+        """Stops the digest loop and sends whatever is still queued."""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        self._flush_task = None
+        await self.flush()
+
+    async def _send(self, text: str, buttons: list):
+        keyboard = None
+        if buttons:
+            keyboard = types.InlineKeyboardMarkup(row_width=1)
+            keyboard.add(*buttons)
+        # A notice longer than one message is split instead of being rejected by Telegram; buttons go with the last part
+        parts = split_text(text, DIGEST_MAX_LENGTH)
+        for index, part in enumerate(parts):
+            try:
+                await self.bot.send_message(ADMIN_USER_ID, part, reply_markup=keyboard if index == len(parts) - 1 else None, parse_mode=types.ParseMode.HTML)
+            except TelegramAPIError as e:
+                logger.error(f"Failed to send admin notification: {e}")
+
+
+def split_text(text: str, max_length: int) -> list:
+    """Cuts text into parts of at most max_length characters, at line breaks when possible."""
+    parts, current = [], ""
+    for line in text.split("\n"):
+        while len(line) > max_length:
+            # A single line longer than a message: hard cut
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:max_length])
+            line = line[max_length:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > max_length:
+            parts.append(current)
+            candidate = line
+        current = candidate
+    if current or not parts:
+        parts.append(current)
+    return parts
+
+
+admin_notifier = AdminNotifier()
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from aiogram import Bot, types
+from aiogram.utils.callback_data import CallbackData
+from aiogram.utils.exceptions import TelegramAPIError
+
+from bot.core.broadcaster import run_broadcast
+from bot.database.manager import (
+    db, BROADCAST_JOB_QUEUED, BROADCAST_JOB_RUNNING, BROADCAST_JOB_PAUSED, BROADCAST_JOB_CANCELLED, BROADCAST_JOB_DONE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds an idle worker waits before looking at the queue again
+BROADCAST_QUEUE_POLL_INTERVAL = float(os.getenv("BROADCAST_QUEUE_POLL_INTERVAL", 2))
+# A running job whose worker has not checkpointed for this long is taken over by another worker
+BROADCAST_JOB_LEASE = int(os.getenv("BROADCAST_JOB_LEASE", 60))
+
+# --- CallbackData ---
+bc_job_cb = CallbackData("bc_job", "action", "id")
+
+# Date format the admin uses for the joined-after segment (also how it is kept in the FSM data)
+SEGMENT_DATE_FORMAT = "%Y-%m-%d"
+
+
+def resolve_segment(spec: dict) -> dict:
+    """
+    يحوّل اختيارات المدير (قيم بسيطة محفوظة في بيانات FSM) إلى شروط مطلقة تُحفظ مع المهمة،
+    حتى يبقى الجمهور نفسه عند الاستئناف بعد أيام.
+    """
+    spec = spec or {}
+    segment = {}
+    if spec.get("joined_after"):
+        segment["joined_after"] = datetime.strptime(spec["joined_after"], SEGMENT_DATE_FORMAT)
+    if spec.get("active_within_days"):
+        segment["active_after"] = datetime.utcnow() - timedelta(days=int(spec["active_within_days"]))
+    if spec.get("has_username"):
+        segment["has_username"] = True
+    if spec.get("tag"):
+        segment["tag"] = spec["tag"]
+    return segment
+
+
+class BroadcastJobManager:
+    """
+    واجهة لوحة التحكم لمهام النشر: كل العمليات هنا كتابة في طابور MongoDB فقط وتعود فوراً،
+    والإرسال الفعلي يقوم به BroadcastWorker (داخل البوت أو في عملية broadcast_worker.py مستقلة).
+    """
+
+    async def enqueue(self, message_to_send: dict, progress_message: types.Message, segment: dict = None) -> str:
+        """Queues a job for the current audience (or a resolved segment of it)."""
+        job_id = uuid.uuid4().hex[:16]
+        total = await db.get_audience_count(segment)
+        await db.create_broadcast_job(job_id, message_to_send, total, progress_message.chat.id, progress_message.message_id, segment)
+        return job_id
+
+    # Each action only applies from the statuses it makes sense for and returns False otherwise
+    # (e.g. a stale "resume" button must not put a running job back in the queue, where a second worker would take it)
+    async def pause(self, job_id: str) -> bool:
+        return await db.set_broadcast_job_status(job_id, BROADCAST_JOB_PAUSED, expected=(BROADCAST_JOB_QUEUED, BROADCAST_JOB_RUNNING))
+
+    async def resume(self, job_id: str) -> bool:
+        # Back in the queue: the next free worker continues from the saved checkpoint
+        return await db.set_broadcast_job_status(job_id, BROADCAST_JOB_QUEUED, expected=(BROADCAST_JOB_PAUSED,))
+
+    async def cancel(self, job_id: str) -> bool:
+        return await db.set_broadcast_job_status(job_id, BROADCAST_JOB_CANCELLED, expected=(BROADCAST_JOB_QUEUED, BROADCAST_JOB_RUNNING, BROADCAST_JOB_PAUSED))
+
+
+class BroadcastWorker:
+    """
+    يسحب مهام النشر من الطابور واحدة تلو الأخرى وينفذها. كل نقطة حفظ تجدد عقد المهمة (heartbeat)
+    وتقرأ حالتها، فالإيقاف المؤقت أو الإلغاء من لوحة التحكم يصل إلى العامل خلال ثوانٍ أينما كان يعمل.
+    """
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex[:12]
+        self._stopping = None
+        self._current_stop = None
+
+    async def run(self, bot: Bot):
+        # Created here so the event belongs to the running loop
+        self._stopping = asyncio.Event()
+        logger.info(f"📣 Broadcast worker {self.worker_id} is waiting for jobs...")
+        while not self._stopping.is_set():
+            job = await db.claim_next_broadcast_job(self.worker_id, BROADCAST_JOB_LEASE)
+            if not job:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), BROADCAST_QUEUE_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run_job(bot, job)
+
+    async def shutdown(self):
+        """Stops after a last checkpoint of the current job, which goes back to the queue for the next worker."""
+        if self._stopping:
+            self._stopping.set()
+        if self._current_stop:
+            self._current_stop.set()
+
+    async def _run_job(self, bot: Bot, job: dict):
+        job_id = job["_id"]
+        stop_event = self._current_stop = asyncio.Event()
+        logger.info(f"📣 Worker {self.worker_id} took broadcast job {job_id} (after user {job.get('cursor')}).")
+        # Bans are applied by the bot process. The audience query already skips them through the users' `banned`
+        # flag; one reload per job keeps this process's own index current for the in-flight check
+        await db.refresh_ban_index()
+
+        async def checkpoint(stats: dict):
+            await db.mark_users_unreachable(stats["unreachable"])
+            status = await db.save_broadcast_progress(job_id, self.worker_id, stats["cursor"], stats["success"], stats["failed"])
+            if status != BROADCAST_JOB_RUNNING:
+                # أوقفه المدير (إيقاف مؤقت أو إلغاء)، أو انتهى العقد وتولى عامل آخر المهمة (None)
+                stop_event.set()
+                return
+            await self._show_progress(bot, dict(job, status=status, **stats))
+
+        try:
+            stats = await run_broadcast(
+                bot, job["message_to_send"], db.iter_audience(after_user_id=job.get("cursor"), segment=job.get("segment")), job["total"],
+                progress_callback=checkpoint, stop_event=stop_event,
+                initial_stats={"success": job["success"], "failed": job["failed"], "cursor": job.get("cursor")}
+            )
+            await db.mark_users_unreachable(stats["unreachable"])
+            status = await db.save_broadcast_progress(job_id, self.worker_id, stats["cursor"], stats["success"], stats["failed"])
+            if status is None:
+                logger.warning(f"Broadcast job {job_id} was taken over by another worker, leaving it to them.")
+            elif not stats["stopped"] and await db.set_broadcast_job_status(job_id, BROADCAST_JOB_DONE, expected=(BROADCAST_JOB_RUNNING,), worker_id=self.worker_id):
+                final_text = (await db.get_text("bc_finished")).format(success=stats["success"], failed=stats["failed"])
+                # نرسل النتيجة النهائية كرسالة جديدة للحفاظ على سجل واضح
+                await bot.send_message(job["progress_chat_id"], final_text)
+            elif stats["stopped"] and status == BROADCAST_JOB_RUNNING:
+                # Worker shutdown: hand the job back right away instead of waiting for the lease to expire
+                await db.release_broadcast_job(job_id, self.worker_id)
+            else:
+                await self._show_progress(bot, await db.get_broadcast_job(job_id))
+        except Exception as e:
+            # The lease expires and another worker resumes the job from its last checkpoint
+            logger.error(f"Broadcast job {job_id} failed: {e}")
+        finally:
+            self._current_stop = None
+
+    async def _show_progress(self, bot: Bot, job: dict):
+        text, keyboard = await render_job(job)
+        try:
+            await bot.edit_message_text(text, job["progress_chat_id"], job["progress_message_id"], reply_markup=keyboard)
+        except TelegramAPIError:
+            pass # الرسالة لم تتغير أو حُذفت
+
+
+async def render_job(job: dict):
+    """Returns the status text and control keyboard of a broadcast job."""
+    counters = {
+        "success": job["success"], "failed": job["failed"], "total": job["total"],
+        "remaining": max(job["total"] - job["success"] - job["failed"], 0)
+    }
+    keyboard = types.InlineKeyboardMarkup(row_width=2)
+    if job["status"] in (BROADCAST_JOB_QUEUED, BROADCAST_JOB_RUNNING):
+        text = (await db.get_text("bc_progress")).format(**counters)
+        keyboard.add(types.InlineKeyboardButton(text=await db.get_text("bc_pause_button"), callback_data=bc_job_cb.new(action="pause", id=job["_id"])))
+    elif job["status"] == BROADCAST_JOB_PAUSED:
+        text = (await db.get_text("bc_job_paused")).format(**counters)
+        keyboard.add(types.InlineKeyboardButton(text=await db.get_text("bc_resume_button"), callback_data=bc_job_cb.new(action="resume", id=job["_id"])))
+    elif job["status"] == BROADCAST_JOB_CANCELLED:
+        return (await db.get_text("bc_job_cancelled")).format(**counters), None
+    else:
+        return (await db.get_text("bc_finished")).format(**counters), None
+    keyboard.insert(types.InlineKeyboardButton(text=await db.get_text("bc_stop_button"), callback_data=bc_job_cb.new(action="cancel", id=job["_id"])))
+    return text, keyboard
+
+
+broadcast_jobs = BroadcastJobManager()
+broadcast_worker = BroadcastWorker()
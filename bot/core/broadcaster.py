@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+from aiogram import Bot
+from aiogram.utils.exceptions import TelegramAPIError, RetryAfter, BotBlocked, UserDeactivated, ChatNotFound
+
+from bot.core.send_governor import send_governor, SEND_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", 16))
+# Seconds between two progress reports
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", 3))
+
+
+async def run_broadcast(bot: Bot, message_to_send: dict, recipient_batches, total: int, progress_callback=None,
+                        workers: int = BROADCAST_WORKERS, stop_event: asyncio.Event = None, initial_stats: dict = None) -> dict:
+    """
+    ينسخ الرسالة (copy_message) لكل المستلمين عبر مجموعة من العمال المتوازيين خلف send_governor.
+    recipient_batches: async iterable of lists of chat ids in ascending order (e.g. db.iter_audience()).
+    progress_callback: optional `async def callback(stats: dict)` called every few seconds.
+    stop_event: once set, nothing new is sent and the call returns with stats["stopped"] = True.
+    stats["cursor"] is the checkpoint: every recipient up to it (in feed order) has been handled.
+    stats["unreachable"] lists recipients that blocked the bot or no longer exist, reported since the last callback.
+    """
+    stats = {"total": total, "success": 0, "failed": 0, "cursor": None}
+    stats.update(initial_stats or {})
+    stats["processed"] = stats["success"] + stats["failed"]
+    stats["stopped"] = False
+    stats["unreachable"] = []
+    stop_event = stop_event or asyncio.Event()
+    queue = asyncio.Queue(maxsize=workers * 4)
+    # [chat_id, handled, flood-control retries] in feed order; the checkpoint advances over the handled prefix only
+    in_flight = deque()
+    # Recipients hit by RetryAfter go back here and are picked up before new ones
+    retries = deque()
+
+    async def produce():
+        try:
+            async for batch in recipient_batches:
+                for chat_id in batch:
+                    if stop_event.is_set(): return
+                    entry = [chat_id, False, 0]
+                    in_flight.append(entry)
+                    await queue.put(entry)
+        finally:
+            # Workers always get their stop signal, even if reading the audience fails
+            for _ in range(workers):
+                await queue.put(None)
+
+    async def consume():
+        feed_finished = False
+        while True:
+            if retries:
+                entry = retries.popleft()
+            elif feed_finished:
+                return
+            else:
+                entry = await queue.get()
+                if entry is None:
+                    feed_finished = True
+                    continue
+            if stop_event.is_set(): continue # لم يُرسل، سيُعاد عند الاستئناف
+            await send_governor.acquire()
+            try:
+                await bot.copy_message(chat_id=entry[0], from_chat_id=message_to_send['chat_id'], message_id=message_to_send['message_id'])
+                send_governor.on_success()
+                stats["success"] += 1
+            except (BotBlocked, UserDeactivated, ChatNotFound):
+                stats["failed"] += 1
+                stats["unreachable"].append(entry[0])
+            except RetryAfter as e:
+                send_governor.on_retry_after(e.timeout)
+                entry[2] += 1
+                if entry[2] <= SEND_MAX_RETRIES:
+                    retries.append(entry)
+                    continue
+                stats["failed"] += 1
+            except TelegramAPIError as e:
+                stats["failed"] += 1
+                logger.debug(f"Broadcast to {entry[0]} failed: {e}")
+            stats["processed"] += 1
+            entry[1] = True
+            while in_flight and in_flight[0][1]:
+                stats["cursor"] = in_flight.popleft()[0]
+
+    async def report_progress():
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL)
+            await _notify(progress_callback, stats)
+
+    reporter = asyncio.create_task(report_progress()) if progress_callback else None
+    started_at = time.monotonic()
+    tasks = [asyncio.create_task(produce())] + [asyncio.create_task(consume()) for _ in range(workers)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # If one task failed (or the broadcast itself was cancelled), the others must not keep sending in the background
+        pending = [task for task in tasks + [reporter] if task and not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    stats["stopped"] = stop_event.is_set()
+    elapsed = time.monotonic() - started_at
+    logger.info(f"📣 Broadcast {'stopped' if stats['stopped'] else 'finished'}: {stats['success']} sent, {stats['failed']} failed in {elapsed:.0f}s.")
+    return stats
+
+
+async def _notify(progress_callback, stats: dict):
+    # Each unreachable recipient is reported once; the rest stay in the returned stats
+    snapshot = dict(stats)
+    stats["unreachable"] = []
+    try:
+        await progress_callback(snapshot)
+    except Exception as e:
+        # Progress reporting must never stop the broadcast
+        logger.warning(f"Broadcast progress callback failed: {e}")
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import os
+import time
+
+from aiogram import Bot
+
+from bot.core.send_governor import send_governor
+
+logger = logging.getLogger(__name__)
+
+# Longest failure report sent to the admin (Telegram messages are limited to 4096 characters)
+FAILURE_REPORT_MAX_LENGTH = 3500
+# How many channels are published to at the same time
+CHANNEL_FANOUT_CONCURRENCY = int(os.getenv("CHANNEL_FANOUT_CONCURRENCY", 10))
+# Telegram allows about 20 messages per minute in one group or channel: keep this many seconds between two posts
+CHANNEL_MIN_INTERVAL = float(os.getenv("CHANNEL_MIN_INTERVAL", 3))
+
+
+class ChatRateLimiter:
+    """يحجز لكل محادثة موعد إرسال لا يسبق الموعد السابق بأقل من min_interval ثانية."""
+
+    def __init__(self, min_interval: float = CHANNEL_MIN_INTERVAL):
+        self.min_interval = min_interval
+        self._next_slot = {}
+
+    async def wait(self, chat_id):
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(chat_id, 0.0))
+        self._next_slot[chat_id] = slot + self.min_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+# Shared by publish_now and the scheduler, so two posts to the same channel are always spaced out
+channel_rate_limiter = ChatRateLimiter()
+
+
+async def fan_out(bot: Bot, message_data: dict, channel_ids: list, concurrency: int = CHANNEL_FANOUT_CONCURRENCY) -> list:
+    """
+    ينسخ الرسالة إلى كل القنوات بالتوازي (بحد أقصى concurrency)، مع احترام حد كل قناة والحد العام للبوت.
+    يعيد نتيجة لكل قناة بنفس الترتيب: {"channel_id", "ok", "error"}.
+    """
+    return (await fan_out_many(bot, [(message_data, channel_ids)], concurrency))[0]
+
+
+async def fan_out_many(bot: Bot, deliveries: list, concurrency: int = CHANNEL_FANOUT_CONCURRENCY) -> list:
+    """
+    fan_out لعدة رسائل دفعة واحدة: deliveries قائمة (message_data, channel_ids) تشترك في خط إرسال واحد وحد توازٍ واحد.
+    كل قناة تستلم رسائلها واحدة تلو الأخرى بترتيب deliveries، والقنوات المختلفة تُخدم بالتوازي.
+    يعيد قائمة نتائج لكل رسالة، بترتيب قنواتها.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    grouped = [[None] * len(channel_ids) for _, channel_ids in deliveries]
+    # channel_id -> [(delivery index, position in its channel list)] in delivery order
+    per_channel = {}
+    for index, (_, channel_ids) in enumerate(deliveries):
+        for position, channel_id in enumerate(channel_ids):
+            per_channel.setdefault(channel_id, []).append((index, position))
+
+    async def publish(channel_id, message_data: dict) -> dict:
+        # The per-channel pause happens outside the semaphore so other channels keep sending meanwhile
+        await channel_rate_limiter.wait(channel_id)
+        async with semaphore:
+            try:
+                await send_governor.deliver(lambda: bot.copy_message(
+                    chat_id=channel_id,
+                    from_chat_id=message_data['chat_id'],
+                    message_id=message_data['message_id']
+                ))
+                return {"channel_id": channel_id, "ok": True, "error": None}
+            except Exception as e:
+                # One broken channel never fails the others
+                logger.error(f"Failed to publish to channel {channel_id}: {e}")
+                return {"channel_id": channel_id, "ok": False, "error": str(e)}
+
+    async def publish_channel(channel_id, slots: list):
+        for index, position in slots:
+            grouped[index][position] = await publish(channel_id, deliveries[index][0])
+
+    await asyncio.gather(*(publish_channel(channel_id, slots) for channel_id, slots in per_channel.items()))
+    return grouped
+
+
+def describe_failures(results: list, titles: dict = None) -> list:
+    """One line per failed channel ("title (id): error"), for the admin's report; cut short to fit in one message."""
+    titles = titles or {}
+    lines, length = [], 0
+    failed = [result for result in results if not result["ok"]]
+    for index, result in enumerate(failed):
+        line = f"▪️ {titles.get(result['channel_id']) or result['channel_id']} ({result['channel_id']}): {result['error']}"
+        if length + len(line) > FAILURE_REPORT_MAX_LENGTH:
+            lines.append(f"… (+{len(failed) - index})")
+            break
+        lines.append(line)
+        length += len(line) + 1
+    return lines
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import struct
+import time
+from array import array
+
+# Idle rings and expired mutes are swept at most this often (seconds)
+SWEEP_INTERVAL = 60
+# Binary layout of a serialised ring: capacity and head (uint16), then `capacity` float64 epochs
+RING_HEADER = struct.Struct("<HH")
+# Largest ring (and so largest effective rate_limit): 8 KB per active user, well inside the uint16 header
+FLOOD_RING_MAX_CAPACITY = 1000
+
+
+class TimestampRing:
+    """
+    حلقة ثابتة الحجم لآخر `capacity` طابع زمني (epoch) بدلاً من قائمة datetime تنمو بلا حد.
+    الطابع الأقدم في الحلقة هو الرسالة رقم capacity إلى الخلف، لذلك فحص النافذة O(1).
+    """
+    __slots__ = ("slots", "head")
+
+    def __init__(self, capacity: int, slots: array = None, head: int = 0):
+        self.slots = slots if slots is not None else array("d", bytes(8 * capacity))
+        self.head = head
+
+    @property
+    def capacity(self) -> int:
+        return len(self.slots)
+
+    @property
+    def newest(self) -> float:
+        return self.slots[self.head - 1]
+
+    def push(self, now: float) -> float:
+        """Stores `now` and returns the oldest stored timestamp (0.0 while the ring is not full yet)."""
+        self.slots[self.head] = now
+        self.head = (self.head + 1) % len(self.slots)
+        return self.slots[self.head]
+
+    def resized(self, capacity: int) -> "TimestampRing":
+        """A ring with another capacity that keeps the most recent timestamps (rate_limit was changed)."""
+        ordered = self.slots[self.head:] + self.slots[:self.head]
+        ordered = ordered[-capacity:] if len(ordered) >= capacity else array("d", bytes(8 * (capacity - len(ordered)))) + ordered
+        return TimestampRing(capacity, ordered)
+
+    def to_bytes(self) -> bytes:
+        return RING_HEADER.pack(len(self.slots), self.head) + self.slots.tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "TimestampRing":
+        capacity, head = RING_HEADER.unpack_from(blob)
+        slots = array("d")
+        slots.frombytes(blob[RING_HEADER.size:RING_HEADER.size + 8 * capacity])
+        return cls(capacity, slots, head)
+
+
+class FloodLimiter:
+    """
+    محدد معدل داخل الذاكرة (نافذة منزلقة) لكل مستخدم، بدون أي استدعاء لقاعدة البيانات.
+    الرسالة رقم rate_limit داخل time_window ثانية هي التي تُعتبر إزعاجاً.
+    """
+
+    def __init__(self):
+        # user_id -> TimestampRing sized to rate_limit
+        self.rings = {}
+        # user_id -> mute_until_epoch
+        self.mutes = {}
+        self._last_sweep = time.time()
+
+    def is_muted(self, user_id: int, now: float) -> bool:
+        mute_until = self.mutes.get(user_id)
+        return mute_until is not None and now < mute_until
+
+    def hit(self, user_id: int, rate_limit: int, time_window: float, now: float) -> bool:
+        """Records one message and returns True when the user is flooding."""
+        if now - self._last_sweep >= SWEEP_INTERVAL:
+            self.sweep(now, time_window)
+        # A larger rate_limit (bad setting) would allocate 8 bytes per message of limit for every user
+        capacity = min(max(rate_limit, 1), FLOOD_RING_MAX_CAPACITY)
+        ring = self.rings.get(user_id)
+        if ring is None:
+            ring = self.rings[user_id] = TimestampRing(capacity)
+        elif ring.capacity != capacity:
+            ring = self.rings[user_id] = ring.resized(capacity)
+        # The oldest of the last `rate_limit` messages (this one included) is inside the window
+        return now - ring.push(now) < time_window
+
+    def mute(self, user_id: int, mute_until: float):
+        self.mutes[user_id] = mute_until
+        # A penalised user starts with an empty window once the mute is over
+        self.rings.pop(user_id, None)
+
+    def forget(self, user_id: int):
+        self.rings.pop(user_id, None)
+        self.mutes.pop(user_id, None)
+
+    def restore_mutes(self, mutes: dict):
+        """Reloads the persisted mutes ({user_id: mute_until_epoch}) after a restart."""
+        self.mutes.update(mutes)
+
+    def sweep(self, now: float, time_window: float):
+        # A ring whose newest timestamp left the window can no longer trigger anything
+        self.rings = {user_id: ring for user_id, ring in self.rings.items() if now - ring.newest < time_window}
+        self.mutes = {user_id: until for user_id, until in self.mutes.items() if until > now}
+        self._last_sweep = now
+
+
+flood_limiter = FloodLimiter()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+from urllib.parse import urlsplit
+
+# The text id of the message sent back when content is rejected
+REJECTION_TEXT_ID = "security_rejection_message"
+# Admin toggle key -> message.content_type values it blocks (GIFs are sent as documents too)
+BLOCKABLE_CONTENT_TYPES = {
+    "photo": ("photo",),
+    "video": ("video",),
+    "sticker": ("sticker",),
+    "document": ("document", "animation"),
+    "audio": ("audio",),
+    "voice": ("voice",),
+}
+LINK_ENTITY_TYPES = frozenset(("url", "text_link"))
+
+
+def _link_host(url: str) -> str:
+    if "://" not in url:
+        url = "http://" + url
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+class MediaPolicy:
+    """
+    سياسة الوسائط الممنوعة بعد "تجميعها": مجموعة ثابتة من أنواع المحتوى الممنوعة تُفحص بعملية بحث واحدة
+    مقابل message.content_type، مع نص الرفض وقائمة النطاقات المسموحة للروابط.
+    يُعاد بناؤها فقط عند تغيير الإعدادات (toggle_media_blocking، قائمة النطاقات، أو نص الرفض).
+    """
+    __slots__ = ("blocked_content_types", "block_links", "allowed_link_domains", "rejection_text")
+
+    def __init__(self):
+        self.blocked_content_types = frozenset()
+        self.block_links = False
+        self.allowed_link_domains = frozenset()
+        self.rejection_text = ""
+
+    def rebuild(self, security_settings: dict, rejection_text: str):
+        blocked_media = security_settings.get("blocked_media", {})
+        self.blocked_content_types = frozenset(
+            content_type
+            for media_type, content_types in BLOCKABLE_CONTENT_TYPES.items() if blocked_media.get(media_type)
+            for content_type in content_types
+        )
+        self.block_links = bool(blocked_media.get("link"))
+        self.allowed_link_domains = frozenset(domain.lower() for domain in security_settings.get("allowed_link_domains", []))
+        self.rejection_text = rejection_text
+
+    def _is_allowed_link(self, url: str) -> bool:
+        host = _link_host(url)
+        return any(host == domain or host.endswith("." + domain) for domain in self.allowed_link_domains)
+
+    def _has_blocked_link(self, message) -> bool:
+        entities = message.entities or message.caption_entities
+        if not entities: return False
+        for entity in entities:
+            if entity.type not in LINK_ENTITY_TYPES: continue
+            if not self.allowed_link_domains: return True
+            url = entity.url if entity.type == "text_link" else entity.get_text(message.text or message.caption)
+            if not self._is_allowed_link(url): return True
+        return False
+
+    def violates(self, message) -> bool:
+        # PERFORMANCE: One frozenset lookup, and the entity scan only runs when links are blocked
+        if message.content_type in self.blocked_content_types: return True
+        return self.block_links and self._has_blocked_link(message)
+
+
+MEDIA_POLICY = MediaPolicy()
@@ -1,82 +1,127 @@
 # -*- coding: utf-8 -*-
 
+import html
 import logging
+import math
+import os
 import datetime
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from aiogram import Bot
 
+from bot.core.admin_notifier import admin_notifier
+from bot.core.channel_fanout import fan_out_many, describe_failures
+
 logger = logging.getLogger(__name__)
 
+# Only posts due within this many seconds are kept in APScheduler; the rest wait in scheduled_posts
+SCHEDULER_LOOKAHEAD = int(os.getenv("SCHEDULER_LOOKAHEAD", 900))
+# Reloading twice per window means a post is always in memory well before it is due
+SCHEDULER_RELOAD_INTERVAL = max(SCHEDULER_LOOKAHEAD // 2, 1)
+# Posts due within the same window of this many seconds are sent together as one dispatch wave
+SCHEDULER_WAVE_WINDOW = max(int(os.getenv("SCHEDULER_WAVE_WINDOW", 60)), 1)
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
 # --- وظيفة التنفيذ: هذا ما سيتم تشغيله عندما يحين الوقت ---
-async def send_scheduled_post(bot: Bot, job_id: str, message_data: dict, target_channels: list):
+async def send_scheduled_wave(bot: Bot, wave_at: datetime.datetime):
     """
-    الدالة التي يتم استدعاؤها بواسطة المؤقت لإرسال المنشور.
+    الدالة التي يتم استدعاؤها بواسطة المؤقت لإرسال دفعة المنشورات المستحقة في (wave_at - النافذة، wave_at].
+    wave_at "واعٍ" بتوقيت UTC، وهو نفسه وقت تشغيل المهمة.
+    محتوى المنشورات يُقرأ من scheduled_posts لحظة التنفيذ، فالمحذوف منها أو المنفذ لا يُرسل.
     """
     from bot.database.manager import db
 
-    logger.info(f"⏰ Executing scheduled job: {job_id}")
-    success_count = 0
-    failed_count = 0
-    
-    channels_to_publish = target_channels
-    if not channels_to_publish:
-        channels_docs = await db.get_all_publishing_channels()
-        channels_to_publish = [doc['channel_id'] for doc in channels_docs]
+    posts = await db.get_due_scheduled_posts(_to_db(wave_at - datetime.timedelta(seconds=SCHEDULER_WAVE_WINDOW)), _to_db(wave_at))
+    if not posts: return
 
-    for channel_id in channels_to_publish:
-        try:
-            await bot.copy_message(
-                chat_id=channel_id,
-                from_chat_id=message_data['chat_id'],
-                message_id=message_data['message_id']
-            )
-            success_count += 1
-        except Exception as e:
-            failed_count += 1
-            logger.error(f"Failed to send scheduled post to channel {channel_id}: {e}")
-    
-    logger.info(f"✅ Job {job_id} finished. Success: {success_count}, Failed: {failed_count}")
-    await db.mark_scheduled_post_as_done(job_id)
+    logger.info(f"⏰ Executing scheduled wave {wave_at:%Y-%m-%d %H:%M:%S} UTC: {len(posts)} posts")
+    # PERFORMANCE: قراءة واحدة للقنوات لكل الدفعة بدل قراءة لكل منشور
+    channels_docs = await db.get_all_publishing_channels()
+    titles = {doc['channel_id']: doc.get('title') for doc in channels_docs}
+    deliveries = [(post['message_data'], post['target_channels'] or list(titles)) for post in posts]
+
+    # PERFORMANCE: كل المنشورات وكل القنوات في خط إرسال واحد، فالقناة البطيئة لا تؤخر البقية
+    results_per_post = await fan_out_many(bot, deliveries)
+    failures = []
+    for post, results in zip(posts, results_per_post):
+        success_count = sum(1 for result in results if result["ok"])
+        failed_count = len(results) - success_count
+        logger.info(f"✅ Job {post['_id']} finished. Success: {success_count}, Failed: {failed_count}")
+        await db.mark_scheduled_post_as_done(post['_id'])
+        failures.extend(result for result in results if not result["ok"])
+    failure_lines = describe_failures(failures, titles)
+    if failure_lines:
+        report = await db.get_text("sch_post_failed_channels") + "\n" + "\n".join(failure_lines)
+        await admin_notifier.notify(bot, html.escape(report))
 
 # --- محرك الجدولة الرئيسي ---
 scheduler = AsyncIOScheduler(timezone="Asia/Riyadh")
 
-async def load_pending_jobs(bot: Bot):
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def _as_utc(stored: datetime.datetime) -> datetime.datetime:
+    # الأوقات المحفوظة في scheduled_posts "غافلة" (naive) لكنها بتوقيت UTC؛ نجعلها "واعية" قبل أي مقارنة أو جدولة،
+    # وإلا اعتبرها المؤقت بتوقيت الرياض
+    return stored.replace(tzinfo=datetime.timezone.utc)
+
+def _to_db(moment: datetime.datetime) -> datetime.datetime:
+    # والعكس عند الاستعلام من قاعدة البيانات
+    return moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+def _wave_time(moment: datetime.datetime, rounding=math.ceil) -> datetime.datetime:
+    # أول حد للنافذة عند moment أو بعده (وقت "واعٍ"): المنشورات لا تُرسل قبل موعدها أبداً، وتتأخر بأقل من النافذة
+    seconds = (moment - _EPOCH).total_seconds()
+    return _EPOCH + datetime.timedelta(seconds=rounding(seconds / SCHEDULER_WAVE_WINDOW) * SCHEDULER_WAVE_WINDOW)
+
+def schedule_post(bot: Bot, run_date: datetime.datetime):
     """
-    يقرأ كل المهام المعلقة من قاعدة البيانات عند بدء التشغيل ويعيد جدولتها.
+    يضيف دفعة الإرسال التي يقع فيها run_date إلى المؤقت إن كان موعدها قريباً؛ المواعيد البعيدة تبقى في قاعدة البيانات
+    ويحمّلها load_upcoming_jobs عندما تدخل نافذة SCHEDULER_LOOKAHEAD. كل المنشورات في النافذة نفسها تشترك في مهمة واحدة.
     """
+    run_at = _as_utc(run_date)
+    if run_at > _utcnow() + datetime.timedelta(seconds=SCHEDULER_LOOKAHEAD): return
+    wave_at = _wave_time(run_at)
+    scheduler.add_job(
+        send_scheduled_wave,
+        "date",
+        run_date=wave_at,
+        id=f"sch_wave_{wave_at:%Y%m%d%H%M%S}",
+        args=[bot, wave_at],
+        replace_existing=True
+    )
+
+async def load_upcoming_jobs(bot: Bot):
+    """Loads the pending posts due within the lookahead window (ids and dates only)."""
     from bot.database.manager import db
-    
-    logger.info(" re-loading pending scheduled jobs from database...")
-    pending_jobs = await db.get_all_pending_scheduled_posts()
-    count = 0
-    for job_data in pending_jobs:
+
+    now = _utcnow()
+    # Posts after the last wave boundary belong to a wave that has not fired yet
+    upcoming = await db.get_upcoming_scheduled_posts(
+        _to_db(_wave_time(now, math.floor)), _to_db(now + datetime.timedelta(seconds=SCHEDULER_LOOKAHEAD))
+    )
+    for job_data in upcoming:
         try:
-            # --- 💡 بداية الإصلاح النهائي لمشكلة المناطق الزمنية 💡 ---
-            # الوقت المحفوظ في قاعدة البيانات يكون "غافلاً" (naive), لكنه مخزن بتوقيت UTC.
-            # الخطوة 1: نجعله "واعياً" (aware) عن طريق إخباره أن منطقته الزمنية هي UTC.
-            run_date_aware = job_data['run_date'].replace(tzinfo=datetime.timezone.utc)
-            
-            # الخطوة 2: نحصل على الوقت الحالي وهو أيضاً "واعٍ" وبتوقيت UTC.
-            now_aware = datetime.datetime.now(datetime.timezone.utc)
-
-            # الخطوة 3: الآن المقارنة آمنة وصحيحة لأن كلا الوقتين يعرفان منطقتهما الزمنية.
-            if run_date_aware > now_aware:
-                scheduler.add_job(
-                    send_scheduled_post,
-                    "date",
-                    run_date=job_data['run_date'], # الجدولة تستخدم الوقت الأصلي
-                    id=job_data['_id'],
-                    args=[bot, job_data['_id'], job_data['message_data'], job_data['target_channels']],
-                    replace_existing=True
-                )
-                count += 1
-            else:
-                # إذا كان الوقت قد مضى، نضع علامة "منفذ" على المهمة لتجنب إرسالها
-                await db.mark_scheduled_post_as_done(job_data['_id'])
-                logger.warning(f"Skipped expired job: {job_data['_id']}")
-            # --- 💡 نهاية الإصلاح النهائي 💡 ---
+            schedule_post(bot, job_data['run_date'])
         except Exception as e:
             logger.error(f"Failed to load job {job_data.get('_id', 'UNKNOWN')}: {e}")
+    if upcoming:
+        logger.info(f"✅ Loaded {len(upcoming)} upcoming scheduled posts.")
+
+async def load_pending_jobs(bot: Bot):
+    """
+    عند بدء التشغيل: يضع علامة "منفذ" على المهام التي فات موعدها أثناء توقف البوت،
+    ثم يحمّل المهام القريبة فقط ويجدول إعادة التحميل الدورية للبقية.
+    """
+    from bot.database.manager import db
 
-    logger.info(f"✅ Reloaded {count} pending jobs.")
+    logger.info(" re-loading pending scheduled jobs from database...")
+    # PERFORMANCE: تحديث واحد في قاعدة البيانات بدل قراءة كل المهام المعلقة ومقارنتها واحدة واحدة
+    expired = await db.expire_overdue_scheduled_posts(_to_db(_wave_time(_utcnow(), math.floor)))
+    if expired:
+        logger.warning(f"Skipped {expired} expired scheduled jobs.")
+    await load_upcoming_jobs(bot)
+    scheduler.add_job(
+        load_upcoming_jobs, "interval", seconds=SCHEDULER_RELOAD_INTERVAL,
+        id="load_upcoming_scheduled_posts", args=[bot], replace_existing=True
+    )
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import os
+import time
+
+from aiogram.utils.exceptions import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows bots about 30 messages per second overall; the governor probes up to this ceiling
+SEND_RATE_MAX = float(os.getenv("SEND_RATE_MAX", 30))
+SEND_RATE_MIN = float(os.getenv("SEND_RATE_MIN", 1))
+# Seconds without flood control before the rate is raised by one message per second
+SEND_RATE_INCREASE_INTERVAL = float(os.getenv("SEND_RATE_INCREASE_INTERVAL", 5))
+# How many times one message is retried after RetryAfter before it counts as failed
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", 5))
+
+
+class SendGovernor:
+    """
+    محدد معدل تكيفي (AIMD) مشترك بين كل عمليات الإرسال الجماعي: النشر للمستخدمين، النشر الفوري والمنشورات المجدولة.
+    عند RetryAfter يتوقف كل الإرسال للمدة التي طلبها تيليجرام ويُنصَّف المعدل، ثم يرتفع تدريجياً مع استمرار النجاح.
+    """
+
+    def __init__(self, max_rate: float = SEND_RATE_MAX, min_rate: float = SEND_RATE_MIN, increase_interval: float = SEND_RATE_INCREASE_INTERVAL):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase_interval = increase_interval
+        self.rate = max_rate
+        self.tokens = 1.0
+        now = time.monotonic()
+        self.updated_at = now
+        self.last_change = now
+        self.blocked_until = 0.0
+
+    async def acquire(self):
+        """Waits for a send slot at the current rate, and for any flood-control pause to end."""
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            # Bursts are capped at one token so the pace stays even across workers
+            self.tokens = min(1.0, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def on_success(self):
+        # Additive increase after a quiet period
+        now = time.monotonic()
+        if self.rate < self.max_rate and now - self.last_change >= self.increase_interval:
+            self.rate = min(self.max_rate, self.rate + 1)
+            self.last_change = now
+
+    def on_retry_after(self, seconds: float):
+        now = time.monotonic()
+        # In-flight sends hit by the same flood wait only count once
+        if now >= self.blocked_until:
+            self.rate = max(self.min_rate, self.rate / 2)
+            logger.warning(f"🚦 Flood control: pausing sends for {seconds}s, rate lowered to {self.rate:.1f} msg/s.")
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0.0
+        self.last_change = now
+
+    async def deliver(self, send, max_retries: int = SEND_MAX_RETRIES):
+        """
+        Runs `send` (a coroutine function such as `lambda: bot.copy_message(...)`) inside the governor.
+        RetryAfter is retried after the pause; after `max_retries` it is raised like any other TelegramAPIError.
+        """
+        for attempt in range(max_retries + 1):
+            await self.acquire()
+            try:
+                result = await send()
+            except RetryAfter as e:
+                self.on_retry_after(e.timeout)
+                if attempt == max_retries: raise
+                continue
+            self.on_success()
+            return result
+
+
+# One governor for the whole process, so every bulk sender shares the bot-wide limit
+send_governor = SendGovernor()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+# Idle locks beyond this many users are evicted, least recently used first
+USER_LOCKS_MAX_SIZE = 10_000
+
+
+class UserLockRegistry:
+    """
+    قفل asyncio مستقل لكل مستخدم لتسلسل عمليات القراءة-التعديل-الكتابة على حالته فقط،
+    دون إيقاف معالجة بقية المستخدمين. الأقفال الخاملة تُحذف بترتيب LRU حتى تبقى الذاكرة محدودة.
+    """
+
+    def __init__(self, max_size: int = USER_LOCKS_MAX_SIZE):
+        self.max_size = max_size
+        # user_id -> [lock, number of tasks holding or waiting for it]
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @asynccontextmanager
+    async def hold(self, user_id: int):
+        """`async with user_locks.hold(user_id):` runs the block exclusively for this user."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            entry = self._entries[user_id] = [asyncio.Lock(), 0]
+        else:
+            self._entries.move_to_end(user_id)
+        # Counted before any eviction, so the entry this task is about to use can never be the victim
+        entry[1] += 1
+        if len(self._entries) > self.max_size:
+            self._evict()
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+
+    def _evict(self):
+        # A lock still held or awaited is never dropped: a new one would let two tasks in at once
+        excess = len(self._entries) - self.max_size
+        victims = []
+        for user_id, entry in self._entries.items():
+            if entry[1] == 0:
+                victims.append(user_id)
+                if len(victims) >= excess: break
+        for user_id in victims:
+            del self._entries[user_id]
+
+
+user_locks = UserLockRegistry()
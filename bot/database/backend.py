@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+
+class StorageBackend(ABC):
+    """
+    الواجهة الموحدة لطبقة التخزين: كل ما يستدعيه البوت عبر `db.` معرّف هنا.
+    فحص السلامة في main.py يتحقق من هذا الملف، وكل واجهة خلفية (MongoDB أو الذاكرة) يجب أن تنفذ جميع الدوال.
+    """
+
+    # --- Lifecycle ---
+    @abstractmethod
+    def is_connected(self) -> bool: ...
+
+    @abstractmethod
+    async def connect_to_database(self, uri: str) -> bool: ...
+
+    @abstractmethod
+    async def initialize_defaults(self): ...
+
+    @abstractmethod
+    async def load_all_caches(self): ...
+
+    @abstractmethod
+    async def ping_database(self) -> bool: ...
+
+    # --- Texts ---
+    @abstractmethod
+    async def get_text(self, text_id: str) -> str: ...
+
+    @abstractmethod
+    async def update_text(self, text_id: str, new_text: str): ...
+
+    @abstractmethod
+    async def get_all_editable_texts(self) -> list: ...
+
+    # --- Users and audience ---
+    @abstractmethod
+    async def add_user(self, user) -> bool: ...
+
+    @abstractmethod
+    async def record_user_activity(self, user_id: int): ...
+
+    @abstractmethod
+    async def flush_user_profiles(self): ...
+
+    @abstractmethod
+    async def tag_users(self, user_ids: list, tag: str) -> int: ...
+
+    @abstractmethod
+    async def untag_users(self, user_ids: list, tag: str) -> int: ...
+
+    @abstractmethod
+    def iter_audience(self, batch_size: int = 500, after_user_id: int = None, segment: dict = None):
+        """
+        Async generator yielding lists of reachable, non-banned user ids in ascending order, starting after `after_user_id`.
+        `segment` may hold joined_after / active_after (datetimes), has_username (bool) and tag (str).
+        """
+
+    @abstractmethod
+    async def get_audience_count(self, segment: dict = None) -> int: ...
+
+    @abstractmethod
+    async def get_join_tracking_start(self): ...
+
+    @abstractmethod
+    async def mark_users_unreachable(self, user_ids: list): ...
+
+    # --- Settings ---
+    @abstractmethod
+    async def get_antiflood_settings(self) -> dict: ...
+
+    @abstractmethod
+    async def update_antiflood_setting(self, key: str, value): ...
+
+    @abstractmethod
+    async def get_security_settings(self) -> dict: ...
+
+    @abstractmethod
+    async def toggle_bot_status(self): ...
+
+    @abstractmethod
+    async def toggle_media_blocking(self, media_type: str): ...
+
+    @abstractmethod
+    async def set_allowed_link_domains(self, domains: list): ...
+
+    @abstractmethod
+    async def get_timezone(self) -> dict: ...
+
+    @abstractmethod
+    async def set_timezone(self, identifier: str, display_name: str): ...
+
+    # --- Force subscribe ---
+    @abstractmethod
+    async def get_subscription_channels(self) -> list[str]: ...
+
+    @abstractmethod
+    async def get_force_subscribe_status(self) -> bool: ...
+
+    @abstractmethod
+    async def toggle_force_subscribe_status(self): ...
+
+    @abstractmethod
+    async def add_subscription_channel(self, channel_id: int, channel_title: str, username: str): ...
+
+    @abstractmethod
+    async def delete_subscription_channel(self, db_id: str) -> bool: ...
+
+    @abstractmethod
+    async def get_all_subscription_channels_docs(self) -> list: ...
+
+    # --- Bans and anti-flood ---
+    @abstractmethod
+    async def ban_user(self, user_id: int) -> bool: ...
+
+    @abstractmethod
+    async def unban_user(self, user_id: int) -> bool: ...
+
+    @abstractmethod
+    async def is_user_banned(self, user_id: int) -> bool: ...
+
+    @abstractmethod
+    async def refresh_ban_index(self):
+        """Reloads the in-memory ban index, for processes (e.g. the broadcast worker) that do not see ban_user calls."""
+
+    @abstractmethod
+    async def get_banned_users(self, cursor: str = None, backwards: bool = False, limit: int = 10) -> dict: ...
+
+    @abstractmethod
+    async def record_antiflood_violation(self, user_id: int, reset_after_hours: int = 1) -> int: ...
+
+    @abstractmethod
+    async def mute_user(self, user_id: int, mute_until: datetime): ...
+
+    @abstractmethod
+    async def get_active_mutes(self) -> dict: ...
+
+    # --- Scheduled posts ---
+    @abstractmethod
+    async def add_scheduled_post(self, job_id: str, message_data: dict, target_channels: list, run_date: datetime): ...
+
+    @abstractmethod
+    async def get_scheduled_posts(self, cursor: str = None, backwards: bool = False, limit: int = 10) -> dict: ...
+
+    @abstractmethod
+    async def delete_scheduled_post(self, job_id: str) -> bool: ...
+
+    @abstractmethod
+    async def get_scheduled_post(self, job_id: str): ...
+
+    @abstractmethod
+    async def get_upcoming_scheduled_posts(self, after: datetime, until: datetime) -> list: ...
+
+    @abstractmethod
+    async def get_due_scheduled_posts(self, after: datetime, until: datetime) -> list: ...
+
+    @abstractmethod
+    async def expire_overdue_scheduled_posts(self, before: datetime) -> int: ...
+
+    @abstractmethod
+    async def mark_scheduled_post_as_done(self, job_id: str): ...
+
+    # --- Broadcast jobs ---
+    @abstractmethod
+    async def create_broadcast_job(self, job_id: str, message_to_send: dict, total: int, progress_chat_id: int, progress_message_id: int, segment: dict = None): ...
+
+    @abstractmethod
+    async def get_broadcast_job(self, job_id: str): ...
+
+    @abstractmethod
+    async def get_unfinished_broadcast_jobs(self) -> list: ...
+
+    @abstractmethod
+    async def claim_next_broadcast_job(self, worker_id: str, lease_seconds: int): ...
+
+    @abstractmethod
+    async def save_broadcast_progress(self, job_id: str, worker_id: str, cursor: int, success: int, failed: int):
+        """Checkpoints a job owned by `worker_id` and returns its status, or None once another worker took it over."""
+
+    @abstractmethod
+    async def release_broadcast_job(self, job_id: str, worker_id: str): ...
+
+    @abstractmethod
+    async def set_broadcast_job_status(self, job_id: str, status: str, expected: tuple = None, worker_id: str = None) -> bool:
+        """Moves the job to `status` only if its current status is in `expected` (and it is owned by `worker_id`); returns whether it did."""
+
+    # --- Publishing channels and the auto publication message ---
+    @abstractmethod
+    async def get_publishing_channels(self, cursor: str = None, backwards: bool = False, limit: int = 10) -> dict: ...
+
+    @abstractmethod
+    async def get_all_publishing_channels(self) -> list: ...
+
+    @abstractmethod
+    async def add_publishing_channel(self, channel_id: int, channel_title: str): ...
+
+    @abstractmethod
+    async def delete_publishing_channel(self, db_id: str) -> bool: ...
+
+    @abstractmethod
+    async def get_auto_publication_message(self): ...
+
+    @abstractmethod
+    async def set_auto_publication_message(self, message_data: dict): ...
+
+    @abstractmethod
+    async def delete_auto_publication_message(self) -> bool: ...
+
+    # --- Message links (admin replies) ---
+    @abstractmethod
+    async def log_message_link(self, admin_message_id: int, user_id: int, user_message_id: int): ...
+
+    @abstractmethod
+    async def get_message_link_info(self, admin_message_id: int): ...
+
+    # --- Auto replies ---
+    @abstractmethod
+    async def find_auto_reply_by_keyword(self, keyword: str): ...
+
+    @abstractmethod
+    async def add_auto_reply(self, keyword: str, message: dict): ...
+
+    @abstractmethod
+    async def get_auto_replies(self, cursor: str = None, backwards: bool = False, limit: int = 10) -> dict: ...
+
+    @abstractmethod
+    async def delete_auto_reply(self, reply_id: str) -> bool: ...
+
+    # --- Reminders ---
+    @abstractmethod
+    async def add_reminder(self, text: str): ...
+
+    @abstractmethod
+    async def get_reminders(self, cursor: str = None, backwards: bool = False, limit: int = 10) -> dict: ...
+
+    @abstractmethod
+    async def delete_reminder(self, reminder_id: str) -> bool: ...
+
+    @abstractmethod
+    async def get_random_reminder(self) -> str: ...
+
+    # --- Library ---
+    @abstractmethod
+    async def add_to_library(self, message: dict): ...
+
+    @abstractmethod
+    async def get_library_items(self, cursor: str = None, backwards: bool = False, limit: int = 5) -> dict: ...
+
+    @abstractmethod
+    async def delete_library_item(self, item_id: str) -> bool: ...
+
+    # --- Statistics and monitoring ---
+    @abstractmethod
+    async def get_estimated_count(self, collection_name: str) -> int: ...
+
+    @abstractmethod
+    async def reconcile_statistics(self): ...
+
+    @abstractmethod
+    async def get_bot_statistics(self) -> dict: ...
+
+    @abstractmethod
+    async def get_db_stats(self) -> dict: ...
+
+    @abstractmethod
+    async def get_collections_storage_stats(self) -> list: ...
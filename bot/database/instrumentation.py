@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import functools
+import inspect
+import logging
+import math
+import time
+from collections import deque
+
+from bot.database.backend import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+# Latest samples kept per method for the percentiles (older ones are dropped)
+LATENCY_SAMPLE_SIZE = 1024
+
+
+class MethodStats:
+    __slots__ = ("calls", "errors", "total_ms", "max_ms", "samples")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.samples = deque(maxlen=LATENCY_SAMPLE_SIZE)
+
+    def record(self, elapsed_ms: float, failed: bool):
+        self.calls += 1
+        self.errors += failed
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.samples.append(elapsed_ms)
+
+
+def _percentile(sorted_samples: list, percent: float) -> float:
+    # Nearest-rank percentile
+    if not sorted_samples: return 0.0
+    rank = max(math.ceil(percent / 100 * len(sorted_samples)), 1)
+    return sorted_samples[rank - 1]
+
+
+class LatencyRecorder:
+    """يجمع عدد الاستدعاءات والأخطاء وتوزيع زمن الاستجابة لكل دالة في واجهة التخزين."""
+
+    def __init__(self):
+        self.enabled = False
+        self.started_at = time.time()
+        self.methods = {}
+
+    def record(self, method_name: str, elapsed_ms: float, failed: bool):
+        stats = self.methods.get(method_name)
+        if stats is None:
+            stats = self.methods[method_name] = MethodStats()
+        stats.record(elapsed_ms, failed)
+
+    def reset(self):
+        self.methods = {}
+        self.started_at = time.time()
+
+    def snapshot(self) -> dict:
+        """Machine-readable view, slowest methods (by total time) first."""
+        methods = []
+        for name, stats in self.methods.items():
+            samples = sorted(stats.samples)
+            methods.append({
+                "method": name,
+                "calls": stats.calls,
+                "errors": stats.errors,
+                "total_ms": round(stats.total_ms, 3),
+                "max_ms": round(stats.max_ms, 3),
+                "p50_ms": round(_percentile(samples, 50), 3),
+                "p95_ms": round(_percentile(samples, 95), 3),
+                "p99_ms": round(_percentile(samples, 99), 3),
+            })
+        methods.sort(key=lambda item: item["total_ms"], reverse=True)
+        return {"enabled": self.enabled, "since": self.started_at, "methods": methods}
+
+
+DB_METRICS = LatencyRecorder()
+
+
+def _timed(method_name: str, method):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        started_at = time.perf_counter()
+        failed = False
+        try:
+            return await method(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            DB_METRICS.record(method_name, (time.perf_counter() - started_at) * 1000, failed)
+    return wrapper
+
+
+def instrument_storage(backend: StorageBackend) -> StorageBackend:
+    """
+    يغلف كل دالة غير متزامنة في واجهة StorageBackend لقياس زمنها.
+    التغليف على مستوى الكائن فقط، لذلك لا يكلف شيئاً إذا لم يُفعّل.
+    """
+    for name, interface_method in inspect.getmembers(StorageBackend, inspect.isfunction):
+        if name.startswith("_") or not inspect.iscoroutinefunction(interface_method): continue
+        setattr(backend, name, _timed(name, getattr(backend, name)))
+    DB_METRICS.enabled = True
+    logger.info("⏱️ Storage latency instrumentation is enabled.")
+    return backend
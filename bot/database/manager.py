@@ -3,13 +3,20 @@
 import logging
 import asyncio
 import os
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo.errors import ConnectionFailure, OperationFailure
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import ConnectionFailure, OperationFailure, DuplicateKeyError
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
 
+from config import STORAGE_BACKEND
 from bot.core.cache import TEXTS_CACHE
+from bot.core.media_policy import MEDIA_POLICY, REJECTION_TEXT_ID
+from bot.database.backend import StorageBackend
+from bot.database.instrumentation import instrument_storage
 
 logger = logging.getLogger(__name__)
 
@@ -27,18 +34,97 @@ COLLECTION_BANNED_USERS = "banned_users"
 COLLECTION_LIBRARY = "library"
 COLLECTION_SCHEDULED_POSTS = "scheduled_posts"
 COLLECTION_ANTIFLOOD_VIOLATIONS = "antiflood_violations"
+COLLECTION_BROADCAST_JOBS = "broadcast_jobs"
+# Broadcast job statuses (queued, running and paused jobs are unfinished and survive restarts)
+BROADCAST_JOB_QUEUED = "queued"
+BROADCAST_JOB_RUNNING = "running"
+BROADCAST_JOB_PAUSED = "paused"
+BROADCAST_JOB_CANCELLED = "cancelled"
+BROADCAST_JOB_DONE = "done"
 # Settings Keys
 SETTING_SECURITY = "security_settings"
 SETTING_FORCE_SUBSCRIBE = "force_subscribe"
 SETTING_ANTIFLOOD = "antiflood_settings"
 SETTING_TIMEZONE = "timezone"
 SETTING_AUTO_PUBLICATION_MESSAGE = "auto_publication_message"
+# Write-behind buffer for user profiles (seconds between flushes)
+USER_PROFILE_FLUSH_INTERVAL = int(os.getenv("USER_PROFILE_FLUSH_INTERVAL", 30))
+# last_active_at is written at most once per user per this many seconds (it only feeds audience segments)
+USER_ACTIVITY_RESOLUTION = int(os.getenv("USER_ACTIVITY_RESOLUTION", 3600))
+# Profile fingerprints kept in memory (least recently seen dropped first); a dropped user's next /start just writes through
+USER_FINGERPRINT_CACHE_SIZE = int(os.getenv("USER_FINGERPRINT_CACHE_SIZE", 100_000))
+# joined_at given to users stored before join dates were tracked: they sort as the oldest users for "joined after"
+JOIN_DATE_UNKNOWN = datetime(1970, 1, 1)
+# Statistics counters are reconciled against collection metadata at this interval (seconds)
+STATS_RECONCILE_INTERVAL = int(os.getenv("STATS_RECONCILE_INTERVAL", 600))
+# Data retention enforced by TTL indexes (0 keeps the data forever)
+MESSAGE_LINKS_RETENTION_DAYS = int(os.getenv("MESSAGE_LINKS_RETENTION_DAYS", 30))
+ANTIFLOOD_VIOLATIONS_RETENTION_HOURS = int(os.getenv("ANTIFLOOD_VIOLATIONS_RETENTION_HOURS", 24))
+SCHEDULED_POSTS_RETENTION_DAYS = int(os.getenv("SCHEDULED_POSTS_RETENTION_DAYS", 7))
+BROADCAST_JOBS_RETENTION_DAYS = int(os.getenv("BROADCAST_JOBS_RETENTION_DAYS", 30))
+# collection -> (date field the TTL index expires on, retention in seconds)
+RETENTION_POLICIES = {
+    COLLECTION_MESSAGE_LINKS: ("created_at", MESSAGE_LINKS_RETENTION_DAYS * 86400),
+    COLLECTION_ANTIFLOOD_VIOLATIONS: ("last_violation", ANTIFLOOD_VIOLATIONS_RETENTION_HOURS * 3600),
+    COLLECTION_SCHEDULED_POSTS: ("done_at", SCHEDULED_POSTS_RETENTION_DAYS * 86400),
+    COLLECTION_BROADCAST_JOBS: ("finished_at", BROADCAST_JOBS_RETENTION_DAYS * 86400),
+}
+# Keyset pagination: the date format used to carry scheduled-post cursors inside CallbackData (no ':' allowed)
+CURSOR_DATE_FORMAT = "%Y%m%d%H%M%S"
+CURSOR_PART_SEPARATOR = "|"
+# Opt-in per-method latency instrumentation of the storage backend
+DB_METRICS_ENABLED = os.getenv("DB_METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
 
-class DatabaseManager:
+# --- Default UI texts and settings, seeded by every storage backend on startup ---
+DEFAULT_TEXTS = {
+    "admin_panel_title": "أهلاً بك في لوحة التحكم.", "welcome_message": "أهلاً بك يا #name_user!", "date_button": "📅 التاريخ", "time_button": "⏰ الساعة الآن", "reminder_button": "📿 أذكار اليوم",
+    "user_message_received": "✅ تم استلام رسالتك بنجاح، سيتم الرد عليك قريباً.",
+    "ar_back_button": "⬅️ عودة", "ar_page_info": "صفحة {current_page}/{total_pages}", "ar_next_button": "التالي ⬅️", "ar_prev_button": "➡️ السابق", "ar_delete_button": "🗑️ حذف",
+    "ar_menu_title": "⚙️ *إدارة الردود التلقائية*", "ar_add_button": "➕ إضافة رد", "ar_view_button": "📖 عرض الردود", "ar_import_button": "📥 استيراد", "ar_ask_for_keyword": "📝 أرسل *الكلمة المفتاحية*", "ar_ask_for_content": "📝 أرسل *محتوى الرد*", "ar_added_success": "✅ تم الحفظ!", "ar_add_another_button": "➕ إضافة المزيد", "ar_ask_for_file": "📦 أرسل ملف `.txt`.", "ar_import_success": "✅ اكتمل.", "ar_no_replies": "لا توجد ردود.", "ar_deleted_success": "🗑️ تم الحذف.",
+    "rem_menu_title": "⏰ *إدارة التذكيرات*", "rem_add_button": "➕ إضافة", "rem_view_button": "📖 عرض", "rem_import_button": "📥 استيراد", "rem_ask_for_content": "📝 أرسل *نص التذكير*.", "rem_added_success": "✅ تم الحفظ!", "rem_add_another_button": "➕ إضافة المزيد", "rem_ask_for_file": "📦 أرسل ملف `.txt`.", "rem_import_success": "✅ اكتمل.", "rem_no_reminders": "لا توجد تذكيرات.", "rem_deleted_success": "🗑️ تم الحذف.", "rem_delete_button": "🗑️ حذف",
+    "cp_menu_title": "📰 *إدارة منشورات القناة*", "cp_set_auto_msg_button": "✍️ تعيين الرسالة", "cp_view_auto_msg_button": "👀 عرض الرسالة", "cp_publish_now_button": "🚀 نشر الآن", "cp_schedule_button": "🗓️ جدولة منشور", "cp_view_scheduled_button": "👀 عرض المجدولة", "cp_ask_for_auto_msg": "📝 أرسل الرسالة.", "cp_auto_msg_set_success": "✅ تم الحفظ.", "cp_no_auto_msg": "لم يتم تعيين رسالة.", "cp_auto_msg_deleted_success": "🗑️ تم الحذف.", "cp_publish_started": "🚀 جاري النشر...", "cp_publish_finished": "🏁 اكتمل النشر!", "cp_error_no_auto_msg_to_publish": "⚠️ لا توجد رسالة!", "cp_error_no_channels_to_publish": "⚠️ لا توجد قنوات!", "cp_publish_failed_channels": "⚠️ فشل النشر في هذه القنوات:",
+    "cm_menu_title": "📡 *إدارة القنوات*", "cm_add_button": "➕ إضافة قناة", "cm_view_button": "📖 عرض القنوات", "cm_ask_for_channel_id": "📡 أرسل معرّف القناة.", "cm_add_success": "✅ تم الإضافة!", "cm_add_fail_not_admin": "❌ فشل.", "cm_add_fail_invalid_id": "❌ فشل.", "cm_add_fail_already_exists": "⚠️ مضافة بالفعل.", "cm_no_channels": "لا توجد قنوات.", "cm_deleted_success": "🗑️ تم الحذف.", "cm_test_button": "🔬 تجربة", "cm_test_success": "✅ نجح.", "cm_test_fail": "❌ فشل.",
+    "bm_menu_title": "🚫 *إدارة الحظر*", "bm_ban_button": "🚫 حظر", "bm_unban_button": "✅ إلغاء حظر", "bm_view_button": "📖 عرض", "bm_ask_for_user_id": "🆔 أرسل ID.", "bm_ask_for_unban_user_id": "🆔 أرسل ID.", "bm_user_banned_success": "🚫 تم الحظر.", "bm_user_already_banned": "⚠️ محظور بالفعل.", "bm_user_unbanned_success": "✅ تم إلغاء الحظر.", "bm_user_not_banned": "⚠️ ليس محظوراً.", "bm_invalid_user_id": "❌ ID غير صالح.", "bm_no_banned_users": "لا يوجد محظورين.",
+    "sec_menu_title": "🛡️ *الحماية والأمان*", "sec_bot_status_button": "🤖 حالة البوت", "sec_media_filtering_button": "🖼️ منع الوسائط", "sec_antiflood_button": "⏱️ منع التكرار", "sec_rejection_message_button": "✍️ تعديل رسالة الرفض", "sec_bot_active": "🟢 يعمل", "sec_bot_inactive": "🔴 متوقف", "security_rejection_message": "عذراً, هذا غير مسموح.",
+    "sec_link_allowlist_button": "🌐 النطاقات المسموحة للروابط", "sec_ask_for_link_allowlist": "🌐 أرسل النطاقات المسموحة حتى عند منع الروابط، كل نطاق في سطر (مثال: `youtube.com`).\nأرسل `-` لمسح القائمة.", "sec_link_allowlist_updated": "✅ تم تحديث النطاقات المسموحة.",
+    "sch_ask_for_message": "📝 أرسل المنشور للجدولة.", "sch_ask_for_channels": "📡 اختر القنوات.", "sch_all_channels_button": "📢 كل القنوات", "sch_ask_for_datetime": "⏰ أرسل تاريخ ووقت النشر `YYYY-MM-DD HH:MM` ({timezone}).", "sch_invalid_datetime": "❌ صيغة التاريخ خاطئة.", "sch_datetime_in_past": "❌ لا يمكن الجدولة في الماضي.", "sch_add_success": "✅ تم جدولة المنشور.", "sch_no_jobs": "لا توجد منشورات مجدولة.", "sch_deleted_success": "🗑️ تم الحذف.", "sch_post_failed_channels": "⚠️ منشور مجدول: فشل النشر في هذه القنوات:",
+    "af_menu_title": "⏱️ *إعدادات منع التكرار*","af_status_button": "🚦 حالة البروتوكول", "af_enabled": "🟢 مفعل", "af_disabled": "🔴 معطل", "af_edit_threshold_button": "⚡️ تعديل عتبة الإزعاج", "af_edit_mute_duration_button": "⏳ تعديل مدة التقييد", "af_ask_for_new_value": "✍️ أرسل القيمة الجديدة.", "af_updated_success": "✅ تم تحديث الإعداد.", "af_value_out_of_range": "❌ القيمة يجب أن تكون بين {min} و {max}.", "af_mute_notification": "🔇 *تم تقييدك مؤقتاً.*\nبسبب إرسال رسائل سريعة, تم منعك من الإرسال لمدة {duration} دقيقة.", "af_ban_notification": "🚫 *لقد تم حظرك نهائياً.*\nبسبب تكرار السلوك المزعج, تم منعك من استخدام البوت.",
+    "stats_title": "📊 *إحصائيات البوت*", "stats_total_users": "👤 المستخدمون", "stats_banned_users": "🚫 المحظورون", "stats_auto_replies": "📝 الردود", "stats_reminders": "⏰ التذكيرات", "stats_refresh_button": "🔄 تحديث",
+    "mm_menu_title": "🛠️ *وضع الصيانة*", "mm_ask_for_user_id": "🆔 أرسل ID المستخدم للبحث عن حالته.", "mm_clear_user_state_button": "🔄 مسح حالة المستخدم", "mm_state_cleared_success": "✅ تم مسح حالة المستخدم بنجاح.", "mm_state_not_found": "⚠️ لم يتم العثور على حالة نشطة لهذا المستخدم.",
+    "bc_ask_for_message": "📝 أرسل الرسالة التي تريد نشرها لكل المستخدمين.", "bc_confirmation": "⚠️ سيتم إرسال الرسالة إلى {count} مستخدم. هل أنت متأكد؟", "bc_confirm_button": "✅ تأكيد", "bc_cancel_button": "❌ إلغاء", "bc_started": "🚀 بدأ النشر...", "bc_progress": "⏳ جاري النشر...\n✅ نجح: {success}\n❌ فشل: {failed}\n⏱️ المتبقي: {remaining} من {total}", "bc_finished": "🏁 اكتمل النشر!\n✅ نجح: {success}\n❌ فشل: {failed}",
+    "bc_jobs_button": "📋 مهام النشر", "bc_jobs_title": "📋 *مهام النشر غير المكتملة*", "bc_no_jobs": "لا توجد مهام نشر غير مكتملة.", "bc_pause_button": "⏸️ إيقاف مؤقت", "bc_resume_button": "▶️ استئناف", "bc_stop_button": "⏹️ إلغاء النشر", "bc_job_paused": "⏸️ النشر متوقف مؤقتاً.\n✅ نجح: {success}\n❌ فشل: {failed}\n⏱️ المتبقي: {remaining} من {total}", "bc_job_cancelled": "⏹️ تم إلغاء النشر.\n✅ نجح: {success}\n❌ فشل: {failed}", "bc_job_not_found": "⚠️ المهمة غير موجودة أو انتهت.", "bc_job_state_changed": "⚠️ تغيرت حالة المهمة، هذه حالتها الآن.",
+    "bc_segment_all": "🎯 الجمهور: كل المستخدمين", "bc_segment_title": "🎯 الجمهور:", "bc_seg_joined_button": "📅 انضموا بعد تاريخ", "bc_seg_active_button": "🟢 نشطون مؤخراً", "bc_seg_username_button": "👤 لديهم معرف", "bc_seg_tag_button": "🏷️ حسب الوسم", "bc_seg_clear_button": "♻️ كل المستخدمين", "bc_seg_ask_joined": "📅 أرسل التاريخ بصيغة `YYYY-MM-DD`.", "bc_seg_joined_since_note": "ℹ️ تواريخ الانضمام مسجلة منذ {date}؛ من انضموا قبل ذلك يُعدّون أقدم من أي تاريخ.", "bc_seg_ask_active": "🟢 أرسل عدد الأيام (مثال: `30`).", "bc_seg_ask_tag": "🏷️ أرسل اسم الوسم.", "bc_seg_invalid": "❌ قيمة غير صالحة، حاول مرة أخرى.", "bc_seg_joined_after": "انضموا بعد {date}", "bc_seg_active_within": "نشطون خلال {days} يوم", "bc_seg_has_username": "لديهم معرف", "bc_seg_tagged": "الوسم: {tag}",
+    "bc_tag_users_button": "🏷️ وسم المستخدمين", "bc_ask_for_tagging": "🏷️ أرسل الوسم ثم معرفات المستخدمين.\nمثال: `vip 123 456`\nلإزالة الوسم: `-vip 123`", "bc_tagging_done": "✅ تم تحديث الوسم {tag} لـ {count} مستخدم.", "bc_tagging_invalid": "❌ صيغة غير صالحة.",
+    "lib_view_button": "📚 عرض المكتبة", "lib_no_items": "📭 لا توجد عناصر في المكتبة.",
+    "sm_title": "🖥️ *مراقبة النظام*", "sm_status_ok": "🟢 كل الأنظمة تعمل.", "sm_status_degraded": "🟠 هناك مشاكل في بعض الأنظمة.", "sm_health_checks": "المؤشرات الحيوية", "sm_bot_status": "حالة البوت", "sm_status_operational": "يعمل", "sm_db_status": "قاعدة البيانات", "sm_status_connected": "متصل", "sm_status_unreachable": "غير متصل", "sm_performance": "الأداء", "sm_uptime": "مدة التشغيل", "sm_tg_latency": "استجابة تيليجرام", "sm_deploy_info": "معلومات النشر", "sm_last_update": "آخر تحديث", "sm_server_health": "🩺 صحة الخادم", "sm_cpu_usage": "المعالج", "sm_ram_usage": "الذاكرة",
+    "sm_db_stats_title": "🗃️ مساحة قاعدة البيانات", "sm_db_data_size": "البيانات المستخدمة", "sm_db_remaining": "المساحة المتبقية",
+    "sm_storage_button": "🗄️ المساحة والاحتفاظ", "sm_storage_title": "🗄️ *مساحة المجموعات ومدة الاحتفاظ*", "sm_retention_forever": "دائم", "sm_retention_after": "تُحذف بعد {duration}",
+    "sm_latency_button": "⏱️ زمن استعلامات التخزين", "sm_latency_title": "⏱️ *زمن استعلامات التخزين (ms)*", "sm_latency_disabled": "القياس غير مفعل. اضبط `DB_METRICS_ENABLED=true` ثم أعد التشغيل.", "sm_latency_empty": "لا توجد استدعاءات مسجلة بعد.", "sm_latency_reset_button": "♻️ تصفير",
+}
+
+DEFAULT_SETTINGS = {
+    SETTING_SECURITY: {"bot_status": "active", "blocked_media": {}},
+    SETTING_FORCE_SUBSCRIBE: {"enabled": True},
+    SETTING_ANTIFLOOD: {"enabled": True, "rate_limit": 7, "time_window": 2, "mute_duration": 30},
+    SETTING_TIMEZONE: {"identifier": "Asia/Riyadh", "display_name": "بتوقيت الرياض"},
+}
+
+class DatabaseManager(StorageBackend):
     def __init__(self):
         self.client = None
         self.db = None
         self.settings_cache = {}
+        # PERFORMANCE: In-memory ban index, checked on every update instead of a DB lookup
+        self.banned_user_ids = set()
+        # Bumped by every local ban/unban, so a reload that raced with one is not applied
+        self._ban_index_version = 0
+        # PERFORMANCE: Write-behind buffer for /start profile updates
+        self._user_fingerprints = OrderedDict()
+        self._pending_user_profiles = {}
+        self._activity_recorded_at = {}
+        self._pending_activity = {}
+        # PERFORMANCE: Incrementally maintained counters for the statistics screen
+        self.stats_counters = {"total_users": 0, "auto_replies": 0, "reminders": 0}
 
     def is_connected(self) -> bool:
         return self.client is not None and self.db is not None
@@ -65,10 +151,19 @@ class DatabaseManager:
             self.library_collection = self.db[COLLECTION_LIBRARY]
             self.scheduled_posts_collection = self.db[COLLECTION_SCHEDULED_POSTS]
             self.antiflood_violations_collection = self.db[COLLECTION_ANTIFLOOD_VIOLATIONS]
+            self.broadcast_jobs_collection = self.db[COLLECTION_BROADCAST_JOBS]
             
             # PERFORMANCE: Create indexes on frequently queried fields to speed up searches
             await self.auto_replies_collection.create_index("keyword_lower", unique=True)
-            await self.antiflood_violations_collection.create_index("user_id")
+            await self._ensure_antiflood_unique_index()
+            await self.scheduled_posts_collection.create_index([("status", 1), ("run_date", 1), ("_id", 1)])
+            await self.broadcast_jobs_collection.create_index([("status", 1), ("created_at", 1)])
+            # Audience segments: each filter field leads its own index, and _id follows so the ids stream in checkpoint order
+            for segment_field in ("tags", "last_active_at", "joined_at", "username"):
+                await self.users_collection.create_index([(segment_field, 1), ("_id", 1)])
+            await self._ensure_retention_indexes()
+            await self._sync_ban_flags()
+            await self.users_collection.update_many({"joined_at": {"$exists": False}}, {"$set": {"joined_at": JOIN_DATE_UNKNOWN}})
 
             await self.initialize_defaults()
             await self.load_all_caches()
@@ -79,33 +174,82 @@ class DatabaseManager:
             logger.error(f"❌ فشل الاتصال بقاعدة البيانات: {e}")
             return False
 
+    async def _ensure_antiflood_unique_index(self):
+        """
+        فهرس فريد على user_id حتى لا تنشئ مخالفتان متزامنتان لنفس المستخدم مستندين (upsert).
+        القواعد القديمة فيها فهرس غير فريد وربما مستندات مكررة: ندمجها أولاً ثم نستبدل الفهرس.
+        """
+        collection = self.antiflood_violations_collection
+        if (await collection.index_information()).get("user_id_1", {}).get("unique"): return
+        duplicates = collection.aggregate([
+            {"$group": {
+                "_id": "$user_id", "ids": {"$push": "$_id"}, "copies": {"$sum": 1},
+                "count": {"$max": "$count"}, "last_violation": {"$max": "$last_violation"}, "mute_until": {"$max": "$mute_until"}
+            }},
+            {"$match": {"copies": {"$gt": 1}}}
+        ])
+        async for group in duplicates:
+            keep_id, *extra_ids = group["ids"]
+            merged = {field: group[field] for field in ("count", "last_violation", "mute_until") if group.get(field) is not None}
+            await collection.update_one({"_id": keep_id}, {"$set": merged})
+            await collection.delete_many({"_id": {"$in": extra_ids}})
+        try:
+            await collection.drop_index("user_id_1")
+        except OperationFailure:
+            pass # الفهرس غير موجود أصلاً
+        await collection.create_index("user_id", unique=True)
+
+    async def _sync_ban_flags(self):
+        """
+        يعكس قائمة المحظورين على مستندات المستخدمين (الحقل banned) حتى يستبعدهم استعلام الجمهور دون قائمة $nin.
+        ban_user/unban_user يحافظان عليه بعد ذلك؛ هذه المزامنة تصلح القواعد القديمة وأي انحراف.
+        """
+        banned_user_ids = [doc['_id'] async for doc in self.banned_users_collection.find({}, {"_id": 1})]
+        for start in range(0, len(banned_user_ids), 1000):
+            chunk = banned_user_ids[start:start + 1000]
+            await self.users_collection.update_many({"_id": {"$in": chunk}, "banned": {"$ne": True}}, {"$set": {"banned": True}})
+        banned_set = set(banned_user_ids)
+        stale_ids = [doc['_id'] async for doc in self.users_collection.find({"banned": True}, {"_id": 1}) if doc['_id'] not in banned_set]
+        if stale_ids:
+            await self.users_collection.update_many({"_id": {"$in": stale_ids}}, {"$unset": {"banned": ""}})
+
+    async def _ensure_retention_indexes(self):
+        """ينشئ (أو يحدّث) فهارس TTL حتى تحذف MongoDB البيانات القديمة تلقائياً."""
+        # Documents written before retention existed have no date field; stamp them so they expire too
+        now = datetime.utcnow()
+        await self.forwarding_map_collection.update_many({"created_at": {"$exists": False}}, {"$set": {"created_at": now}})
+        await self.scheduled_posts_collection.update_many({"status": "done", "done_at": {"$exists": False}}, {"$set": {"done_at": now}})
+
+        for collection_name, (field, seconds) in RETENTION_POLICIES.items():
+            collection = self.db[collection_name]
+            index_name = f"{field}_ttl"
+            if seconds <= 0:
+                try:
+                    await collection.drop_index(index_name)
+                except OperationFailure:
+                    pass # الفهرس غير موجود أصلاً
+                continue
+            try:
+                await collection.create_index(field, expireAfterSeconds=seconds, name=index_name)
+            except OperationFailure:
+                # The index exists with another retention period: update it in place
+                await self.db.command("collMod", collection_name, index={"name": index_name, "expireAfterSeconds": seconds})
+
     async def initialize_defaults(self):
         if not self.is_connected(): return
-        defaults = {
-            "admin_panel_title": "أهلاً بك في لوحة التحكم.", "welcome_message": "أهلاً بك يا #name_user!", "date_button": "📅 التاريخ", "time_button": "⏰ الساعة الآن", "reminder_button": "📿 أذكار اليوم",
-            "user_message_received": "✅ تم استلام رسالتك بنجاح، سيتم الرد عليك قريباً.",
-            "ar_back_button": "⬅️ عودة", "ar_page_info": "صفحة {current_page}/{total_pages}", "ar_next_button": "التالي ⬅️", "ar_prev_button": "➡️ السابق", "ar_delete_button": "🗑️ حذف",
-            "ar_menu_title": "⚙️ *إدارة الردود التلقائية*", "ar_add_button": "➕ إضافة رد", "ar_view_button": "📖 عرض الردود", "ar_import_button": "📥 استيراد", "ar_ask_for_keyword": "📝 أرسل *الكلمة المفتاحية*", "ar_ask_for_content": "📝 أرسل *محتوى الرد*", "ar_added_success": "✅ تم الحفظ!", "ar_add_another_button": "➕ إضافة المزيد", "ar_ask_for_file": "📦 أرسل ملف `.txt`.", "ar_import_success": "✅ اكتمل.", "ar_no_replies": "لا توجد ردود.", "ar_deleted_success": "🗑️ تم الحذف.",
-            "rem_menu_title": "⏰ *إدارة التذكيرات*", "rem_add_button": "➕ إضافة", "rem_view_button": "📖 عرض", "rem_import_button": "📥 استيراد", "rem_ask_for_content": "📝 أرسل *نص التذكير*.", "rem_added_success": "✅ تم الحفظ!", "rem_add_another_button": "➕ إضافة المزيد", "rem_ask_for_file": "📦 أرسل ملف `.txt`.", "rem_import_success": "✅ اكتمل.", "rem_no_reminders": "لا توجد تذكيرات.", "rem_deleted_success": "🗑️ تم الحذف.", "rem_delete_button": "🗑️ حذف",
-            "cp_menu_title": "📰 *إدارة منشورات القناة*", "cp_set_auto_msg_button": "✍️ تعيين الرسالة", "cp_view_auto_msg_button": "👀 عرض الرسالة", "cp_publish_now_button": "🚀 نشر الآن", "cp_schedule_button": "🗓️ جدولة منشور", "cp_view_scheduled_button": "👀 عرض المجدولة", "cp_ask_for_auto_msg": "📝 أرسل الرسالة.", "cp_auto_msg_set_success": "✅ تم الحفظ.", "cp_no_auto_msg": "لم يتم تعيين رسالة.", "cp_auto_msg_deleted_success": "🗑️ تم الحذف.", "cp_publish_started": "🚀 جاري النشر...", "cp_publish_finished": "🏁 اكتمل النشر!", "cp_error_no_auto_msg_to_publish": "⚠️ لا توجد رسالة!", "cp_error_no_channels_to_publish": "⚠️ لا توجد قنوات!",
-            "cm_menu_title": "📡 *إدارة القنوات*", "cm_add_button": "➕ إضافة قناة", "cm_view_button": "📖 عرض القنوات", "cm_ask_for_channel_id": "📡 أرسل معرّف القناة.", "cm_add_success": "✅ تم الإضافة!", "cm_add_fail_not_admin": "❌ فشل.", "cm_add_fail_invalid_id": "❌ فشل.", "cm_add_fail_already_exists": "⚠️ مضافة بالفعل.", "cm_no_channels": "لا توجد قنوات.", "cm_deleted_success": "🗑️ تم الحذف.", "cm_test_button": "🔬 تجربة", "cm_test_success": "✅ نجح.", "cm_test_fail": "❌ فشل.",
-            "bm_menu_title": "🚫 *إدارة الحظر*", "bm_ban_button": "🚫 حظر", "bm_unban_button": "✅ إلغاء حظر", "bm_view_button": "📖 عرض", "bm_ask_for_user_id": "🆔 أرسل ID.", "bm_ask_for_unban_user_id": "🆔 أرسل ID.", "bm_user_banned_success": "🚫 تم الحظر.", "bm_user_already_banned": "⚠️ محظور بالفعل.", "bm_user_unbanned_success": "✅ تم إلغاء الحظر.", "bm_user_not_banned": "⚠️ ليس محظوراً.", "bm_invalid_user_id": "❌ ID غير صالح.", "bm_no_banned_users": "لا يوجد محظورين.",
-            "sec_menu_title": "🛡️ *الحماية والأمان*", "sec_bot_status_button": "🤖 حالة البوت", "sec_media_filtering_button": "🖼️ منع الوسائط", "sec_antiflood_button": "⏱️ منع التكرار", "sec_rejection_message_button": "✍️ تعديل رسالة الرفض", "sec_bot_active": "🟢 يعمل", "sec_bot_inactive": "🔴 متوقف", "security_rejection_message": "عذراً, هذا غير مسموح.",
-            "sch_ask_for_message": "📝 أرسل المنشور للجدولة.", "sch_ask_for_channels": "📡 اختر القنوات.", "sch_all_channels_button": "📢 كل القنوات", "sch_ask_for_datetime": "⏰ أرسل تاريخ ووقت النشر `YYYY-MM-DD HH:MM`.", "sch_invalid_datetime": "❌ صيغة التاريخ خاطئة.", "sch_datetime_in_past": "❌ لا يمكن الجدولة في الماضي.", "sch_add_success": "✅ تم جدولة المنشور.", "sch_no_jobs": "لا توجد منشورات مجدولة.", "sch_deleted_success": "🗑️ تم الحذف.",
-            "af_menu_title": "⏱️ *إعدادات منع التكرار*","af_status_button": "🚦 حالة البروتوكول", "af_enabled": "🟢 مفعل", "af_disabled": "🔴 معطل", "af_edit_threshold_button": "⚡️ تعديل عتبة الإزعاج", "af_edit_mute_duration_button": "⏳ تعديل مدة التقييد", "af_ask_for_new_value": "✍️ أرسل القيمة الجديدة.", "af_updated_success": "✅ تم تحديث الإعداد.", "af_mute_notification": "🔇 *تم تقييدك مؤقتاً.*\nبسبب إرسال رسائل سريعة, تم منعك من الإرسال لمدة {duration} دقيقة.", "af_ban_notification": "🚫 *لقد تم حظرك نهائياً.*\nبسبب تكرار السلوك المزعج, تم منعك من استخدام البوت.",
-            "stats_title": "📊 *إحصائيات البوت*", "stats_total_users": "👤 المستخدمون", "stats_banned_users": "🚫 المحظورون", "stats_auto_replies": "📝 الردود", "stats_reminders": "⏰ التذكيرات", "stats_refresh_button": "🔄 تحديث",
-            "mm_menu_title": "🛠️ *وضع الصيانة*", "mm_ask_for_user_id": "🆔 أرسل ID المستخدم للبحث عن حالته.", "mm_clear_user_state_button": "🔄 مسح حالة المستخدم", "mm_state_cleared_success": "✅ تم مسح حالة المستخدم بنجاح.", "mm_state_not_found": "⚠️ لم يتم العثور على حالة نشطة لهذا المستخدم.",
-            "lib_view_button": "📚 عرض المكتبة", "lib_no_items": "📭 لا توجد عناصر في المكتبة.",
-            "sm_title": "🖥️ *مراقبة النظام*", "sm_status_ok": "🟢 كل الأنظمة تعمل.", "sm_status_degraded": "🟠 هناك مشاكل في بعض الأنظمة.", "sm_health_checks": "المؤشرات الحيوية", "sm_bot_status": "حالة البوت", "sm_status_operational": "يعمل", "sm_db_status": "قاعدة البيانات", "sm_status_connected": "متصل", "sm_status_unreachable": "غير متصل", "sm_performance": "الأداء", "sm_uptime": "مدة التشغيل", "sm_tg_latency": "استجابة تيليجرام", "sm_deploy_info": "معلومات النشر", "sm_last_update": "آخر تحديث", "sm_server_health": "🩺 صحة الخادم", "sm_cpu_usage": "المعالج", "sm_ram_usage": "الذاكرة",
-            "sm_db_stats_title": "🗃️ مساحة قاعدة البيانات", "sm_db_data_size": "البيانات المستخدمة", "sm_db_remaining": "المساحة المتبقية",
-        }
-        for key, value in defaults.items():
-            await self.texts_collection.update_one({"_id": key}, {"$setOnInsert": {"text": value}}, upsert=True)
-        
-        await self.settings_collection.update_one({"_id": SETTING_SECURITY}, {"$setOnInsert": {"bot_status": "active", "blocked_media": {}}}, upsert=True)
-        await self.settings_collection.update_one({"_id": SETTING_FORCE_SUBSCRIBE}, {"$setOnInsert": {"enabled": True}}, upsert=True)
-        await self.settings_collection.update_one({"_id": SETTING_ANTIFLOOD}, {"$setOnInsert": {"enabled": True, "rate_limit": 7, "time_window": 2, "mute_duration": 30}}, upsert=True)
-        await self.settings_collection.update_one({"_id": SETTING_TIMEZONE}, {"$setOnInsert": {"identifier": "Asia/Riyadh", "display_name": "بتوقيت الرياض"}}, upsert=True)
+        # PERFORMANCE: Seed everything with one unordered bulk_write per collection instead of ~200 sequential upserts
+        started_at = time.perf_counter()
+        text_ops = [UpdateOne({"_id": key}, {"$setOnInsert": {"text": value}}, upsert=True) for key, value in DEFAULT_TEXTS.items()]
+        settings_ops = [UpdateOne({"_id": key}, {"$setOnInsert": value}, upsert=True) for key, value in DEFAULT_SETTINGS.items()]
+        texts_result, settings_result = await asyncio.gather(
+            self.texts_collection.bulk_write(text_ops, ordered=False),
+            self.settings_collection.bulk_write(settings_ops, ordered=False)
+        )
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        logger.info(
+            f"🌱 Seeded defaults in {elapsed_ms:.0f} ms "
+            f"({texts_result.upserted_count} new texts, {settings_result.upserted_count} new settings)."
+        )
 
     async def load_all_caches(self):
         if not self.is_connected(): return
@@ -115,10 +259,13 @@ class DatabaseManager:
         settings_keys = [SETTING_SECURITY, SETTING_FORCE_SUBSCRIBE, SETTING_ANTIFLOOD, SETTING_TIMEZONE]
         settings_cursor = self.settings_collection.find({"_id": {"$in": settings_keys}})
         async for doc in settings_cursor: self.settings_cache[doc['_id']] = doc
+        await self._load_ban_index()
+        await self.reconcile_statistics()
         channels_cursor = self.subscription_channels_collection.find({}, {"_id": 0, "username": 1})
         channels_list = await channels_cursor.to_list(length=None)
         self.settings_cache['subscription_channels'] = [ch["username"] for ch in channels_list if ch.get("username")]
-        logger.info(f"✅ Cached {len(TEXTS_CACHE)} text items and {len(self.settings_cache)} settings items.")
+        self._rebuild_media_policy()
+        logger.info(f"✅ Cached {len(TEXTS_CACHE)} text items, {len(self.settings_cache)} settings items and {len(self.banned_user_ids)} banned users.")
     
     async def get_text(self, text_id: str) -> str: return TEXTS_CACHE.get(text_id, f"[{text_id}]")
     
@@ -126,14 +273,82 @@ class DatabaseManager:
         if not self.is_connected(): return
         await self.texts_collection.update_one({"_id": text_id}, {"$set": {"text": new_text}}, upsert=True)
         TEXTS_CACHE[text_id] = new_text
+        if text_id == REJECTION_TEXT_ID: self._rebuild_media_policy()
 
     async def add_user(self, user) -> bool:
+        """
+        يسجل المستخدم ويعيد True فقط إذا كان جديداً.
+        المستخدم المعروف لا يكلف أي كتابة فورية: التغييرات في الاسم أو المعرف تُجمع وتُكتب دفعة واحدة لاحقاً.
+        """
         if not self.is_connected(): return False
         user_data = {'first_name': user.first_name or "", 'last_name': getattr(user, 'last_name', "") or "", 'username': user.username or ""}
-        result = await self.users_collection.update_one({'_id': user.id}, {'$set': user_data}, upsert=True)
-        # IMPROVEMENT: Return 'acknowledged' for a more accurate success status (True for both insert and update)
-        return result.acknowledged
-    
+        fingerprint = hash((user_data['first_name'], user_data['last_name'], user_data['username']))
+        known_fingerprint = self._user_fingerprints.get(user.id)
+        if known_fingerprint is not None:
+            self._user_fingerprints.move_to_end(user.id)
+            if known_fingerprint != fingerprint:
+                self._pending_user_profiles[user.id] = user_data
+                self._user_fingerprints[user.id] = fingerprint
+            return False
+        # First sighting in this process: write through so that new-user detection stays exact.
+        # The same write reactivates a user that a broadcast had marked as unreachable.
+        result = await self.users_collection.update_one({'_id': user.id}, {'$set': user_data, '$unset': {'inactive': "", 'inactive_since': ""}, '$setOnInsert': {'joined_at': datetime.utcnow()}}, upsert=True)
+        self._remember_fingerprint(user.id, fingerprint)
+        is_new = result.upserted_id is not None
+        if is_new:
+            self.stats_counters["total_users"] += 1
+        return is_new
+
+    def _remember_fingerprint(self, user_id: int, fingerprint: int):
+        self._user_fingerprints[user_id] = fingerprint
+        while len(self._user_fingerprints) > USER_FINGERPRINT_CACHE_SIZE:
+            self._user_fingerprints.popitem(last=False)
+
+    def _prune_activity_timestamps(self):
+        # Entries older than the resolution no longer suppress anything, so only recently active users stay in memory
+        cutoff = datetime.utcnow() - timedelta(seconds=USER_ACTIVITY_RESOLUTION)
+        self._activity_recorded_at = {user_id: recorded_at for user_id, recorded_at in self._activity_recorded_at.items() if recorded_at > cutoff}
+
+    async def record_user_activity(self, user_id: int):
+        """Buffers the user's last activity time for audience segments; flushed with the profiles."""
+        now = datetime.utcnow()
+        recorded_at = self._activity_recorded_at.get(user_id)
+        if recorded_at and (now - recorded_at).total_seconds() < USER_ACTIVITY_RESOLUTION: return
+        self._activity_recorded_at[user_id] = now
+        self._pending_activity[user_id] = now
+
+    async def flush_user_profiles(self):
+        """يكتب كل تحديثات الملفات الشخصية وأوقات النشاط المعلقة في استدعاء bulk_write واحد."""
+        if not self.is_connected(): return
+        self._prune_activity_timestamps()
+        if not (self._pending_user_profiles or self._pending_activity): return
+        pending, self._pending_user_profiles = self._pending_user_profiles, {}
+        pending_activity, self._pending_activity = self._pending_activity, {}
+        # Any update from a user proves they are reachable again, even if a broadcast (maybe in another process) flagged them
+        reactivate = {'inactive': "", 'inactive_since': ""}
+        operations = [UpdateOne({'_id': user_id}, {'$set': user_data, '$unset': reactivate}, upsert=True) for user_id, user_data in pending.items()]
+        operations += [UpdateOne({'_id': user_id}, {'$set': {'last_active_at': active_at}, '$unset': reactivate}) for user_id, active_at in pending_activity.items()]
+        try:
+            await self.users_collection.bulk_write(operations, ordered=False)
+            logger.info(f"💾 Flushed {len(operations)} buffered user profile updates.")
+        except Exception as e:
+            logger.error(f"Failed to flush user profiles, they will be retried: {e}")
+            # Newer updates that arrived during the failed flush take precedence
+            for user_id, user_data in pending.items():
+                self._pending_user_profiles.setdefault(user_id, user_data)
+            for user_id, active_at in pending_activity.items():
+                self._pending_activity.setdefault(user_id, active_at)
+
+    async def tag_users(self, user_ids: list, tag: str) -> int:
+        if not self.is_connected() or not user_ids: return 0
+        result = await self.users_collection.update_many({"_id": {"$in": user_ids}}, {"$addToSet": {"tags": tag}})
+        return result.matched_count
+
+    async def untag_users(self, user_ids: list, tag: str) -> int:
+        if not self.is_connected() or not user_ids: return 0
+        result = await self.users_collection.update_many({"_id": {"$in": user_ids}}, {"$pull": {"tags": tag}})
+        return result.matched_count
+
     async def get_antiflood_settings(self) -> dict: return self.settings_cache.get(SETTING_ANTIFLOOD, {})
     
     async def update_antiflood_setting(self, key: str, value):
@@ -167,7 +382,19 @@ class DatabaseManager:
         await self.settings_collection.update_one({"_id": SETTING_SECURITY}, {"$set": {f"blocked_media.{media_type}": new_blocked_status}}, upsert=True)
         if SETTING_SECURITY not in self.settings_cache: self.settings_cache[SETTING_SECURITY] = {"blocked_media": {}}
         self.settings_cache[SETTING_SECURITY]["blocked_media"][media_type] = new_blocked_status
+        self._rebuild_media_policy()
         return new_blocked_status
+
+    async def set_allowed_link_domains(self, domains: list):
+        """النطاقات المسموحة حتى عند منع الروابط (مثل: youtube.com)."""
+        if not self.is_connected(): return
+        await self.settings_collection.update_one({"_id": SETTING_SECURITY}, {"$set": {"allowed_link_domains": domains}}, upsert=True)
+        self.settings_cache.setdefault(SETTING_SECURITY, {})["allowed_link_domains"] = domains
+        self._rebuild_media_policy()
+
+    def _rebuild_media_policy(self):
+        # PERFORMANCE: Compiled once per settings change instead of evaluated on every message
+        MEDIA_POLICY.rebuild(self.settings_cache.get(SETTING_SECURITY, {}), TEXTS_CACHE.get(REJECTION_TEXT_ID, ""))
         
     async def get_subscription_channels(self) -> list[str]: return self.settings_cache.get("subscription_channels", [])
         
@@ -220,97 +447,340 @@ class DatabaseManager:
         self.settings_cache['subscription_channels'] = [ch["username"] for ch in channels_list if ch.get("username")]
         logger.info("🔄 Subscription channels cache reloaded.")
 
+    # --- Keyset pagination ---
+    # كل قائمة مرتبة بمفتاح ثابت، والمؤشر هو مفتاح أول/آخر عنصر في الصفحة الحالية.
+    # بهذا تكلف الصفحة رقم N نفس تكلفة الصفحة الأولى (لا skip ولا count_documents).
+    async def _get_keyset_page(self, collection, sort_keys: list, cursor_values, backwards: bool, limit: int, encode_cursor, query: dict = None) -> dict:
+        sort_spec = [(field, -direction if backwards else direction) for field, direction in sort_keys]
+        query = dict(query or {})
+        if cursor_values is not None:
+            # Lexicographic range on the sort keys: (k1 > v1) OR (k1 == v1 AND k2 > v2) ...
+            branches = []
+            for i, (field, direction) in enumerate(sort_spec):
+                branch = {prev_field: cursor_values[j] for j, (prev_field, _) in enumerate(sort_spec[:i])}
+                branch[field] = {"$gt" if direction == 1 else "$lt": cursor_values[i]}
+                branches.append(branch)
+            key_range = branches[0] if len(branches) == 1 else {"$or": branches}
+            query = {"$and": [query, key_range]} if query else key_range
+        docs = await collection.find(query).sort(sort_spec).limit(limit + 1).to_list(length=limit + 1)
+        has_more = len(docs) > limit
+        docs = docs[:limit]
+        if backwards:
+            docs.reverse()
+        return {
+            "items": docs,
+            "has_prev": has_more if backwards else cursor_values is not None,
+            "has_next": True if backwards else has_more,
+            "prev_cursor": encode_cursor(docs[0]) if docs else "",
+            "next_cursor": encode_cursor(docs[-1]) if docs else "",
+        }
+
+    @staticmethod
+    def _empty_page() -> dict:
+        return {"items": [], "has_prev": False, "has_next": False, "prev_cursor": "", "next_cursor": ""}
+
+    @staticmethod
+    def _decode_object_id_cursor(cursor: str):
+        if not cursor: return None
+        try:
+            return [ObjectId(cursor)]
+        except InvalidId:
+            logger.warning(f"Ignoring invalid pagination cursor: {cursor}")
+            return None
+
+    @staticmethod
+    def _decode_int_cursor(cursor: str):
+        if not cursor: return None
+        try:
+            return [int(cursor)]
+        except ValueError:
+            logger.warning(f"Ignoring invalid pagination cursor: {cursor}")
+            return None
+
+    @staticmethod
+    def _encode_scheduled_post_cursor(doc: dict) -> str:
+        return f"{doc['run_date'].strftime(CURSOR_DATE_FORMAT)}{CURSOR_PART_SEPARATOR}{doc['_id']}"
+
+    @staticmethod
+    def _decode_scheduled_post_cursor(cursor: str):
+        if not cursor: return None
+        try:
+            run_date_str, job_id = cursor.split(CURSOR_PART_SEPARATOR, 1)
+            return [datetime.strptime(run_date_str, CURSOR_DATE_FORMAT), job_id]
+        except ValueError:
+            logger.warning(f"Ignoring invalid pagination cursor: {cursor}")
+            return None
+
+    async def get_estimated_count(self, collection_name: str) -> int:
+        """عدد تقريبي من بيانات المجموعة الوصفية (ثابت التكلفة)، يكفي لعرض عدد الصفحات."""
+        if not self.is_connected(): return 0
+        return await self.db[collection_name].estimated_document_count()
+
+    async def _load_ban_index(self):
+        if not self.is_connected(): return
+        version = self._ban_index_version
+        banned_cursor = self.banned_users_collection.find({}, {"_id": 1})
+        banned_user_ids = {doc['_id'] async for doc in banned_cursor}
+        if version == self._ban_index_version:
+            self.banned_user_ids = banned_user_ids
+
     async def ban_user(self, user_id: int):
         if not self.is_connected() or await self.is_user_banned(user_id):
             return False
-        await self.banned_users_collection.insert_one({"_id": user_id, "ban_date": datetime.utcnow()})
+        try:
+            await self.banned_users_collection.insert_one({"_id": user_id, "ban_date": datetime.utcnow()})
+        except DuplicateKeyError:
+            # The index was stale (e.g. banned from another process); resync it and report "already banned"
+            self.banned_user_ids.add(user_id)
+            self._ban_index_version += 1
+            return False
+        self.banned_user_ids.add(user_id)
+        self._ban_index_version += 1
+        await self.users_collection.update_one({"_id": user_id}, {"$set": {"banned": True}})
         return True
 
     async def unban_user(self, user_id: int):
         if not self.is_connected(): return False
         result = await self.banned_users_collection.delete_one({"_id": user_id})
+        self.banned_user_ids.discard(user_id)
+        self._ban_index_version += 1
+        await self.users_collection.update_one({"_id": user_id}, {"$unset": {"banned": ""}})
         return result.deleted_count > 0
 
     async def is_user_banned(self, user_id: int) -> bool:
-        if not self.is_connected(): return False
-        return await self.banned_users_collection.find_one({"_id": user_id}) is not None
+        # PERFORMANCE: Served from the in-memory index, kept in sync by ban_user/unban_user
+        return user_id in self.banned_user_ids
+
+    async def refresh_ban_index(self):
+        await self._load_ban_index()
         
-    async def get_banned_users(self, page: int = 1, limit: int = 10):
-        if not self.is_connected(): return []
-        return await self.banned_users_collection.find().skip((page - 1) * limit).limit(limit).to_list(length=limit)
+    async def get_banned_users(self, cursor: str = None, backwards: bool = False, limit: int = 10) -> dict:
+        if not self.is_connected(): return self._empty_page()
+        return await self._get_keyset_page(
+            self.banned_users_collection, [("_id", 1)], self._decode_int_cursor(cursor), backwards, limit,
+            encode_cursor=lambda doc: str(doc['_id'])
+        )
     
-    async def get_banned_users_count(self):
-        if not self.is_connected(): return 0
-        return await self.banned_users_collection.count_documents({})
-        
-    async def get_all_users(self):
-        if not self.is_connected(): return []
-        all_users_cursor = self.users_collection.find({}, {"_id": 1})
-        all_user_ids = {user['_id'] for user in await all_users_cursor.to_list(length=None)}
-        banned_users_cursor = self.banned_users_collection.find({}, {"_id": 1})
-        banned_user_ids = {user['_id'] for user in await banned_users_cursor.to_list(length=None)}
-        active_user_ids = all_user_ids - banned_user_ids
-        return list(active_user_ids)
-
-    async def record_antiflood_violation(self, user_id: int, reset_after_hours: int = 1):
+    def _audience_filter(self, after_user_id: int = None, segment: dict = None) -> dict:
+        # Banned users are excluded server-side through the `banned` flag on their document (no id list travels
+        # with the query), and users a broadcast found unreachable (blocked the bot, deleted account) are skipped
+        query = {"inactive": {"$ne": True}, "banned": {"$ne": True}}
+        # PERFORMANCE: Segment conditions are resolved by the compound indexes on users, not in Python
+        segment = segment or {}
+        if segment.get("joined_after"):
+            query["joined_at"] = {"$gte": segment["joined_after"]}
+        if segment.get("active_after"):
+            query["last_active_at"] = {"$gte": segment["active_after"]}
+        if segment.get("has_username"):
+            query["username"] = {"$gt": ""}
+        if segment.get("tag"):
+            query["tags"] = segment["tag"]
+        if after_user_id is not None:
+            query["_id"] = {"$gt": after_user_id}
+        return query
+
+    async def iter_audience(self, batch_size: int = 500, after_user_id: int = None, segment: dict = None):
+        """
+        Streams the ids of the audience (optionally narrowed to a segment) in batches, without materialising it.
+        Ids come in ascending order, so `after_user_id` resumes a broadcast from its checkpoint.
+        """
         if not self.is_connected(): return
+        cursor = self.users_collection.find(self._audience_filter(after_user_id, segment), {"_id": 1}).sort("_id", 1).batch_size(batch_size)
+        batch = []
+        async for doc in cursor:
+            # The flag is checked as the cursor reaches each user; this also drops a user banned while their batch was in flight
+            if doc['_id'] in self.banned_user_ids: continue
+            batch.append(doc['_id'])
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def get_audience_count(self, segment: dict = None) -> int:
+        if not self.is_connected(): return 0
+        return await self.users_collection.count_documents(self._audience_filter(segment=segment))
+
+    async def get_join_tracking_start(self):
+        """أقدم تاريخ انضمام حقيقي (None إن لم يسجَّل أي تاريخ بعد)؛ المستخدمون الأقدم منه يحملون JOIN_DATE_UNKNOWN."""
+        if not self.is_connected(): return None
+        doc = await self.users_collection.find_one({"joined_at": {"$gt": JOIN_DATE_UNKNOWN}}, {"joined_at": 1}, sort=[("joined_at", 1)])
+        return doc["joined_at"] if doc else None
+
+    async def mark_users_unreachable(self, user_ids: list):
+        """Flags users that blocked the bot or were deleted so broadcasts stop paying for them; /start clears the flag."""
+        if not self.is_connected() or not user_ids: return
+        await self.users_collection.update_many({"_id": {"$in": user_ids}}, {"$set": {"inactive": True, "inactive_since": datetime.utcnow()}})
+        # Their next update reactivates them through the activity flush; forgetting the fingerprint
+        # also makes a /start in this process write through right away
+        for user_id in user_ids:
+            self._user_fingerprints.pop(user_id, None)
+
+    async def record_antiflood_violation(self, user_id: int, reset_after_hours: int = 1) -> int:
+        """
+        يسجل مخالفة ويعيد عدد المخالفات ضمن النافذة الزمنية، في عملية ذرية واحدة.
+        """
+        if not self.is_connected(): return 0
         now = datetime.utcnow()
         time_threshold = now - timedelta(hours=reset_after_hours)
-        doc = await self.antiflood_violations_collection.find_one({"user_id": user_id})
-        last_violation_time = doc.get("last_violation") if doc else None
-        if not last_violation_time or last_violation_time < time_threshold:
-            await self.antiflood_violations_collection.update_one(
-                {"user_id": user_id},
-                {"$set": {"count": 1, "last_violation": now}},
-                upsert=True
+        # PERFORMANCE: One atomic round trip. The pipeline resets the counter when the last violation
+        # is outside the window and increments it otherwise (expressions see the pre-update document).
+        update = [{"$set": {
+            "count": {"$cond": [
+                {"$gte": ["$last_violation", time_threshold]},
+                {"$add": [{"$ifNull": ["$count", 0]}, 1]},
+                1
+            ]},
+            "last_violation": now
+        }}]
+        try:
+            doc = await self.antiflood_violations_collection.find_one_and_update(
+                {"user_id": user_id}, update, projection={"count": 1}, upsert=True, return_document=ReturnDocument.AFTER
             )
-        else:
-            await self.antiflood_violations_collection.update_one(
-                {"user_id": user_id},
-                {"$inc": {"count": 1}, "$set": {"last_violation": now}},
-                upsert=True
+        except DuplicateKeyError:
+            # A concurrent violation inserted the document first (unique index): this retry updates it
+            doc = await self.antiflood_violations_collection.find_one_and_update(
+                {"user_id": user_id}, update, projection={"count": 1}, upsert=True, return_document=ReturnDocument.AFTER
             )
+        return doc.get("count", 1) if doc else 1
 
-    async def get_user_violation_count(self, user_id: int, within_hours: int = 1) -> int:
-        if not self.is_connected(): return 0
-        time_threshold = datetime.utcnow() - timedelta(hours=within_hours)
-        doc = await self.antiflood_violations_collection.find_one({
-            "user_id": user_id, "last_violation": {"$gte": time_threshold}
-        })
-        return doc.get("count", 0) if doc else 0
+    async def mute_user(self, user_id: int, mute_until: datetime):
+        """يحفظ نهاية الكتم المؤقت (UTC) حتى يبقى سارياً بعد إعادة التشغيل."""
+        if not self.is_connected(): return
+        try:
+            await self.antiflood_violations_collection.update_one({"user_id": user_id}, {"$set": {"mute_until": mute_until}}, upsert=True)
+        except DuplicateKeyError:
+            await self.antiflood_violations_collection.update_one({"user_id": user_id}, {"$set": {"mute_until": mute_until}}, upsert=True)
+
+    async def get_active_mutes(self) -> dict:
+        if not self.is_connected(): return {}
+        cursor = self.antiflood_violations_collection.find({"mute_until": {"$gt": datetime.utcnow()}}, {"user_id": 1, "mute_until": 1})
+        return {doc['user_id']: doc['mute_until'] async for doc in cursor}
 
     async def add_scheduled_post(self, job_id: str, message_data: dict, target_channels: list, run_date: datetime):
         if not self.is_connected(): return
         await self.scheduled_posts_collection.insert_one({"_id": job_id, "message_data": message_data, "target_channels": target_channels, "run_date": run_date, "status": "pending"})
 
-    async def get_scheduled_posts(self, page: int = 1, limit: int = 10):
-        if not self.is_connected(): return []
-        return await self.scheduled_posts_collection.find({"status": "pending"}).sort("run_date", 1).skip((page - 1) * limit).limit(limit).to_list(length=limit)
-
-    async def get_scheduled_posts_count(self) -> int:
-        if not self.is_connected(): return 0
-        return await self.scheduled_posts_collection.count_documents({"status": "pending"})
+    async def get_scheduled_posts(self, cursor: str = None, backwards: bool = False, limit: int = 10) -> dict:
+        if not self.is_connected(): return self._empty_page()
+        return await self._get_keyset_page(
+            self.scheduled_posts_collection, [("run_date", 1), ("_id", 1)], self._decode_scheduled_post_cursor(cursor), backwards, limit,
+            encode_cursor=self._encode_scheduled_post_cursor, query={"status": "pending"}
+        )
 
     async def delete_scheduled_post(self, job_id: str):
         if not self.is_connected(): return False
         result = await self.scheduled_posts_collection.delete_one({"_id": job_id})
         return result.deleted_count > 0
         
-    async def get_all_pending_scheduled_posts(self):
+    async def get_scheduled_post(self, job_id: str):
+        if not self.is_connected(): return None
+        return await self.scheduled_posts_collection.find_one({"_id": job_id})
+
+    async def get_upcoming_scheduled_posts(self, after: datetime, until: datetime) -> list:
+        """Pending posts due in (after, until], ids and dates only (covered by the status/run_date/_id index)."""
+        if not self.is_connected(): return []
+        cursor = self.scheduled_posts_collection.find(
+            {"status": "pending", "run_date": {"$gt": after, "$lte": until}}, {"_id": 1, "run_date": 1}
+        ).sort([("run_date", 1), ("_id", 1)])
+        return await cursor.to_list(length=None)
+
+    async def get_due_scheduled_posts(self, after: datetime, until: datetime) -> list:
+        """Full pending posts due in (after, until], in the order they were scheduled for."""
         if not self.is_connected(): return []
-        return await self.scheduled_posts_collection.find({"status": "pending"}).to_list(length=None)
+        cursor = self.scheduled_posts_collection.find(
+            {"status": "pending", "run_date": {"$gt": after, "$lte": until}}
+        ).sort([("run_date", 1), ("_id", 1)])
+        return await cursor.to_list(length=None)
+
+    async def expire_overdue_scheduled_posts(self, before: datetime) -> int:
+        """Marks pending posts whose time passed while the bot was down as done, without sending them."""
+        if not self.is_connected(): return 0
+        result = await self.scheduled_posts_collection.update_many(
+            {"status": "pending", "run_date": {"$lte": before}}, {"$set": {"status": "done", "done_at": datetime.utcnow()}}
+        )
+        return result.modified_count
 
     async def mark_scheduled_post_as_done(self, job_id: str):
         if not self.is_connected(): return
-        await self.scheduled_posts_collection.update_one({"_id": job_id}, {"$set": {"status": "done"}})
-    
-    async def get_publishing_channels(self, page: int = 1, limit: int = 10):
+        # done_at drives the TTL index that purges finished posts
+        await self.scheduled_posts_collection.update_one({"_id": job_id}, {"$set": {"status": "done", "done_at": datetime.utcnow()}})
+
+    async def create_broadcast_job(self, job_id: str, message_to_send: dict, total: int, progress_chat_id: int, progress_message_id: int, segment: dict = None):
+        if not self.is_connected(): return
+        await self.broadcast_jobs_collection.insert_one({
+            "_id": job_id, "message_to_send": message_to_send, "segment": segment or {}, "status": BROADCAST_JOB_QUEUED,
+            "total": total, "success": 0, "failed": 0, "cursor": None,
+            "progress_chat_id": progress_chat_id, "progress_message_id": progress_message_id, "created_at": datetime.utcnow()
+        })
+
+    async def get_broadcast_job(self, job_id: str):
+        if not self.is_connected(): return None
+        return await self.broadcast_jobs_collection.find_one({"_id": job_id})
+
+    async def get_unfinished_broadcast_jobs(self) -> list:
         if not self.is_connected(): return []
-        return await self.publishing_channels_collection.find().skip((page - 1) * limit).limit(limit).to_list(length=limit)
+        query = {"status": {"$in": [BROADCAST_JOB_QUEUED, BROADCAST_JOB_RUNNING, BROADCAST_JOB_PAUSED]}}
+        return await self.broadcast_jobs_collection.find(query).sort("created_at", 1).to_list(length=None)
 
-    async def get_publishing_channels_count(self):
-        if not self.is_connected(): return 0
-        return await self.publishing_channels_collection.count_documents({})
+    async def claim_next_broadcast_job(self, worker_id: str, lease_seconds: int):
+        """
+        يحجز أقدم مهمة في الطابور لهذا العامل في عملية ذرية واحدة، فلا يأخذ عاملان المهمة نفسها.
+        المهام التي توقف عاملها عن تجديد العقد (heartbeat) تُعتبر متاحة أيضاً.
+        """
+        if not self.is_connected(): return None
+        now = datetime.utcnow()
+        return await self.broadcast_jobs_collection.find_one_and_update(
+            {"$or": [
+                {"status": BROADCAST_JOB_QUEUED},
+                {"status": BROADCAST_JOB_RUNNING, "heartbeat_at": {"$lt": now - timedelta(seconds=lease_seconds)}}
+            ]},
+            {"$set": {"status": BROADCAST_JOB_RUNNING, "worker_id": worker_id, "heartbeat_at": now}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def save_broadcast_progress(self, job_id: str, worker_id: str, cursor: int, success: int, failed: int):
+        """
+        Checkpoint: every user id up to `cursor` has been handled. Renews the lease and returns the job status.
+        A worker whose lease was taken over matches nothing and gets None, so it never overwrites the new owner's progress.
+        """
+        if not self.is_connected(): return None
+        doc = await self.broadcast_jobs_collection.find_one_and_update(
+            {"_id": job_id, "worker_id": worker_id},
+            {"$set": {"cursor": cursor, "success": success, "failed": failed, "heartbeat_at": datetime.utcnow()}},
+            projection={"status": 1}
+        )
+        return doc["status"] if doc else None
+
+    async def release_broadcast_job(self, job_id: str, worker_id: str):
+        """Puts a job this worker is running back in the queue (graceful worker shutdown)."""
+        if not self.is_connected(): return
+        await self.broadcast_jobs_collection.update_one(
+            {"_id": job_id, "status": BROADCAST_JOB_RUNNING, "worker_id": worker_id}, {"$set": {"status": BROADCAST_JOB_QUEUED}}
+        )
+
+    async def set_broadcast_job_status(self, job_id: str, status: str, expected: tuple = None, worker_id: str = None) -> bool:
+        if not self.is_connected(): return False
+        update = {"status": status}
+        if status in (BROADCAST_JOB_DONE, BROADCAST_JOB_CANCELLED):
+            # finished_at drives the TTL index that purges finished jobs
+            update["finished_at"] = datetime.utcnow()
+        # Conditional transition: a stale button or a finished worker cannot overwrite a newer status
+        query = {"_id": job_id}
+        if expected is not None:
+            query["status"] = {"$in": list(expected)}
+        if worker_id is not None:
+            query["worker_id"] = worker_id
+        result = await self.broadcast_jobs_collection.update_one(query, {"$set": update})
+        return result.modified_count > 0
+    
+    async def get_publishing_channels(self, cursor: str = None, backwards: bool = False, limit: int = 10) -> dict:
+        if not self.is_connected(): return self._empty_page()
+        return await self._get_keyset_page(
+            self.publishing_channels_collection, [("_id", 1)], self._decode_object_id_cursor(cursor), backwards, limit,
+            encode_cursor=lambda doc: str(doc['_id'])
+        )
 
     async def add_publishing_channel(self, channel_id: int, channel_title: str):
         if not self.is_connected(): return None
@@ -332,34 +802,23 @@ class DatabaseManager:
             logger.error(f"Error deleting publishing channel {db_id}: {e}")
             return False
     
-    async def get_users_count(self):
-        if not self.is_connected(): return 0
-        return await self.users_collection.count_documents({})
-
-    async def get_auto_replies_count(self):
-        if not self.is_connected(): return 0
-        return await self.auto_replies_collection.count_documents({})
-
-    async def get_reminders_count(self):
-        if not self.is_connected(): return 0
-        return await self.reminders_collection.count_documents({})
+    async def reconcile_statistics(self):
+        """يعيد مزامنة عدادات الإحصائيات مع بيانات المجموعات الوصفية لتصحيح أي انحراف."""
+        if not self.is_connected(): return
+        results = await asyncio.gather(
+            self.users_collection.estimated_document_count(),
+            self.auto_replies_collection.estimated_document_count(),
+            self.reminders_collection.estimated_document_count()
+        )
+        self.stats_counters = {"total_users": results[0], "auto_replies": results[1], "reminders": results[2]}
 
     async def get_bot_statistics(self) -> dict:
-        if not self.is_connected(): 
-            return {"total_users": 0, "banned_users": 0, "auto_replies": 0, "reminders": 0}
-        
-        tasks = [
-            self.get_users_count(),
-            self.get_banned_users_count(),
-            self.get_auto_replies_count(),
-            self.get_reminders_count()
-        ]
-        results = await asyncio.gather(*tasks)
+        # PERFORMANCE: Constant time, served from the in-memory counters and the ban index
         return {
-            "total_users": results[0], 
-            "banned_users": results[1], 
-            "auto_replies": results[2], 
-            "reminders": results[3]
+            "total_users": self.stats_counters["total_users"],
+            "banned_users": len(self.banned_user_ids),
+            "auto_replies": self.stats_counters["auto_replies"],
+            "reminders": self.stats_counters["reminders"]
         }
     
     async def find_auto_reply_by_keyword(self, keyword: str):
@@ -372,7 +831,7 @@ class DatabaseManager:
 
     async def log_message_link(self, admin_message_id: int, user_id: int, user_message_id: int):
         if not self.is_connected(): return
-        await self.forwarding_map_collection.insert_one({"_id": admin_message_id, "user_id": user_id, "user_message_id": user_message_id})
+        await self.forwarding_map_collection.insert_one({"_id": admin_message_id, "user_id": user_id, "user_message_id": user_message_id, "created_at": datetime.utcnow()})
 
     async def get_message_link_info(self, admin_message_id: int):
         if not self.is_connected(): return None
@@ -402,16 +861,23 @@ class DatabaseManager:
         if not self.is_connected(): return
         keyword_lower = keyword.lower()
         doc = {"keyword": keyword, "keyword_lower": keyword_lower, "message": message}
-        await self.auto_replies_collection.update_one({"keyword_lower": keyword_lower}, {"$set": doc}, upsert=True)
+        result = await self.auto_replies_collection.update_one({"keyword_lower": keyword_lower}, {"$set": doc}, upsert=True)
+        if result.upserted_id is not None:
+            self.stats_counters["auto_replies"] += 1
 
-    async def get_auto_replies(self, page: int = 1, limit: int = 10):
-        if not self.is_connected(): return []
-        return await self.auto_replies_collection.find().skip((page - 1) * limit).limit(limit).to_list(length=limit)
+    async def get_auto_replies(self, cursor: str = None, backwards: bool = False, limit: int = 10) -> dict:
+        if not self.is_connected(): return self._empty_page()
+        return await self._get_keyset_page(
+            self.auto_replies_collection, [("_id", 1)], self._decode_object_id_cursor(cursor), backwards, limit,
+            encode_cursor=lambda doc: str(doc['_id'])
+        )
 
     async def delete_auto_reply(self, reply_id: str):
         if not self.is_connected(): return False
         try:
             result = await self.auto_replies_collection.delete_one({"_id": ObjectId(reply_id)})
+            if result.deleted_count > 0:
+                self.stats_counters["auto_replies"] -= 1
             return result.deleted_count > 0
         except InvalidId:
             logger.warning(f"Attempted to delete auto reply with invalid ObjectId: {reply_id}")
@@ -423,15 +889,21 @@ class DatabaseManager:
     async def add_reminder(self, text: str):
         if not self.is_connected(): return
         await self.reminders_collection.insert_one({"text": text})
+        self.stats_counters["reminders"] += 1
 
-    async def get_reminders(self, page: int = 1, limit: int = 10):
-        if not self.is_connected(): return []
-        return await self.reminders_collection.find().skip((page - 1) * limit).limit(limit).to_list(length=limit)
+    async def get_reminders(self, cursor: str = None, backwards: bool = False, limit: int = 10) -> dict:
+        if not self.is_connected(): return self._empty_page()
+        return await self._get_keyset_page(
+            self.reminders_collection, [("_id", 1)], self._decode_object_id_cursor(cursor), backwards, limit,
+            encode_cursor=lambda doc: str(doc['_id'])
+        )
 
     async def delete_reminder(self, reminder_id: str):
         if not self.is_connected(): return False
         try:
             result = await self.reminders_collection.delete_one({"_id": ObjectId(reminder_id)})
+            if result.deleted_count > 0:
+                self.stats_counters["reminders"] -= 1
             return result.deleted_count > 0
         except InvalidId:
             logger.warning(f"Attempted to delete reminder with invalid ObjectId: {reminder_id}")
@@ -456,13 +928,13 @@ class DatabaseManager:
         if not self.is_connected(): return
         await self.library_collection.insert_one({"message": message, "added_date": datetime.utcnow()})
 
-    async def get_library_items(self, page: int = 1, limit: int = 5):
-        if not self.is_connected(): return []
-        return await self.library_collection.find().sort("added_date", -1).skip((page-1)*limit).limit(limit).to_list(length=limit)
-
-    async def get_library_items_count(self):
-        if not self.is_connected(): return 0
-        return await self.library_collection.count_documents({})
+    async def get_library_items(self, cursor: str = None, backwards: bool = False, limit: int = 5) -> dict:
+        if not self.is_connected(): return self._empty_page()
+        # Newest first: ObjectIds are creation-ordered, so _id descending matches added_date descending
+        return await self._get_keyset_page(
+            self.library_collection, [("_id", -1)], self._decode_object_id_cursor(cursor), backwards, limit,
+            encode_cursor=lambda doc: str(doc['_id'])
+        )
 
     async def delete_library_item(self, item_id: str):
         if not self.is_connected(): return False
@@ -504,6 +976,31 @@ class DatabaseManager:
             logger.error(f"An unexpected error occurred while getting DB stats: {e}")
             return default_stats
 
+    async def get_collections_storage_stats(self) -> list:
+        """يعيد حجم كل مجموعة وعدد مستنداتها ومدة الاحتفاظ بها (بالثواني، 0 = دائم)، الأكبر أولاً."""
+        if not self.is_connected(): return []
+        collection_names = [
+            COLLECTION_USERS, COLLECTION_TEXTS, COLLECTION_REMINDERS, COLLECTION_SETTINGS, COLLECTION_SUBSCRIPTION_CHANNELS,
+            COLLECTION_MESSAGE_LINKS, COLLECTION_AUTO_REPLIES, COLLECTION_PUBLISHING_CHANNELS, COLLECTION_BANNED_USERS,
+            COLLECTION_LIBRARY, COLLECTION_SCHEDULED_POSTS, COLLECTION_ANTIFLOOD_VIOLATIONS, COLLECTION_BROADCAST_JOBS
+        ]
+
+        async def collection_stats(name: str) -> dict:
+            try:
+                stats = await self.db.command("collStats", name)
+            except OperationFailure as e:
+                logger.warning(f"Could not get stats for collection {name}: {e}")
+                stats = {}
+            return {
+                "name": name,
+                "count": stats.get("count", 0),
+                "size_mb": stats.get("size", 0) / (1024 * 1024),
+                "retention_seconds": RETENTION_POLICIES.get(name, (None, 0))[1],
+            }
+
+        results = await asyncio.gather(*(collection_stats(name) for name in collection_names))
+        return sorted(results, key=lambda item: item["size_mb"], reverse=True)
+
     # --- Convenience methods to directly access collections (optional) ---
     def users(self): return self.users_collection
     def texts(self): return self.texts_collection
@@ -518,4 +1015,17 @@ class DatabaseManager:
     def auto_replies(self): return self.auto_replies_collection
     def antiflood_violations(self): return self.antiflood_violations_collection
 
-db = DatabaseManager()
+def create_database_manager(backend_name: str = STORAGE_BACKEND, instrumented: bool = DB_METRICS_ENABLED) -> StorageBackend:
+    """ينشئ واجهة التخزين المطلوبة حسب الاسم، مع قياس زمن الاستدعاءات إن طُلب."""
+    if backend_name == "memory":
+        # Imported lazily: the in-memory backend reuses the constants and helpers defined above
+        from bot.database.memory_backend import InMemoryDatabaseManager
+        logger.info("🧪 Using the in-memory storage backend, nothing will be persisted.")
+        manager = InMemoryDatabaseManager()
+    else:
+        if backend_name != "mongo":
+            logger.warning(f"Unknown STORAGE_BACKEND '{backend_name}', falling back to MongoDB.")
+        manager = DatabaseManager()
+    return instrument_storage(manager) if instrumented else manager
+
+db = create_database_manager()
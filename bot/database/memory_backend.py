@@ -0,0 +1,639 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+
+import bson
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+
+from bot.core.cache import TEXTS_CACHE
+from bot.core.media_policy import MEDIA_POLICY, REJECTION_TEXT_ID
+from bot.database.backend import StorageBackend
+from bot.database.manager import (
+    DatabaseManager, DEFAULT_TEXTS, DEFAULT_SETTINGS, RETENTION_POLICIES,
+    COLLECTION_USERS, COLLECTION_TEXTS, COLLECTION_REMINDERS, COLLECTION_SETTINGS, COLLECTION_SUBSCRIPTION_CHANNELS,
+    COLLECTION_MESSAGE_LINKS, COLLECTION_AUTO_REPLIES, COLLECTION_PUBLISHING_CHANNELS, COLLECTION_BANNED_USERS,
+    COLLECTION_LIBRARY, COLLECTION_SCHEDULED_POSTS, COLLECTION_ANTIFLOOD_VIOLATIONS, COLLECTION_BROADCAST_JOBS,
+    BROADCAST_JOB_QUEUED, BROADCAST_JOB_RUNNING, BROADCAST_JOB_PAUSED, BROADCAST_JOB_CANCELLED, BROADCAST_JOB_DONE,
+    SETTING_SECURITY, SETTING_FORCE_SUBSCRIBE, SETTING_ANTIFLOOD, SETTING_TIMEZONE, SETTING_AUTO_PUBLICATION_MESSAGE,
+    JOIN_DATE_UNKNOWN,
+)
+
+logger = logging.getLogger(__name__)
+
+ALL_COLLECTIONS = [
+    COLLECTION_USERS, COLLECTION_TEXTS, COLLECTION_REMINDERS, COLLECTION_SETTINGS, COLLECTION_SUBSCRIPTION_CHANNELS,
+    COLLECTION_MESSAGE_LINKS, COLLECTION_AUTO_REPLIES, COLLECTION_PUBLISHING_CHANNELS, COLLECTION_BANNED_USERS,
+    COLLECTION_LIBRARY, COLLECTION_SCHEDULED_POSTS, COLLECTION_ANTIFLOOD_VIOLATIONS, COLLECTION_BROADCAST_JOBS
+]
+
+
+class InMemoryDatabaseManager(StorageBackend):
+    """
+    واجهة تخزين كاملة في الذاكرة بنفس سلوك DatabaseManager، بدون MongoDB.
+    مخصصة لاختبارات الحمل وقياس تكلفة المعالجات: لا شيء يُحفظ بعد إيقاف البوت.
+    كل مجموعة هي قاموس {_id: document}، والمستندات تُنسخ عند القراءة كما تفعل MongoDB.
+    """
+
+    def __init__(self):
+        self.collections = {}
+        self.settings_cache = {}
+        self.banned_user_ids = set()
+        self.stats_counters = {"total_users": 0, "auto_replies": 0, "reminders": 0}
+        # Secondary index for the hot path of every private message (unique, like keyword_lower in MongoDB)
+        self._auto_reply_ids_by_keyword = {}
+
+    def is_connected(self) -> bool:
+        return bool(self.collections)
+
+    async def connect_to_database(self, uri: str = None) -> bool:
+        self.collections = {name: {} for name in ALL_COLLECTIONS}
+        await self.initialize_defaults()
+        await self.load_all_caches()
+        logger.info("✅ تم تجهيز التخزين في الذاكرة بنجاح.")
+        return True
+
+    async def initialize_defaults(self):
+        if not self.is_connected(): return
+        for key, value in DEFAULT_TEXTS.items():
+            self.collections[COLLECTION_TEXTS].setdefault(key, {"_id": key, "text": value})
+        for key, value in DEFAULT_SETTINGS.items():
+            self.collections[COLLECTION_SETTINGS].setdefault(key, {"_id": key, **copy.deepcopy(value)})
+
+    async def load_all_caches(self):
+        if not self.is_connected(): return
+        for doc in self.collections[COLLECTION_TEXTS].values():
+            TEXTS_CACHE[doc['_id']] = doc.get('text', f"[{doc['_id']}]")
+        for key in [SETTING_SECURITY, SETTING_FORCE_SUBSCRIBE, SETTING_ANTIFLOOD, SETTING_TIMEZONE]:
+            if key in self.collections[COLLECTION_SETTINGS]:
+                # The cache is independent from the stored document, exactly like a MongoDB read
+                self.settings_cache[key] = copy.deepcopy(self.collections[COLLECTION_SETTINGS][key])
+        self.banned_user_ids = set(self.collections[COLLECTION_BANNED_USERS])
+        await self.reconcile_statistics()
+        self._reload_subscription_channels_cache()
+        self._rebuild_media_policy()
+
+    async def ping_database(self) -> bool:
+        return self.is_connected()
+
+    # --- Internal helpers ---
+    def _set_setting_field(self, setting_id: str, field: str, value):
+        doc = self.collections[COLLECTION_SETTINGS].setdefault(setting_id, {"_id": setting_id})
+        doc[field] = value
+
+    @staticmethod
+    def _find_id(collection: dict, field: str, value):
+        return next((doc_id for doc_id, doc in collection.items() if doc.get(field) == value), None)
+
+    @staticmethod
+    def _parse_object_id(raw_id: str, label: str):
+        try:
+            return ObjectId(raw_id)
+        except (InvalidId, TypeError):
+            logger.warning(f"Attempted to delete {label} with invalid ObjectId: {raw_id}")
+            return None
+
+    def _delete(self, collection_name: str, doc_id) -> bool:
+        return self.collections[collection_name].pop(doc_id, None) is not None
+
+    @staticmethod
+    def _get_keyset_page(docs, sort_fields: list, descending: bool, cursor_values, backwards: bool, limit: int, encode_cursor) -> dict:
+        """Same contract as DatabaseManager._get_keyset_page; all sort fields share one direction."""
+        sort_key = lambda doc: tuple(doc[field] for field in sort_fields)
+        ordered = sorted(docs, key=sort_key, reverse=descending != backwards)
+        if cursor_values is not None:
+            cursor_key = tuple(cursor_values)
+            if descending != backwards:
+                ordered = [doc for doc in ordered if sort_key(doc) < cursor_key]
+            else:
+                ordered = [doc for doc in ordered if sort_key(doc) > cursor_key]
+        has_more = len(ordered) > limit
+        items = [dict(doc) for doc in ordered[:limit]]
+        if backwards:
+            items.reverse()
+        return {
+            "items": items,
+            "has_prev": has_more if backwards else cursor_values is not None,
+            "has_next": True if backwards else has_more,
+            "prev_cursor": encode_cursor(items[0]) if items else "",
+            "next_cursor": encode_cursor(items[-1]) if items else "",
+        }
+
+    def _purge_expired(self):
+        """Applies RETENTION_POLICIES the way MongoDB's TTL monitor would."""
+        now = datetime.utcnow()
+        for collection_name, (field, seconds) in RETENTION_POLICIES.items():
+            if seconds <= 0: continue
+            threshold = now - timedelta(seconds=seconds)
+            collection = self.collections[collection_name]
+            expired = [doc_id for doc_id, doc in collection.items() if isinstance(doc.get(field), datetime) and doc[field] < threshold]
+            for doc_id in expired:
+                del collection[doc_id]
+
+    # --- Texts ---
+    async def get_text(self, text_id: str) -> str: return TEXTS_CACHE.get(text_id, f"[{text_id}]")
+
+    async def update_text(self, text_id: str, new_text: str):
+        if not self.is_connected(): return
+        self.collections[COLLECTION_TEXTS][text_id] = {"_id": text_id, "text": new_text}
+        TEXTS_CACHE[text_id] = new_text
+        if text_id == REJECTION_TEXT_ID: self._rebuild_media_policy()
+
+    async def get_all_editable_texts(self):
+        if not self.is_connected(): return []
+        return sorted(self.collections[COLLECTION_TEXTS])
+
+    # --- Users and audience ---
+    async def add_user(self, user) -> bool:
+        if not self.is_connected(): return False
+        user_data = {'first_name': user.first_name or "", 'last_name': getattr(user, 'last_name', "") or "", 'username': user.username or ""}
+        users = self.collections[COLLECTION_USERS]
+        is_new = user.id not in users
+        doc = users.setdefault(user.id, {"_id": user.id, "joined_at": datetime.utcnow()})
+        doc.update(user_data)
+        doc.pop("inactive", None)
+        doc.pop("inactive_since", None)
+        if is_new:
+            self.stats_counters["total_users"] += 1
+        return is_new
+
+    async def record_user_activity(self, user_id: int):
+        if not self.is_connected(): return
+        doc = self.collections[COLLECTION_USERS].get(user_id)
+        if doc:
+            doc["last_active_at"] = datetime.utcnow()
+            doc.pop("inactive", None)
+            doc.pop("inactive_since", None)
+
+    async def flush_user_profiles(self):
+        # Profile updates are applied immediately in memory, there is nothing to flush
+        return
+
+    async def tag_users(self, user_ids: list, tag: str) -> int:
+        if not self.is_connected(): return 0
+        docs = [self.collections[COLLECTION_USERS][user_id] for user_id in user_ids if user_id in self.collections[COLLECTION_USERS]]
+        for doc in docs:
+            tags = doc.setdefault("tags", [])
+            if tag not in tags:
+                tags.append(tag)
+        return len(docs)
+
+    async def untag_users(self, user_ids: list, tag: str) -> int:
+        if not self.is_connected(): return 0
+        docs = [self.collections[COLLECTION_USERS][user_id] for user_id in user_ids if user_id in self.collections[COLLECTION_USERS]]
+        for doc in docs:
+            if tag in doc.get("tags", []):
+                doc["tags"].remove(tag)
+        return len(docs)
+
+    async def iter_audience(self, batch_size: int = 500, after_user_id: int = None, segment: dict = None):
+        if not self.is_connected(): return
+        batch = []
+        users = self.collections[COLLECTION_USERS]
+        for user_id in sorted(users):
+            if not self._in_audience(users[user_id], segment) or (after_user_id is not None and user_id <= after_user_id): continue
+            batch.append(user_id)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def get_audience_count(self, segment: dict = None) -> int:
+        if not self.is_connected(): return 0
+        return sum(1 for doc in self.collections[COLLECTION_USERS].values() if self._in_audience(doc, segment))
+
+    async def get_join_tracking_start(self):
+        if not self.is_connected(): return None
+        return min((doc["joined_at"] for doc in self.collections[COLLECTION_USERS].values() if doc.get("joined_at", JOIN_DATE_UNKNOWN) > JOIN_DATE_UNKNOWN), default=None)
+
+    def _in_audience(self, doc: dict, segment: dict = None) -> bool:
+        if doc["_id"] in self.banned_user_ids or doc.get("inactive"): return False
+        segment = segment or {}
+        if segment.get("joined_after") and not (doc.get("joined_at") and doc["joined_at"] >= segment["joined_after"]): return False
+        if segment.get("active_after") and not (doc.get("last_active_at") and doc["last_active_at"] >= segment["active_after"]): return False
+        if segment.get("has_username") and not doc.get("username"): return False
+        if segment.get("tag") and segment["tag"] not in doc.get("tags", []): return False
+        return True
+
+    async def mark_users_unreachable(self, user_ids: list):
+        if not self.is_connected(): return
+        now = datetime.utcnow()
+        for user_id in user_ids:
+            doc = self.collections[COLLECTION_USERS].get(user_id)
+            if doc:
+                doc.update({"inactive": True, "inactive_since": now})
+
+    # --- Settings ---
+    async def get_antiflood_settings(self) -> dict: return self.settings_cache.get(SETTING_ANTIFLOOD, {})
+
+    async def update_antiflood_setting(self, key: str, value):
+        if not self.is_connected(): return
+        valid_keys = ["enabled", "rate_limit", "time_window", "mute_duration"]
+        if key not in valid_keys: return
+        self._set_setting_field(SETTING_ANTIFLOOD, key, value)
+        self.settings_cache.setdefault(SETTING_ANTIFLOOD, {})[key] = value
+
+    async def get_security_settings(self) -> dict: return self.settings_cache.get(SETTING_SECURITY, {})
+
+    async def toggle_bot_status(self):
+        if not self.is_connected(): return
+        current_settings = await self.get_security_settings()
+        new_status = "inactive" if current_settings.get("bot_status", "active") == "active" else "active"
+        self._set_setting_field(SETTING_SECURITY, "bot_status", new_status)
+        self.settings_cache.setdefault(SETTING_SECURITY, {})["bot_status"] = new_status
+        return new_status
+
+    async def toggle_media_blocking(self, media_type: str):
+        if not self.is_connected(): return
+        valid_keys = ["photo", "video", "link", "sticker", "document", "audio", "voice"]
+        if media_type not in valid_keys: return None
+        current_settings = await self.get_security_settings()
+        new_blocked_status = not current_settings.get("blocked_media", {}).get(media_type, False)
+        security_doc = self.collections[COLLECTION_SETTINGS].setdefault(SETTING_SECURITY, {"_id": SETTING_SECURITY})
+        security_doc.setdefault("blocked_media", {})[media_type] = new_blocked_status
+        self.settings_cache.setdefault(SETTING_SECURITY, {}).setdefault("blocked_media", {})[media_type] = new_blocked_status
+        self._rebuild_media_policy()
+        return new_blocked_status
+
+    async def set_allowed_link_domains(self, domains: list):
+        if not self.is_connected(): return
+        self._set_setting_field(SETTING_SECURITY, "allowed_link_domains", list(domains))
+        self.settings_cache.setdefault(SETTING_SECURITY, {})["allowed_link_domains"] = list(domains)
+        self._rebuild_media_policy()
+
+    def _rebuild_media_policy(self):
+        MEDIA_POLICY.rebuild(self.settings_cache.get(SETTING_SECURITY, {}), TEXTS_CACHE.get(REJECTION_TEXT_ID, ""))
+
+    async def get_timezone(self) -> dict:
+        default = {"identifier": "Asia/Riyadh", "display_name": "بتوقيت الرياض"}
+        return self.settings_cache.get(SETTING_TIMEZONE, default)
+
+    async def set_timezone(self, identifier: str, display_name: str):
+        if not self.is_connected(): return
+        self.collections[COLLECTION_SETTINGS][SETTING_TIMEZONE] = {"_id": SETTING_TIMEZONE, "identifier": identifier, "display_name": display_name}
+        self.settings_cache[SETTING_TIMEZONE] = {"identifier": identifier, "display_name": display_name}
+
+    # --- Force subscribe ---
+    async def get_subscription_channels(self) -> list[str]: return self.settings_cache.get("subscription_channels", [])
+
+    async def get_force_subscribe_status(self) -> bool:
+        force_subscribe_settings = self.settings_cache.get(SETTING_FORCE_SUBSCRIBE, {})
+        return force_subscribe_settings.get("enabled", True)
+
+    async def toggle_force_subscribe_status(self):
+        if not self.is_connected(): return
+        new_status = not await self.get_force_subscribe_status()
+        self._set_setting_field(SETTING_FORCE_SUBSCRIBE, "enabled", new_status)
+        self.settings_cache.setdefault(SETTING_FORCE_SUBSCRIBE, {})["enabled"] = new_status
+        return new_status
+
+    async def add_subscription_channel(self, channel_id: int, channel_title: str, username: str):
+        if not self.is_connected(): return
+        channels = self.collections[COLLECTION_SUBSCRIPTION_CHANNELS]
+        doc_id = self._find_id(channels, "channel_id", channel_id) or ObjectId()
+        channels.setdefault(doc_id, {"_id": doc_id, "channel_id": channel_id}).update({"title": channel_title, "username": username})
+        self._reload_subscription_channels_cache()
+
+    async def delete_subscription_channel(self, db_id: str):
+        if not self.is_connected(): return False
+        object_id = self._parse_object_id(db_id, "subscription channel")
+        if object_id is None: return False
+        deleted = self._delete(COLLECTION_SUBSCRIPTION_CHANNELS, object_id)
+        if deleted:
+            self._reload_subscription_channels_cache()
+        return deleted
+
+    async def get_all_subscription_channels_docs(self):
+        if not self.is_connected(): return []
+        return [dict(doc) for doc in self.collections[COLLECTION_SUBSCRIPTION_CHANNELS].values()]
+
+    def _reload_subscription_channels_cache(self):
+        channels = self.collections[COLLECTION_SUBSCRIPTION_CHANNELS].values()
+        self.settings_cache['subscription_channels'] = [ch["username"] for ch in channels if ch.get("username")]
+
+    # --- Bans and anti-flood ---
+    async def ban_user(self, user_id: int):
+        if not self.is_connected() or user_id in self.banned_user_ids: return False
+        self.collections[COLLECTION_BANNED_USERS][user_id] = {"_id": user_id, "ban_date": datetime.utcnow()}
+        self.banned_user_ids.add(user_id)
+        return True
+
+    async def unban_user(self, user_id: int):
+        if not self.is_connected(): return False
+        self.banned_user_ids.discard(user_id)
+        return self._delete(COLLECTION_BANNED_USERS, user_id)
+
+    async def is_user_banned(self, user_id: int) -> bool:
+        return user_id in self.banned_user_ids
+
+    async def refresh_ban_index(self):
+        if not self.is_connected(): return
+        self.banned_user_ids = set(self.collections[COLLECTION_BANNED_USERS])
+
+    async def get_banned_users(self, cursor: str = None, backwards: bool = False, limit: int = 10) -> dict:
+        if not self.is_connected(): return DatabaseManager._empty_page()
+        return self._get_keyset_page(
+            self.collections[COLLECTION_BANNED_USERS].values(), ["_id"], False, DatabaseManager._decode_int_cursor(cursor), backwards, limit,
+            encode_cursor=lambda doc: str(doc['_id'])
+        )
+
+    async def record_antiflood_violation(self, user_id: int, reset_after_hours: int = 1) -> int:
+        if not self.is_connected(): return 0
+        now = datetime.utcnow()
+        # Keyed by user_id: this collection is only ever looked up by user
+        violations = self.collections[COLLECTION_ANTIFLOOD_VIOLATIONS]
+        doc = violations.setdefault(user_id, {"_id": user_id, "user_id": user_id})
+        last_violation = doc.get("last_violation")
+        if last_violation and last_violation >= now - timedelta(hours=reset_after_hours):
+            doc["count"] = doc.get("count", 0) + 1
+        else:
+            doc["count"] = 1
+        doc["last_violation"] = now
+        return doc["count"]
+
+    async def mute_user(self, user_id: int, mute_until: datetime):
+        if not self.is_connected(): return
+        violations = self.collections[COLLECTION_ANTIFLOOD_VIOLATIONS]
+        violations.setdefault(user_id, {"_id": user_id, "user_id": user_id})["mute_until"] = mute_until
+
+    async def get_active_mutes(self) -> dict:
+        if not self.is_connected(): return {}
+        now = datetime.utcnow()
+        return {doc["user_id"]: doc["mute_until"] for doc in self.collections[COLLECTION_ANTIFLOOD_VIOLATIONS].values() if doc.get("mute_until") and doc["mute_until"] > now}
+
+    # --- Scheduled posts ---
+    async def add_scheduled_post(self, job_id: str, message_data: dict, target_channels: list, run_date: datetime):
+        if not self.is_connected(): return
+        self.collections[COLLECTION_SCHEDULED_POSTS][job_id] = {"_id": job_id, "message_data": message_data, "target_channels": target_channels, "run_date": run_date, "status": "pending"}
+
+    async def get_scheduled_posts(self, cursor: str = None, backwards: bool = False, limit: int = 10) -> dict:
+        if not self.is_connected(): return DatabaseManager._empty_page()
+        pending = [doc for doc in self.collections[COLLECTION_SCHEDULED_POSTS].values() if doc.get("status") == "pending"]
+        return self._get_keyset_page(
+            pending, ["run_date", "_id"], False, DatabaseManager._decode_scheduled_post_cursor(cursor), backwards, limit,
+            encode_cursor=DatabaseManager._encode_scheduled_post_cursor
+        )
+
+    async def delete_scheduled_post(self, job_id: str):
+        if not self.is_connected(): return False
+        return self._delete(COLLECTION_SCHEDULED_POSTS, job_id)
+
+    async def get_scheduled_post(self, job_id: str):
+        if not self.is_connected(): return None
+        doc = self.collections[COLLECTION_SCHEDULED_POSTS].get(job_id)
+        return copy.deepcopy(doc) if doc else None
+
+    async def get_upcoming_scheduled_posts(self, after: datetime, until: datetime) -> list:
+        if not self.is_connected(): return []
+        upcoming = [
+            {"_id": doc["_id"], "run_date": doc["run_date"]} for doc in self.collections[COLLECTION_SCHEDULED_POSTS].values()
+            if doc.get("status") == "pending" and after < doc["run_date"] <= until
+        ]
+        return sorted(upcoming, key=lambda doc: (doc["run_date"], doc["_id"]))
+
+    async def get_due_scheduled_posts(self, after: datetime, until: datetime) -> list:
+        if not self.is_connected(): return []
+        due = [
+            copy.deepcopy(doc) for doc in self.collections[COLLECTION_SCHEDULED_POSTS].values()
+            if doc.get("status") == "pending" and after < doc["run_date"] <= until
+        ]
+        return sorted(due, key=lambda doc: (doc["run_date"], doc["_id"]))
+
+    async def expire_overdue_scheduled_posts(self, before: datetime) -> int:
+        if not self.is_connected(): return 0
+        now = datetime.utcnow()
+        overdue = [doc for doc in self.collections[COLLECTION_SCHEDULED_POSTS].values() if doc.get("status") == "pending" and doc["run_date"] <= before]
+        for doc in overdue:
+            doc.update({"status": "done", "done_at": now})
+        return len(overdue)
+
+    async def mark_scheduled_post_as_done(self, job_id: str):
+        if not self.is_connected(): return
+        doc = self.collections[COLLECTION_SCHEDULED_POSTS].get(job_id)
+        if doc:
+            doc.update({"status": "done", "done_at": datetime.utcnow()})
+
+    # --- Broadcast jobs ---
+    async def create_broadcast_job(self, job_id: str, message_to_send: dict, total: int, progress_chat_id: int, progress_message_id: int, segment: dict = None):
+        if not self.is_connected(): return
+        self.collections[COLLECTION_BROADCAST_JOBS][job_id] = {
+            "_id": job_id, "message_to_send": dict(message_to_send), "segment": dict(segment or {}), "status": BROADCAST_JOB_QUEUED,
+            "total": total, "success": 0, "failed": 0, "cursor": None,
+            "progress_chat_id": progress_chat_id, "progress_message_id": progress_message_id, "created_at": datetime.utcnow()
+        }
+
+    async def get_broadcast_job(self, job_id: str):
+        if not self.is_connected(): return None
+        doc = self.collections[COLLECTION_BROADCAST_JOBS].get(job_id)
+        return copy.deepcopy(doc) if doc else None
+
+    async def get_unfinished_broadcast_jobs(self) -> list:
+        if not self.is_connected(): return []
+        jobs = [copy.deepcopy(doc) for doc in self.collections[COLLECTION_BROADCAST_JOBS].values() if doc.get("status") in (BROADCAST_JOB_QUEUED, BROADCAST_JOB_RUNNING, BROADCAST_JOB_PAUSED)]
+        return sorted(jobs, key=lambda doc: doc["created_at"])
+
+    async def claim_next_broadcast_job(self, worker_id: str, lease_seconds: int):
+        if not self.is_connected(): return None
+        now = datetime.utcnow()
+        expired = now - timedelta(seconds=lease_seconds)
+        claimable = [
+            doc for doc in self.collections[COLLECTION_BROADCAST_JOBS].values()
+            if doc["status"] == BROADCAST_JOB_QUEUED or (doc["status"] == BROADCAST_JOB_RUNNING and doc.get("heartbeat_at", now) < expired)
+        ]
+        if not claimable: return None
+        doc = min(claimable, key=lambda doc: doc["created_at"])
+        doc.update({"status": BROADCAST_JOB_RUNNING, "worker_id": worker_id, "heartbeat_at": now})
+        return copy.deepcopy(doc)
+
+    async def save_broadcast_progress(self, job_id: str, worker_id: str, cursor: int, success: int, failed: int):
+        if not self.is_connected(): return None
+        doc = self.collections[COLLECTION_BROADCAST_JOBS].get(job_id)
+        if not doc or doc.get("worker_id") != worker_id: return None
+        doc.update({"cursor": cursor, "success": success, "failed": failed, "heartbeat_at": datetime.utcnow()})
+        return doc["status"]
+
+    async def release_broadcast_job(self, job_id: str, worker_id: str):
+        if not self.is_connected(): return
+        doc = self.collections[COLLECTION_BROADCAST_JOBS].get(job_id)
+        if doc and doc["status"] == BROADCAST_JOB_RUNNING and doc.get("worker_id") == worker_id:
+            doc["status"] = BROADCAST_JOB_QUEUED
+
+    async def set_broadcast_job_status(self, job_id: str, status: str, expected: tuple = None, worker_id: str = None) -> bool:
+        if not self.is_connected(): return False
+        doc = self.collections[COLLECTION_BROADCAST_JOBS].get(job_id)
+        if not doc: return False
+        if expected is not None and doc["status"] not in expected: return False
+        if worker_id is not None and doc.get("worker_id") != worker_id: return False
+        doc["status"] = status
+        if status in (BROADCAST_JOB_DONE, BROADCAST_JOB_CANCELLED):
+            doc["finished_at"] = datetime.utcnow()
+        return True
+
+    # --- Publishing channels and the auto publication message ---
+    async def get_publishing_channels(self, cursor: str = None, backwards: bool = False, limit: int = 10) -> dict:
+        if not self.is_connected(): return DatabaseManager._empty_page()
+        return self._get_keyset_page(
+            self.collections[COLLECTION_PUBLISHING_CHANNELS].values(), ["_id"], False, DatabaseManager._decode_object_id_cursor(cursor), backwards, limit,
+            encode_cursor=lambda doc: str(doc['_id'])
+        )
+
+    async def get_all_publishing_channels(self):
+        if not self.is_connected(): return []
+        return [dict(doc) for doc in self.collections[COLLECTION_PUBLISHING_CHANNELS].values()]
+
+    async def add_publishing_channel(self, channel_id: int, channel_title: str):
+        if not self.is_connected(): return None
+        channels = self.collections[COLLECTION_PUBLISHING_CHANNELS]
+        doc_id = self._find_id(channels, "channel_id", channel_id) or ObjectId()
+        channels.setdefault(doc_id, {"_id": doc_id, "channel_id": channel_id})["title"] = channel_title
+
+    async def delete_publishing_channel(self, db_id: str):
+        if not self.is_connected(): return False
+        object_id = self._parse_object_id(db_id, "publishing channel")
+        return object_id is not None and self._delete(COLLECTION_PUBLISHING_CHANNELS, object_id)
+
+    async def get_auto_publication_message(self):
+        if not self.is_connected(): return None
+        doc = self.collections[COLLECTION_SETTINGS].get(SETTING_AUTO_PUBLICATION_MESSAGE)
+        return doc.get("message") if doc else None
+
+    async def set_auto_publication_message(self, message_data: dict):
+        if not self.is_connected(): return
+        self._set_setting_field(SETTING_AUTO_PUBLICATION_MESSAGE, "message", message_data)
+
+    async def delete_auto_publication_message(self):
+        if not self.is_connected(): return False
+        return self._delete(COLLECTION_SETTINGS, SETTING_AUTO_PUBLICATION_MESSAGE)
+
+    # --- Message links (admin replies) ---
+    async def log_message_link(self, admin_message_id: int, user_id: int, user_message_id: int):
+        if not self.is_connected(): return
+        self.collections[COLLECTION_MESSAGE_LINKS][admin_message_id] = {"_id": admin_message_id, "user_id": user_id, "user_message_id": user_message_id, "created_at": datetime.utcnow()}
+
+    async def get_message_link_info(self, admin_message_id: int):
+        if not self.is_connected(): return None
+        doc = self.collections[COLLECTION_MESSAGE_LINKS].get(admin_message_id)
+        return dict(doc) if doc else None
+
+    # --- Auto replies ---
+    async def find_auto_reply_by_keyword(self, keyword: str):
+        if not self.is_connected(): return None
+        reply_id = self._auto_reply_ids_by_keyword.get(keyword.lower())
+        return dict(self.collections[COLLECTION_AUTO_REPLIES][reply_id]) if reply_id is not None else None
+
+    async def add_auto_reply(self, keyword: str, message: dict):
+        if not self.is_connected(): return
+        keyword_lower = keyword.lower()
+        reply_id = self._auto_reply_ids_by_keyword.get(keyword_lower)
+        if reply_id is None:
+            reply_id = self._auto_reply_ids_by_keyword[keyword_lower] = ObjectId()
+            self.stats_counters["auto_replies"] += 1
+        self.collections[COLLECTION_AUTO_REPLIES][reply_id] = {"_id": reply_id, "keyword": keyword, "keyword_lower": keyword_lower, "message": message}
+
+    async def get_auto_replies(self, cursor: str = None, backwards: bool = False, limit: int = 10) -> dict:
+        if not self.is_connected(): return DatabaseManager._empty_page()
+        return self._get_keyset_page(
+            self.collections[COLLECTION_AUTO_REPLIES].values(), ["_id"], False, DatabaseManager._decode_object_id_cursor(cursor), backwards, limit,
+            encode_cursor=lambda doc: str(doc['_id'])
+        )
+
+    async def delete_auto_reply(self, reply_id: str):
+        if not self.is_connected(): return False
+        object_id = self._parse_object_id(reply_id, "auto reply")
+        if object_id is None: return False
+        doc = self.collections[COLLECTION_AUTO_REPLIES].pop(object_id, None)
+        if doc is None: return False
+        self._auto_reply_ids_by_keyword.pop(doc["keyword_lower"], None)
+        self.stats_counters["auto_replies"] -= 1
+        return True
+
+    # --- Reminders ---
+    async def add_reminder(self, text: str):
+        if not self.is_connected(): return
+        reminder_id = ObjectId()
+        self.collections[COLLECTION_REMINDERS][reminder_id] = {"_id": reminder_id, "text": text}
+        self.stats_counters["reminders"] += 1
+
+    async def get_reminders(self, cursor: str = None, backwards: bool = False, limit: int = 10) -> dict:
+        if not self.is_connected(): return DatabaseManager._empty_page()
+        return self._get_keyset_page(
+            self.collections[COLLECTION_REMINDERS].values(), ["_id"], False, DatabaseManager._decode_object_id_cursor(cursor), backwards, limit,
+            encode_cursor=lambda doc: str(doc['_id'])
+        )
+
+    async def delete_reminder(self, reminder_id: str):
+        if not self.is_connected(): return False
+        object_id = self._parse_object_id(reminder_id, "reminder")
+        if object_id is None or not self._delete(COLLECTION_REMINDERS, object_id): return False
+        self.stats_counters["reminders"] -= 1
+        return True
+
+    async def get_random_reminder(self) -> str:
+        reminders = self.collections.get(COLLECTION_REMINDERS)
+        if not reminders: return "لا توجد أذكار حالياً."
+        return random.choice(list(reminders.values())).get("text", "لا توجد أذكار حالياً.")
+
+    # --- Library ---
+    async def add_to_library(self, message: dict):
+        if not self.is_connected(): return
+        item_id = ObjectId()
+        self.collections[COLLECTION_LIBRARY][item_id] = {"_id": item_id, "message": message, "added_date": datetime.utcnow()}
+
+    async def get_library_items(self, cursor: str = None, backwards: bool = False, limit: int = 5) -> dict:
+        if not self.is_connected(): return DatabaseManager._empty_page()
+        return self._get_keyset_page(
+            self.collections[COLLECTION_LIBRARY].values(), ["_id"], True, DatabaseManager._decode_object_id_cursor(cursor), backwards, limit,
+            encode_cursor=lambda doc: str(doc['_id'])
+        )
+
+    async def delete_library_item(self, item_id: str):
+        if not self.is_connected(): return False
+        object_id = self._parse_object_id(item_id, "library item")
+        return object_id is not None and self._delete(COLLECTION_LIBRARY, object_id)
+
+    # --- Statistics and monitoring ---
+    async def get_estimated_count(self, collection_name: str) -> int:
+        return len(self.collections.get(collection_name, {}))
+
+    async def reconcile_statistics(self):
+        if not self.is_connected(): return
+        self._purge_expired()
+        self.stats_counters = {
+            "total_users": len(self.collections[COLLECTION_USERS]),
+            "auto_replies": len(self.collections[COLLECTION_AUTO_REPLIES]),
+            "reminders": len(self.collections[COLLECTION_REMINDERS])
+        }
+
+    async def get_bot_statistics(self) -> dict:
+        return {
+            "total_users": self.stats_counters["total_users"],
+            "banned_users": len(self.banned_user_ids),
+            "auto_replies": self.stats_counters["auto_replies"],
+            "reminders": self.stats_counters["reminders"]
+        }
+
+    def _collection_size_bytes(self, collection_name: str) -> int:
+        # Approximates MongoDB's dataSize with the BSON size of every document
+        return sum(len(bson.encode(doc)) for doc in self.collections[collection_name].values())
+
+    async def get_db_stats(self) -> dict:
+        total_size_mb = float(os.getenv("MONGO_DB_TOTAL_SIZE_MB", 512.0))
+        if not self.is_connected():
+            return {'used_mb': 0, 'total_mb': total_size_mb, 'remaining_mb': total_size_mb}
+        used_mb = sum(self._collection_size_bytes(name) for name in self.collections) / (1024 * 1024)
+        return {'used_mb': used_mb, 'total_mb': total_size_mb, 'remaining_mb': total_size_mb - used_mb}
+
+    async def get_collections_storage_stats(self) -> list:
+        if not self.is_connected(): return []
+        results = [{
+            "name": name,
+            "count": len(self.collections[name]),
+            "size_mb": self._collection_size_bytes(name) / (1024 * 1024),
+            "retention_seconds": RETENTION_POLICIES.get(name, (None, 0))[1],
+        } for name in ALL_COLLECTIONS]
+        return sorted(results, key=lambda item: item["size_mb"], reverse=True)
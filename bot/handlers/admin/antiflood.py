@@ -5,6 +5,10 @@ from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 
 from bot.database.manager import db
+from bot.core.flood_control import FLOOD_RING_MAX_CAPACITY
+
+# Accepted range of each editable setting (rate_limit in messages, time_window in seconds, mute_duration in minutes)
+ANTIFLOOD_SETTING_RANGES = {"rate_limit": (1, FLOOD_RING_MAX_CAPACITY), "time_window": (1, 3600), "mute_duration": (1, 43200)}
 
 # --- FSM States ---
 class EditAntiFlood(StatesGroup):
@@ -70,6 +74,10 @@ async def new_value_received(message: types.Message, state: FSMContext):
     data = await state.get_data()
     setting_key = data['setting_key']
     new_value = int(message.text)
+    min_value, max_value = ANTIFLOOD_SETTING_RANGES.get(setting_key, (1, FLOOD_RING_MAX_CAPACITY))
+    if not min_value <= new_value <= max_value:
+        await message.answer((await db.get_text("af_value_out_of_range")).format(min=min_value, max=max_value))
+        return
     
     # Save the new setting to the database
     await db.update_antiflood_setting(setting_key, new_value)
@@ -8,7 +8,7 @@ from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.utils.callback_data import CallbackData
 from aiogram.utils.markdown import escape_md
 
-from bot.database.manager import db
+from bot.database.manager import db, COLLECTION_AUTO_REPLIES
 
 # --- FSM States for adding and importing replies ---
 class AddReply(StatesGroup):
@@ -19,7 +19,8 @@ class ImportReplies(StatesGroup):
     waiting_for_file = State()
 
 # --- CallbackData for pagination and deletion ---
-pagination_cb = CallbackData("ar_page", "page")
+# المؤشر (key) هو مفتاح أول/آخر عنصر في الصفحة الحالية، و page للعرض فقط
+pagination_cb = CallbackData("ar_page", "dir", "key", "page")
 delete_cb = CallbackData("ar_delete", "id")
 
 # --- 1. Main Menu for Auto Replies ---
@@ -37,22 +38,24 @@ async def show_auto_replies_menu(call: types.CallbackQuery, state: FSMContext):
     await call.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
     await call.answer()
 
-# --- 2. View All Replies (with Pagination) ---
+# --- 2. View All Replies (with Keyset Pagination) ---
 async def view_replies(call: types.CallbackQuery, callback_data: dict = None):
     """Displays a paginated list of all auto-replies."""
+    cursor = callback_data.get("key") if callback_data else None
+    backwards = callback_data.get("dir") == "prev" if callback_data else False
     page = int(callback_data.get("page", 1)) if callback_data else 1
     
     REPLIES_PER_PAGE = 10
-    total_replies = await db.get_auto_replies_count()
-    if total_replies == 0:
+    result = await db.get_auto_replies(cursor=cursor, backwards=backwards, limit=REPLIES_PER_PAGE)
+    replies = result["items"]
+    if not replies:
         await call.answer(await db.get_text("ar_no_replies"), show_alert=True)
         return
 
-    total_pages = math.ceil(total_replies / REPLIES_PER_PAGE)
+    total_replies = await db.get_estimated_count(COLLECTION_AUTO_REPLIES)
+    total_pages = max(math.ceil(total_replies / REPLIES_PER_PAGE), page)
     page_info = (await db.get_text("ar_page_info")).format(current_page=page, total_pages=total_pages)
     
-    replies = await db.get_auto_replies(page=page, limit=REPLIES_PER_PAGE)
-    
     keyboard = types.InlineKeyboardMarkup(row_width=1)
     
     for reply in replies:
@@ -63,15 +66,15 @@ async def view_replies(call: types.CallbackQuery, callback_data: dict = None):
         ))
 
     pagination_buttons = []
-    if page > 1:
+    if result["has_prev"]:
         pagination_buttons.append(types.InlineKeyboardButton(
             text=await db.get_text("ar_prev_button"),
-            callback_data=pagination_cb.new(page=page - 1)
+            callback_data=pagination_cb.new(dir="prev", key=result["prev_cursor"], page=page - 1)
         ))
-    if page < total_pages:
+    if result["has_next"]:
         pagination_buttons.append(types.InlineKeyboardButton(
             text=await db.get_text("ar_next_button"),
-            callback_data=pagination_cb.new(page=page + 1)
+            callback_data=pagination_cb.new(dir="next", key=result["next_cursor"], page=page + 1)
         ))
     
     keyboard.row(*pagination_buttons)
@@ -6,7 +6,7 @@ from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.utils.callback_data import CallbackData
 
-from bot.database.manager import db
+from bot.database.manager import db, COLLECTION_BANNED_USERS
 
 # --- FSM States ---
 class BanUser(StatesGroup):
@@ -16,7 +16,7 @@ class UnbanUser(StatesGroup):
     waiting_for_user_id = State()
 
 # --- CallbackData ---
-bm_pagination_cb = CallbackData("bm_page", "page")
+bm_pagination_cb = CallbackData("bm_page", "dir", "key", "page")
 bm_unban_cb = CallbackData("bm_unban", "id")
 
 # --- 1. Main Menu for Ban Management ---
@@ -83,19 +83,21 @@ async def unban_user_id_received(message: types.Message, state: FSMContext):
 
 # --- 4. View Banned Users ---
 async def view_banned_users(call: types.CallbackQuery, callback_data: dict = None):
+    cursor = callback_data.get("key") if callback_data else None
+    backwards = callback_data.get("dir") == "prev" if callback_data else False
     page = int(callback_data.get("page", 1)) if callback_data else 1
     
     USERS_PER_PAGE = 10
-    total_users = await db.get_banned_users_count()
-    if total_users == 0:
+    result = await db.get_banned_users(cursor=cursor, backwards=backwards, limit=USERS_PER_PAGE)
+    banned_users = result["items"]
+    if not banned_users:
         await call.answer(await db.get_text("bm_no_banned_users"), show_alert=True)
         return
 
-    total_pages = math.ceil(total_users / USERS_PER_PAGE)
+    total_users = await db.get_estimated_count(COLLECTION_BANNED_USERS)
+    total_pages = max(math.ceil(total_users / USERS_PER_PAGE), page)
     page_info = (await db.get_text("ar_page_info")).format(current_page=page, total_pages=total_pages)
     
-    banned_users = await db.get_banned_users(page=page, limit=USERS_PER_PAGE)
-    
     keyboard = types.InlineKeyboardMarkup()
     text = f"📖 *قائمة المستخدمين المحظورين* ({page_info})\n\n"
     for user in banned_users:
@@ -107,8 +109,8 @@ async def view_banned_users(call: types.CallbackQuery, callback_data: dict = Non
         ))
 
     pagination_buttons = []
-    if page > 1: pagination_buttons.append(types.InlineKeyboardButton(text=await db.get_text("ar_prev_button"), callback_data=bm_pagination_cb.new(page=page-1)))
-    if page < total_pages: pagination_buttons.append(types.InlineKeyboardButton(text=await db.get_text("ar_next_button"), callback_data=bm_pagination_cb.new(page=page+1)))
+    if result["has_prev"]: pagination_buttons.append(types.InlineKeyboardButton(text=await db.get_text("ar_prev_button"), callback_data=bm_pagination_cb.new(dir="prev", key=result["prev_cursor"], page=page-1)))
+    if result["has_next"]: pagination_buttons.append(types.InlineKeyboardButton(text=await db.get_text("ar_next_button"), callback_data=bm_pagination_cb.new(dir="next", key=result["next_cursor"], page=page+1)))
     
     keyboard.row(*pagination_buttons)
     keyboard.add(types.InlineKeyboardButton(text=await db.get_text("ar_back_button"), callback_data="admin:ban_management"))
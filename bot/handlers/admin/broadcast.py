@@ -1,24 +1,37 @@
 # -*- coding: utf-8 -*-
 
-import asyncio
+import re
+from datetime import datetime
 from aiogram import types, Dispatcher
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
-from aiogram.utils.exceptions import BotBlocked, ChatNotFound, UserDeactivated, TelegramAPIError
+from aiogram.utils.exceptions import TelegramAPIError
 
-from bot.database.manager import db
+from bot.database.manager import db, BROADCAST_JOB_QUEUED, BROADCAST_JOB_RUNNING, BROADCAST_JOB_PAUSED
+from bot.core.broadcast_jobs import broadcast_jobs, bc_job_cb, render_job, resolve_segment, SEGMENT_DATE_FORMAT
 
 # --- FSM States ---
 class Broadcast(StatesGroup):
     waiting_for_message = State()
     waiting_for_confirmation = State()
+    waiting_for_segment_value = State()
+
+class TagUsers(StatesGroup):
+    waiting_for_tagging = State()
+
+# Tags are short single words: letters, digits, '_' and '-'
+TAG_PATTERN = re.compile(r"^[\w-]{1,32}$")
 
 # --- 1. Start Broadcast Flow ---
 async def broadcast_start(call: types.CallbackQuery, state: FSMContext):
     """Starts the broadcast process by asking for the message."""
     await state.finish()
     text = await db.get_text("bc_ask_for_message")
-    keyboard = types.InlineKeyboardMarkup().add(types.InlineKeyboardButton(text=await db.get_text("ar_back_button"), callback_data="admin:panel:back"))
+    keyboard = types.InlineKeyboardMarkup(row_width=1).add(
+        types.InlineKeyboardButton(text=await db.get_text("bc_jobs_button"), callback_data="bc:jobs"),
+        types.InlineKeyboardButton(text=await db.get_text("bc_tag_users_button"), callback_data="bc:tag_users"),
+        types.InlineKeyboardButton(text=await db.get_text("ar_back_button"), callback_data="admin:panel:back")
+    )
     await call.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
     await Broadcast.waiting_for_message.set()
     await call.answer()
@@ -26,26 +39,102 @@ async def broadcast_start(call: types.CallbackQuery, state: FSMContext):
 async def broadcast_message_received(message: types.Message, state: FSMContext):
     """Receives the message and asks for confirmation."""
     await state.update_data(
-        message_to_send={'chat_id': message.chat.id, 'message_id': message.message_id}
+        message_to_send={'chat_id': message.chat.id, 'message_id': message.message_id},
+        segment={}
     )
-    
-    users_count = len(await db.get_all_users())
-    text = (await db.get_text("bc_confirmation")).format(count=users_count)
-    
+    await show_confirmation(message, state)
+
+async def describe_segment(spec: dict) -> str:
+    parts = []
+    if spec.get("joined_after"):
+        parts.append((await db.get_text("bc_seg_joined_after")).format(date=spec["joined_after"]))
+    if spec.get("active_within_days"):
+        parts.append((await db.get_text("bc_seg_active_within")).format(days=spec["active_within_days"]))
+    if spec.get("has_username"):
+        parts.append(await db.get_text("bc_seg_has_username"))
+    if spec.get("tag"):
+        parts.append((await db.get_text("bc_seg_tagged")).format(tag=spec["tag"]))
+    if not parts:
+        return await db.get_text("bc_segment_all")
+    return await db.get_text("bc_segment_title") + "\n" + "\n".join(f"▪️ {part}" for part in parts)
+
+async def show_confirmation(message: types.Message, state: FSMContext, edit: bool = False):
+    """Shows the audience size for the chosen segment, the segment options and the confirm/cancel buttons."""
+    spec = (await state.get_data()).get('segment', {})
+    users_count = await db.get_audience_count(resolve_segment(spec))
+    text = (await db.get_text("bc_confirmation")).format(count=users_count) + "\n\n" + await describe_segment(spec)
+
     keyboard = types.InlineKeyboardMarkup(row_width=2)
+    keyboard.add(
+        types.InlineKeyboardButton(text=await db.get_text("bc_seg_joined_button"), callback_data="bc:seg:joined_after"),
+        types.InlineKeyboardButton(text=await db.get_text("bc_seg_active_button"), callback_data="bc:seg:active_within_days"),
+        types.InlineKeyboardButton(text=await db.get_text("bc_seg_username_button"), callback_data="bc:seg:has_username"),
+        types.InlineKeyboardButton(text=await db.get_text("bc_seg_tag_button"), callback_data="bc:seg:tag"),
+    )
+    keyboard.add(types.InlineKeyboardButton(text=await db.get_text("bc_seg_clear_button"), callback_data="bc:seg:clear"))
     keyboard.add(
         types.InlineKeyboardButton(text=await db.get_text("bc_confirm_button"), callback_data="bc:confirm"),
         types.InlineKeyboardButton(text=await db.get_text("bc_cancel_button"), callback_data="bc:cancel")
     )
-    
-    await message.answer(text, reply_markup=keyboard)
-    await Broadcast.next()
+
+    if edit:
+        await message.edit_text(text, reply_markup=keyboard)
+    else:
+        await message.answer(text, reply_markup=keyboard)
+    await Broadcast.waiting_for_confirmation.set()
+
+# --- 1.1 Audience Segments ---
+SEGMENT_PROMPTS = {"joined_after": "bc_seg_ask_joined", "active_within_days": "bc_seg_ask_active", "tag": "bc_seg_ask_tag"}
+
+async def segment_option_selected(call: types.CallbackQuery, state: FSMContext):
+    field = call.data.split(":")[-1]
+    data = await state.get_data()
+    spec = dict(data.get('segment', {}))
+    if field == "clear":
+        spec = {}
+    elif field == "has_username":
+        spec["has_username"] = not spec.get("has_username")
+    else:
+        await state.update_data(segment_field=field)
+        prompt = await db.get_text(SEGMENT_PROMPTS[field])
+        if field == "joined_after":
+            # Users stored before join dates were recorded never match "joined after"; say from when the data is real
+            tracking_start = await db.get_join_tracking_start()
+            if tracking_start:
+                prompt += "\n" + (await db.get_text("bc_seg_joined_since_note")).format(date=tracking_start.strftime(SEGMENT_DATE_FORMAT))
+        await call.message.edit_text(prompt, parse_mode="Markdown")
+        await Broadcast.waiting_for_segment_value.set()
+        await call.answer()
+        return
+    await state.update_data(segment=spec)
+    await show_confirmation(call.message, state, edit=True)
+    await call.answer()
+
+async def segment_value_received(message: types.Message, state: FSMContext):
+    data = await state.get_data()
+    field, value = data.get('segment_field'), (message.text or "").strip()
+    try:
+        if field == "joined_after":
+            value = datetime.strptime(value, SEGMENT_DATE_FORMAT).strftime(SEGMENT_DATE_FORMAT)
+        elif field == "active_within_days":
+            value = int(value)
+            if value <= 0: raise ValueError
+        elif not TAG_PATTERN.match(value):
+            raise ValueError
+        else:
+            value = value.lower()
+    except ValueError:
+        await message.reply(await db.get_text("bc_seg_invalid"))
+        return
+    spec = dict(data.get('segment', {}), **{field: value})
+    await state.update_data(segment=spec)
+    await show_confirmation(message, state)
 
 # --- 2. Confirmation and Execution (النسخة المصححة) ---
 async def broadcast_confirmed(call: types.CallbackQuery, state: FSMContext):
     """
     Handles the broadcast after admin confirmation.
-    Responds instantly and then starts the heavy work.
+    Responds instantly and only queues the job; a broadcast worker does the sending.
     """
     # ===> الخطوة 1: الاستجابة الفورية للمدير <===
     await call.answer()
@@ -56,51 +145,15 @@ async def broadcast_confirmed(call: types.CallbackQuery, state: FSMContext):
     await state.finish()
     
     message_to_send = data.get('message_to_send')
-    bot = call.bot # الإصلاح: نحصل على كائن البوت بالطريقة الصحيحة
 
     if not message_to_send:
         await call.message.edit_text("حدث خطأ، يرجى المحاولة مرة أخرى.")
         return
 
-    # ===> الخطوة 3: القيام بالعملية الطويلة (جمع المستخدمين والنشر) <===
-    users = await db.get_all_users()
-    total_users = len(users)
-    
-    success_count = 0
-    failed_count = 0
-    
-    for i, user_id in enumerate(users):
-        try:
-            await bot.copy_message(
-                chat_id=user_id,
-                from_chat_id=message_to_send['chat_id'],
-                message_id=message_to_send['message_id']
-            )
-            success_count += 1
-        except (BotBlocked, ChatNotFound, UserDeactivated, TelegramAPIError) as e:
-            failed_count += 1
-            print(f"Failed to send to {user_id}: {e}")
-        
-        # تحديث الحالة كل 25 مستخدم لتجنب إغراق واجهة تليجرام
-        if (i + 1) % 25 == 0:
-            progress_text = (await db.get_text("bc_progress")).format(
-                success=success_count,
-                failed=failed_count,
-                remaining=total_users - (i + 1),
-                total=total_users
-            )
-            try:
-                # نستخدم edit_text_safe لتجنب الأخطاء إذا لم تتغير الرسالة
-                if call.message.text != progress_text:
-                    await call.message.edit_text(progress_text)
-            except TelegramAPIError:
-                pass
-        
-        await asyncio.sleep(0.05) # تقليل طفيف في مدة الانتظار لتسريع العملية
-
-    final_text = (await db.get_text("bc_finished")).format(success=success_count, failed=failed_count)
-    # نرسل النتيجة النهائية كرسالة جديدة للحفاظ على سجل واضح
-    await call.message.answer(final_text)
+    # ===> الخطوة 3: وضع المهمة في الطابور فقط؛ عامل النشر يرسلها ويحدّث هذه الرسالة بالتقدم <===
+    job_id = await broadcast_jobs.enqueue(message_to_send, call.message, segment=resolve_segment(data.get('segment')))
+    text, keyboard = await render_job(await db.get_broadcast_job(job_id))
+    await call.message.edit_text(text, reply_markup=keyboard)
 
 async def broadcast_cancelled(call: types.CallbackQuery, state: FSMContext):
     """Cancels the broadcast process."""
@@ -108,6 +161,70 @@ async def broadcast_cancelled(call: types.CallbackQuery, state: FSMContext):
     await call.message.edit_text("❌ تم إلغاء عملية النشر.")
     await call.answer()
 
+# --- 3. Unfinished Jobs: Pause / Resume / Cancel ---
+async def show_broadcast_jobs(call: types.CallbackQuery, state: FSMContext):
+    """Lists the running and paused broadcast jobs, one status message per job."""
+    await state.finish()
+    jobs = await db.get_unfinished_broadcast_jobs()
+    keyboard = types.InlineKeyboardMarkup().add(types.InlineKeyboardButton(text=await db.get_text("ar_back_button"), callback_data="admin:broadcast"))
+    if not jobs:
+        await call.message.edit_text(await db.get_text("bc_no_jobs"), reply_markup=keyboard)
+        await call.answer()
+        return
+    await call.message.edit_text(await db.get_text("bc_jobs_title"), reply_markup=keyboard, parse_mode="Markdown")
+    for job in jobs:
+        text, job_keyboard = await render_job(job)
+        await call.message.answer(text, reply_markup=job_keyboard)
+    await call.answer()
+
+async def broadcast_job_action(call: types.CallbackQuery, callback_data: dict):
+    job_id, action = callback_data['id'], callback_data['action']
+    job = await db.get_broadcast_job(job_id)
+    if not job or job['status'] not in (BROADCAST_JOB_QUEUED, BROADCAST_JOB_RUNNING, BROADCAST_JOB_PAUSED):
+        await call.answer(await db.get_text("bc_job_not_found"), show_alert=True)
+        return
+    if action == "pause":
+        applied = await broadcast_jobs.pause(job_id)
+    elif action == "resume":
+        applied = await broadcast_jobs.resume(job_id)
+    else:
+        applied = await broadcast_jobs.cancel(job_id)
+    # The button may be stale (the job changed since this message was sent): show the current state instead
+    text, keyboard = await render_job(await db.get_broadcast_job(job_id))
+    try:
+        await call.message.edit_text(text, reply_markup=keyboard)
+    except TelegramAPIError:
+        pass
+    if applied:
+        await call.answer()
+    else:
+        await call.answer(await db.get_text("bc_job_state_changed"), show_alert=True)
+
+# --- 4. User Tags (used by the tag segment) ---
+async def tag_users_start(call: types.CallbackQuery, state: FSMContext):
+    await state.finish()
+    keyboard = types.InlineKeyboardMarkup().add(types.InlineKeyboardButton(text=await db.get_text("ar_back_button"), callback_data="admin:broadcast"))
+    await call.message.edit_text(await db.get_text("bc_ask_for_tagging"), reply_markup=keyboard, parse_mode="Markdown")
+    await TagUsers.waiting_for_tagging.set()
+    await call.answer()
+
+async def tagging_received(message: types.Message, state: FSMContext):
+    """Expects `tag id1 id2 ...` to add a tag, or `-tag id1 id2 ...` to remove it."""
+    parts = (message.text or "").split()
+    tag = parts[0].lower() if parts else ""
+    remove = tag.startswith("-")
+    tag = tag.lstrip("-")
+    try:
+        user_ids = [int(part) for part in parts[1:]]
+    except ValueError:
+        user_ids = []
+    if not TAG_PATTERN.match(tag) or not user_ids:
+        await message.reply(await db.get_text("bc_tagging_invalid"))
+        return
+    count = await (db.untag_users(user_ids, tag) if remove else db.tag_users(user_ids, tag))
+    await state.finish()
+    await message.answer((await db.get_text("bc_tagging_done")).format(tag=tag, count=count))
+
 # --- Registration Function ---
 def register_broadcast_handlers(dp: Dispatcher):
     """Registers all handlers for the broadcast feature."""
@@ -115,3 +232,9 @@ def register_broadcast_handlers(dp: Dispatcher):
     dp.register_message_handler(broadcast_message_received, state=Broadcast.waiting_for_message, is_admin=True, content_types=types.ContentTypes.ANY)
     dp.register_callback_query_handler(broadcast_confirmed, text="bc:confirm", is_admin=True, state=Broadcast.waiting_for_confirmation)
     dp.register_callback_query_handler(broadcast_cancelled, text="bc:cancel", is_admin=True, state=Broadcast.waiting_for_confirmation)
+    dp.register_callback_query_handler(segment_option_selected, text_startswith="bc:seg:", is_admin=True, state=Broadcast.waiting_for_confirmation)
+    dp.register_message_handler(segment_value_received, state=Broadcast.waiting_for_segment_value, is_admin=True)
+    dp.register_callback_query_handler(tag_users_start, text="bc:tag_users", is_admin=True, state="*")
+    dp.register_message_handler(tagging_received, state=TagUsers.waiting_for_tagging, is_admin=True)
+    dp.register_callback_query_handler(show_broadcast_jobs, text="bc:jobs", is_admin=True, state="*")
+    dp.register_callback_query_handler(broadcast_job_action, bc_job_cb.filter(), is_admin=True, state="*")
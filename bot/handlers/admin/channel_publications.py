@@ -1,16 +1,24 @@
 # -*- coding: utf-8 -*-
 
-import asyncio
 import datetime
+import pytz
 from aiogram import types, Dispatcher
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.utils.exceptions import TelegramAPIError
 from aiogram.utils.callback_data import CallbackData
-import math
 
 from bot.database.manager import db
-from bot.core.scheduler import scheduler, send_scheduled_post
+from bot.core.scheduler import schedule_post
+from bot.core.channel_fanout import fan_out, describe_failures
+
+async def get_admin_timezone():
+    """المنطقة الزمنية التي يكتب بها المدير مواعيد النشر: نفس منطقة البوت المحددة في الإعدادات."""
+    timezone_settings = await db.get_timezone()
+    try:
+        return pytz.timezone(timezone_settings.get("identifier", "Asia/Riyadh")), timezone_settings.get("display_name", "بتوقيت الرياض")
+    except pytz.UnknownTimeZoneError:
+        return pytz.timezone("Asia/Riyadh"), "بتوقيت الرياض"
 
 # --- FSM States ---
 class SetAutoMessage(StatesGroup):
@@ -22,7 +30,7 @@ class SchedulePost(StatesGroup):
     waiting_for_datetime = State()
 
 # --- CallbackData ---
-sch_pagination_cb = CallbackData("sch_page", "page")
+sch_pagination_cb = CallbackData("sch_page", "dir", "key", "page")
 sch_delete_cb = CallbackData("sch_delete", "id")
 
 # --- 1. Main Menu for Channel Publications ---
@@ -85,15 +93,14 @@ async def publish_now(call: types.CallbackQuery):
         await call.answer(await db.get_text("cp_error_no_channels_to_publish"), show_alert=True)
         return
     status_msg = await call.message.edit_text((await db.get_text("cp_publish_started")).format(count=len(channels)))
-    success_count, failed_count = 0, 0
-    for channel in channels:
-        try:
-            await call.bot.copy_message(chat_id=channel['channel_id'], from_chat_id=auto_message_data['chat_id'], message_id=auto_message_data['message_id'])
-            success_count += 1
-        except TelegramAPIError as e:
-            failed_count += 1
-        await asyncio.sleep(0.5)
+    # PERFORMANCE: نشر متوازٍ مع حد لكل قناة بدلاً من انتظار ثابت بين القنوات
+    results = await fan_out(call.bot, auto_message_data, [channel['channel_id'] for channel in channels])
+    success_count = sum(1 for result in results if result["ok"])
+    failed_count = len(results) - success_count
     final_text = (await db.get_text("cp_publish_finished")).format(success=success_count, failed=failed_count)
+    failures = describe_failures(results, {channel['channel_id']: channel.get('title') for channel in channels})
+    if failures:
+        final_text += "\n\n" + await db.get_text("cp_publish_failed_channels") + "\n" + "\n".join(failures)
     await status_msg.edit_text(final_text)
 
 # --- وظائف الجدولة ---
@@ -117,16 +124,20 @@ async def schedule_channels_received(call: types.CallbackQuery, state: FSMContex
     target = call.data.split(":")[-1]
     target_channels = [] if target == "all" else [int(target)]
     await state.update_data(target_channels=target_channels)
-    await call.message.edit_text(await db.get_text("sch_ask_for_datetime"), parse_mode="Markdown")
+    _, tz_display_name = await get_admin_timezone()
+    await call.message.edit_text((await db.get_text("sch_ask_for_datetime")).format(timezone=tz_display_name), parse_mode="Markdown")
     await SchedulePost.next()
 
 async def schedule_datetime_received(message: types.Message, state: FSMContext):
     bot = message.bot
+    tz, _ = await get_admin_timezone()
     try:
-        run_date = datetime.datetime.strptime(message.text, "%Y-%m-%d %H:%M")
-        if run_date < datetime.datetime.now():
+        # الموعد مكتوب بتوقيت البوت، ويُحفظ بتوقيت UTC كما يتوقعه المؤقت
+        local_run_date = tz.localize(datetime.datetime.strptime(message.text, "%Y-%m-%d %H:%M"))
+        if local_run_date <= datetime.datetime.now(tz):
             await message.answer(await db.get_text("sch_datetime_in_past"))
             return
+        run_date = local_run_date.astimezone(pytz.utc).replace(tzinfo=None)
     except ValueError:
         await message.answer(await db.get_text("sch_invalid_datetime"))
         return
@@ -141,36 +152,32 @@ async def schedule_datetime_received(message: types.Message, state: FSMContext):
         run_date=run_date
     )
     
-    scheduler.add_job(
-        send_scheduled_post,
-        "date",
-        run_date=run_date,
-        id=job_id,
-        args=[bot, job_id, data['message_data'], data['target_channels']],
-        replace_existing=True
-    )
+    # المواعيد البعيدة تبقى في قاعدة البيانات حتى تقترب
+    schedule_post(bot, run_date)
     
     await state.finish()
-    await message.answer((await db.get_text("sch_add_success")).format(run_date=run_date.strftime("%Y-%m-%d %H:%M")))
+    await message.answer((await db.get_text("sch_add_success")).format(run_date=local_run_date.strftime("%Y-%m-%d %H:%M")))
 
 async def view_scheduled_posts(call: types.CallbackQuery, callback_data: dict = None):
+    cursor = callback_data.get("key") if callback_data else None
+    backwards = callback_data.get("dir") == "prev" if callback_data else False
     page = int(callback_data.get("page", 1)) if callback_data else 1
     POSTS_PER_PAGE = 5
-    total_posts = await db.get_scheduled_posts_count()
-    if total_posts == 0:
+    result = await db.get_scheduled_posts(cursor=cursor, backwards=backwards, limit=POSTS_PER_PAGE)
+    posts = result["items"]
+    if not posts:
         await call.answer(await db.get_text("sch_no_jobs"), show_alert=True)
         return
-    total_pages = math.ceil(total_posts / POSTS_PER_PAGE)
-    posts = await db.get_scheduled_posts(page=page, limit=POSTS_PER_PAGE)
+    tz, _ = await get_admin_timezone()
     keyboard = types.InlineKeyboardMarkup()
-    text = f"🗓️ *المنشورات المجدولة* (صفحة {page}/{total_pages}):\n\n"
+    text = f"🗓️ *المنشورات المجدولة* (صفحة {page}):\n\n"
     for post in posts:
-        run_date_str = post['run_date'].strftime("%Y-%m-%d %H:%M")
+        run_date_str = pytz.utc.localize(post['run_date']).astimezone(tz).strftime("%Y-%m-%d %H:%M")
         text += f"- سيتم النشر في: `{run_date_str}`\n"
         keyboard.add(types.InlineKeyboardButton(text=f"🗑️ حذف موعد: {run_date_str}", callback_data=sch_delete_cb.new(id=post['_id'])))
     pagination_buttons = []
-    if page > 1: pagination_buttons.append(types.InlineKeyboardButton(text=await db.get_text("ar_prev_button"), callback_data=sch_pagination_cb.new(page=page - 1)))
-    if page < total_pages: pagination_buttons.append(types.InlineKeyboardButton(text=await db.get_text("ar_next_button"), callback_data=sch_pagination_cb.new(page=page + 1)))
+    if result["has_prev"]: pagination_buttons.append(types.InlineKeyboardButton(text=await db.get_text("ar_prev_button"), callback_data=sch_pagination_cb.new(dir="prev", key=result["prev_cursor"], page=page - 1)))
+    if result["has_next"]: pagination_buttons.append(types.InlineKeyboardButton(text=await db.get_text("ar_next_button"), callback_data=sch_pagination_cb.new(dir="next", key=result["next_cursor"], page=page + 1)))
     keyboard.row(*pagination_buttons)
     keyboard.add(types.InlineKeyboardButton(text=await db.get_text("ar_back_button"), callback_data="admin:channel_publications"))
     await call.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
@@ -181,11 +188,8 @@ async def delete_scheduled_post(call: types.CallbackQuery, callback_data: dict):
     يحذف منشوراً مجدولاً بأمان.
     """
     job_id = callback_data['id']
+    # دفعة الإرسال تقرأ المنشورات المعلقة لحظة التنفيذ، فالحذف من قاعدة البيانات يكفي
     await db.delete_scheduled_post(job_id)
-    
-    # الإصلاح: التحقق من وجود المهمة قبل محاولة حذفها
-    if scheduler.get_job(job_id):
-        scheduler.remove_job(job_id)
         
     await call.answer(await db.get_text("sch_deleted_success"), show_alert=False)
     await view_scheduled_posts(call)
@@ -7,14 +7,14 @@ from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.utils.callback_data import CallbackData
 from aiogram.utils.exceptions import ChatNotFound, TelegramAPIError
 
-from bot.database.manager import db
+from bot.database.manager import db, COLLECTION_PUBLISHING_CHANNELS
 
 # --- FSM States ---
 class AddChannel(StatesGroup):
     waiting_for_channel_id = State()
 
 # --- CallbackData ---
-cm_pagination_cb = CallbackData("cm_page", "page")
+cm_pagination_cb = CallbackData("cm_page", "dir", "key", "page")
 cm_delete_cb = CallbackData("cm_delete", "id")
 cm_test_cb = CallbackData("cm_test", "id")
 
@@ -68,19 +68,21 @@ async def add_channel_id_received(message: types.Message, state: FSMContext):
 
 # --- 3. View, Delete, and Test Channels ---
 async def view_channels(call: types.CallbackQuery, callback_data: dict = None):
+    cursor = callback_data.get("key") if callback_data else None
+    backwards = callback_data.get("dir") == "prev" if callback_data else False
     page = int(callback_data.get("page", 1)) if callback_data else 1
     
     CHANNELS_PER_PAGE = 5
-    total_channels = await db.get_publishing_channels_count()
-    if total_channels == 0:
+    result = await db.get_publishing_channels(cursor=cursor, backwards=backwards, limit=CHANNELS_PER_PAGE)
+    channels = result["items"]
+    if not channels:
         await call.answer(await db.get_text("cm_no_channels"), show_alert=True)
         return
 
-    total_pages = math.ceil(total_channels / CHANNELS_PER_PAGE)
+    total_channels = await db.get_estimated_count(COLLECTION_PUBLISHING_CHANNELS)
+    total_pages = max(math.ceil(total_channels / CHANNELS_PER_PAGE), page)
     page_info = (await db.get_text("ar_page_info")).format(current_page=page, total_pages=total_pages)
     
-    channels = await db.get_publishing_channels(page=page, limit=CHANNELS_PER_PAGE)
-    
     keyboard = types.InlineKeyboardMarkup()
     for channel in channels:
         db_id = str(channel['_id'])
@@ -91,8 +93,8 @@ async def view_channels(call: types.CallbackQuery, callback_data: dict = None):
         )
     
     pagination_buttons = []
-    if page > 1: pagination_buttons.append(types.InlineKeyboardButton(text=await db.get_text("ar_prev_button"), callback_data=cm_pagination_cb.new(page=page - 1)))
-    if page < total_pages: pagination_buttons.append(types.InlineKeyboardButton(text=await db.get_text("ar_next_button"), callback_data=cm_pagination_cb.new(page=page + 1)))
+    if result["has_prev"]: pagination_buttons.append(types.InlineKeyboardButton(text=await db.get_text("ar_prev_button"), callback_data=cm_pagination_cb.new(dir="prev", key=result["prev_cursor"], page=page - 1)))
+    if result["has_next"]: pagination_buttons.append(types.InlineKeyboardButton(text=await db.get_text("ar_next_button"), callback_data=cm_pagination_cb.new(dir="next", key=result["next_cursor"], page=page + 1)))
     
     keyboard.row(*pagination_buttons)
     keyboard.add(types.InlineKeyboardButton(text=await db.get_text("ar_back_button"), callback_data="admin:channels_management"))
@@ -1,20 +1,19 @@
 # -*- coding: utf-8 -*-
 
-import math
 from aiogram import types, Dispatcher, Bot
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.utils.callback_data import CallbackData
 from aiogram.utils.exceptions import TelegramAPIError
 
-from bot.database.manager import db
+from bot.database.manager import db, COLLECTION_LIBRARY
 
 # --- FSM States ---
 class AddToLibrary(StatesGroup):
     waiting_for_item = State()
 
 # --- CallbackData ---
-lib_pagination_cb = CallbackData("lib_page", "page")
+lib_pagination_cb = CallbackData("lib_page", "dir", "key", "page")
 lib_delete_cb = CallbackData("lib_delete", "id")
 
 # --- 1. Main Menu for Library Management ---
@@ -53,20 +52,21 @@ async def item_received(message: types.Message, state: FSMContext):
 # --- 3. View Library Items (النسخة المصححة) ---
 async def view_library_items(call: types.CallbackQuery, callback_data: dict = None):
     """Displays library items one by one with navigation."""
+    cursor = callback_data.get("key") if callback_data else None
+    backwards = callback_data.get("dir") == "prev" if callback_data else False
     page = int(callback_data.get("page", 1)) if callback_data else 1
-    
-    total_items = await db.get_library_items_count()
-    if total_items == 0:
-        await call.answer(await db.get_text("lib_no_items"), show_alert=True)
-        return
 
     # --- الإصلاح: جلب كائن البوت من السياق ---
     bot = call.bot
     
     # جلب عنصر واحد في كل مرة (رقم الصفحة هو رقم العنصر)
-    items = await db.get_library_items(page=page, limit=1)
+    result = await db.get_library_items(cursor=cursor, backwards=backwards, limit=1)
+    items = result["items"]
     if not items:
-        await call.answer("لا يوجد المزيد من العناصر.", show_alert=True)
+        if cursor:
+            await call.answer("لا يوجد المزيد من العناصر.", show_alert=True)
+        else:
+            await call.answer(await db.get_text("lib_no_items"), show_alert=True)
         return
 
     item = items[0]
@@ -98,14 +98,15 @@ async def view_library_items(call: types.CallbackQuery, callback_data: dict = No
         await call.message.answer(f"⚠️ لا يمكن عرض هذا العنصر. قد يكون محذوفاً أو تالفاً.\nالخطأ: {e}")
 
     # بناء لوحة التحكم الجديدة وإرسالها
+    total_items = max(await db.get_estimated_count(COLLECTION_LIBRARY), page)
     page_info = (await db.get_text("lib_item_info")).format(current_item=page, total_items=total_items)
     
     keyboard = types.InlineKeyboardMarkup()
     pagination_buttons = []
-    if page > 1:
-        pagination_buttons.append(types.InlineKeyboardButton(text=await db.get_text("ar_prev_button"), callback_data=lib_pagination_cb.new(page=page - 1)))
-    if page < total_items:
-        pagination_buttons.append(types.InlineKeyboardButton(text=await db.get_text("ar_next_button"), callback_data=lib_pagination_cb.new(page=page + 1)))
+    if result["has_prev"]:
+        pagination_buttons.append(types.InlineKeyboardButton(text=await db.get_text("ar_prev_button"), callback_data=lib_pagination_cb.new(dir="prev", key=result["prev_cursor"], page=page - 1)))
+    if result["has_next"]:
+        pagination_buttons.append(types.InlineKeyboardButton(text=await db.get_text("ar_next_button"), callback_data=lib_pagination_cb.new(dir="next", key=result["next_cursor"], page=page + 1)))
     
     keyboard.row(*pagination_buttons)
     keyboard.add(types.InlineKeyboardButton(text=await db.get_text("ar_delete_button"), callback_data=lib_delete_cb.new(id=db_id)))
@@ -8,7 +8,7 @@ from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.utils.callback_data import CallbackData
 from aiogram.utils.markdown import escape_md
 
-from bot.database.manager import db
+from bot.database.manager import db, COLLECTION_REMINDERS
 
 # --- FSM States for adding and importing reminders ---
 class AddReminder(StatesGroup):
@@ -19,7 +19,7 @@ class ImportReminders(StatesGroup):
 
 # --- CallbackData for pagination and deletion ---
 # نستخدم بادئة فريدة (rem) لتجنب التعارض مع الردود التلقائية (ar)
-pagination_cb = CallbackData("rem_page", "page")
+pagination_cb = CallbackData("rem_page", "dir", "key", "page")
 delete_cb = CallbackData("rem_delete", "id")
 
 # --- 1. Main Menu for Reminders ---
@@ -37,22 +37,24 @@ async def show_reminders_menu(call: types.CallbackQuery, state: FSMContext):
     await call.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
     await call.answer()
 
-# --- 2. View All Reminders (with Pagination) ---
+# --- 2. View All Reminders (with Keyset Pagination) ---
 async def view_reminders(call: types.CallbackQuery, callback_data: dict = None):
     """يعرض قائمة التذكيرات مع تقسيم الصفحات."""
+    cursor = callback_data.get("key") if callback_data else None
+    backwards = callback_data.get("dir") == "prev" if callback_data else False
     page = int(callback_data.get("page", 1)) if callback_data else 1
     
     ITEMS_PER_PAGE = 10
-    total_items = await db.get_reminders_count()
-    if total_items == 0:
+    result = await db.get_reminders(cursor=cursor, backwards=backwards, limit=ITEMS_PER_PAGE)
+    reminders = result["items"]
+    if not reminders:
         await call.answer(await db.get_text("rem_no_reminders"), show_alert=True)
         return
 
-    total_pages = math.ceil(total_items / ITEMS_PER_PAGE)
+    total_items = await db.get_estimated_count(COLLECTION_REMINDERS)
+    total_pages = max(math.ceil(total_items / ITEMS_PER_PAGE), page)
     page_info = (await db.get_text("ar_page_info")).format(current_page=page, total_pages=total_pages)
     
-    reminders = await db.get_reminders(page=page, limit=ITEMS_PER_PAGE)
-    
     keyboard = types.InlineKeyboardMarkup(row_width=1)
     
     for reminder in reminders:
@@ -64,12 +66,12 @@ async def view_reminders(call: types.CallbackQuery, callback_data: dict = None):
         ))
 
     pagination_buttons = []
-    if page > 1:
+    if result["has_prev"]:
         pagination_buttons.append(types.InlineKeyboardButton(
-            text=await db.get_text("ar_prev_button"), callback_data=pagination_cb.new(page=page - 1)))
-    if page < total_pages:
+            text=await db.get_text("ar_prev_button"), callback_data=pagination_cb.new(dir="prev", key=result["prev_cursor"], page=page - 1)))
+    if result["has_next"]:
         pagination_buttons.append(types.InlineKeyboardButton(
-            text=await db.get_text("ar_next_button"), callback_data=pagination_cb.new(page=page + 1)))
+            text=await db.get_text("ar_next_button"), callback_data=pagination_cb.new(dir="next", key=result["next_cursor"], page=page + 1)))
     
     keyboard.row(*pagination_buttons)
     keyboard.add(types.InlineKeyboardButton(text=await db.get_text("ar_back_button"), callback_data="admin:reminders"))
@@ -10,6 +10,9 @@ from bot.database.manager import db
 class EditRejectionMessage(StatesGroup):
     waiting_for_message = State()
 
+class EditLinkAllowlist(StatesGroup):
+    waiting_for_domains = State()
+
 # --- 1. Main Menu for Security (النسخة المصححة) ---
 async def show_security_menu(call: types.CallbackQuery, state: FSMContext):
     """Displays the main security menu."""
@@ -66,6 +69,7 @@ async def show_media_menu(call: types.CallbackQuery):
         await get_button("document"), await get_button("audio"),
         await get_button("voice")
     )
+    keyboard.add(types.InlineKeyboardButton(text=await db.get_text("sec_link_allowlist_button"), callback_data="sec:link_allowlist"))
     keyboard.add(types.InlineKeyboardButton(text=await db.get_text("ar_back_button"), callback_data="admin:security"))
     
     await call.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
@@ -77,6 +81,35 @@ async def toggle_media_blocking(call: types.CallbackQuery):
     await db.toggle_media_blocking(media_type)
     await show_media_menu(call) # Refresh the menu
 
+# --- Link domains allowed even when links are blocked ---
+async def edit_link_allowlist_start(call: types.CallbackQuery):
+    """Asks for the list of allowed link domains."""
+    settings = await db.get_security_settings()
+    current_domains = settings.get("allowed_link_domains", [])
+    prompt_text = await db.get_text("sec_ask_for_link_allowlist")
+    if current_domains:
+        prompt_text += "\n\n" + "\n".join(f"▪️ `{domain}`" for domain in current_domains)
+
+    # "admin:security" also finishes the FSM state
+    keyboard = types.InlineKeyboardMarkup().add(types.InlineKeyboardButton(text=await db.get_text("ar_back_button"), callback_data="admin:security"))
+    await call.message.edit_text(prompt_text, reply_markup=keyboard, parse_mode="Markdown")
+    await EditLinkAllowlist.waiting_for_domains.set()
+    await call.answer()
+
+async def link_allowlist_received(message: types.Message, state: FSMContext):
+    """Saves the allowed link domains (one per line, '-' clears the list)."""
+    domains = []
+    if message.text.strip() != "-":
+        for line in message.text.replace(",", "\n").split("\n"):
+            domain = line.strip().lower().removeprefix("https://").removeprefix("http://").removeprefix("www.").split("/")[0]
+            if domain and domain not in domains:
+                domains.append(domain)
+    await db.set_allowed_link_domains(domains)
+    await state.finish()
+
+    keyboard = types.InlineKeyboardMarkup().add(types.InlineKeyboardButton(text=await db.get_text("ar_back_button"), callback_data="sec:media_menu"))
+    await message.answer(await db.get_text("sec_link_allowlist_updated"), reply_markup=keyboard)
+
 # --- 3. Edit Rejection Message Flow ---
 async def edit_rejection_msg_start(call: types.CallbackQuery, state: FSMContext):
     """Starts the process of editing the rejection message."""
@@ -106,6 +139,8 @@ def register_security_handlers(dp: Dispatcher):
     # Media filtering
     dp.register_callback_query_handler(show_media_menu, text="sec:media_menu", is_admin=True, state="*")
     dp.register_callback_query_handler(toggle_media_blocking, text_startswith="sec:toggle_media:", is_admin=True, state="*")
+    dp.register_callback_query_handler(edit_link_allowlist_start, text="sec:link_allowlist", is_admin=True, state="*")
+    dp.register_message_handler(link_allowlist_received, state=EditLinkAllowlist.waiting_for_domains, is_admin=True)
     
     # Rejection message
     dp.register_callback_query_handler(edit_rejection_msg_start, text="sec:edit_rejection_msg", is_admin=True, state="*")
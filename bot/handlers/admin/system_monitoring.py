@@ -7,6 +7,7 @@ import psutil
 from aiogram import types, Dispatcher
 
 from bot.database.manager import db
+from bot.database.instrumentation import DB_METRICS
 from bot.core.bot_data import START_TIME
 
 def format_uptime(duration: datetime.timedelta) -> str:
@@ -94,6 +95,10 @@ async def show_system_status(call: types.CallbackQuery):
     )
 
     keyboard = types.InlineKeyboardMarkup(row_width=2)
+    keyboard.add(
+        types.InlineKeyboardButton(text=await db.get_text("sm_storage_button"), callback_data="sm:storage"),
+        types.InlineKeyboardButton(text=await db.get_text("sm_latency_button"), callback_data="sm:latency")
+    )
     keyboard.add(
         types.InlineKeyboardButton(text=await db.get_text("stats_refresh_button"), callback_data="admin:system_monitoring"),
         types.InlineKeyboardButton(text=await db.get_text("ar_back_button"), callback_data="admin:panel:back")
@@ -104,8 +109,74 @@ async def show_system_status(call: types.CallbackQuery):
     except Exception:
         pass
 
+async def show_storage_report(call: types.CallbackQuery):
+    """
+    يعرض حجم كل مجموعة في قاعدة البيانات ومتى تُحذف بياناتها تلقائياً (فهارس TTL).
+    """
+    await call.answer()
+
+    collections = await db.get_collections_storage_stats()
+    forever_text = await db.get_text("sm_retention_forever")
+    retention_template = await db.get_text("sm_retention_after")
+
+    lines = [await db.get_text("sm_storage_title"), ""]
+    for item in collections:
+        if item["retention_seconds"] > 0:
+            retention_str = retention_template.format(duration=format_uptime(datetime.timedelta(seconds=item["retention_seconds"])))
+        else:
+            retention_str = forever_text
+        lines.append(f"▪️ `{item['name']}`: {item['size_mb']:.2f} MB ({item['count']}) - {retention_str}")
+
+    keyboard = types.InlineKeyboardMarkup(row_width=2)
+    keyboard.add(
+        types.InlineKeyboardButton(text=await db.get_text("stats_refresh_button"), callback_data="sm:storage"),
+        types.InlineKeyboardButton(text=await db.get_text("ar_back_button"), callback_data="admin:system_monitoring")
+    )
+
+    try:
+        await call.message.edit_text("\n".join(lines), reply_markup=keyboard, parse_mode="Markdown")
+    except Exception:
+        pass
+
+async def show_latency_report(call: types.CallbackQuery):
+    """
+    يعرض أبطأ دوال التخزين (حسب الزمن الكلي) مع عدد الاستدعاءات والأخطاء و p50/p95/p99.
+    """
+    if call.data == "sm:latency:reset":
+        DB_METRICS.reset()
+    await call.answer()
+
+    lines = [await db.get_text("sm_latency_title"), ""]
+    snapshot = DB_METRICS.snapshot()
+    if not snapshot["enabled"]:
+        lines.append(await db.get_text("sm_latency_disabled"))
+    elif not snapshot["methods"]:
+        lines.append(await db.get_text("sm_latency_empty"))
+    else:
+        # The top 15 keep the message well below Telegram's length limit
+        for item in snapshot["methods"][:15]:
+            errors_str = f" ⚠️{item['errors']}" if item["errors"] else ""
+            lines.append(
+                f"▪️ `{item['method']}` ×{item['calls']}{errors_str}\n"
+                f"    {item['p50_ms']:.1f} / {item['p95_ms']:.1f} / {item['p99_ms']:.1f} (max {item['max_ms']:.1f})"
+            )
+
+    keyboard = types.InlineKeyboardMarkup(row_width=2)
+    keyboard.add(
+        types.InlineKeyboardButton(text=await db.get_text("stats_refresh_button"), callback_data="sm:latency"),
+        types.InlineKeyboardButton(text=await db.get_text("sm_latency_reset_button"), callback_data="sm:latency:reset")
+    )
+    keyboard.add(types.InlineKeyboardButton(text=await db.get_text("ar_back_button"), callback_data="admin:system_monitoring"))
+
+    try:
+        await call.message.edit_text("\n".join(lines), reply_markup=keyboard, parse_mode="Markdown")
+    except Exception:
+        pass
+
 def register_system_monitoring_handlers(dp: Dispatcher):
     """
     يسجل معالج واجهة مراقبة النظام.
     """
     dp.register_callback_query_handler(show_system_status, text="admin:system_monitoring", is_admin=True, state="*")
+    dp.register_callback_query_handler(show_storage_report, text="sm:storage", is_admin=True, state="*")
+    dp.register_callback_query_handler(show_latency_report, text=["sm:latency", "sm:latency:reset"], is_admin=True, state="*")
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import html
 import logging
+import os
+import time
 from aiogram import types, Dispatcher, Bot
 
 from config import ADMIN_USER_ID
@@ -9,6 +12,20 @@ from bot.handlers.user.start import is_user_subscribed
 
 logger = logging.getLogger(__name__)
 
+# Telegram limits for a text message and for a media caption
+MESSAGE_MAX_LENGTH = 4096
+CAPTION_MAX_LENGTH = 1024
+# Copies of these can carry the user card in their caption
+CAPTIONED_CONTENT_TYPES = {
+    types.ContentType.PHOTO, types.ContentType.VIDEO, types.ContentType.DOCUMENT,
+    types.ContentType.AUDIO, types.ContentType.ANIMATION, types.ContentType.VOICE,
+}
+# Messages with no room for the card (stickers, locations, long texts...) get a separate card at most once per user in this many seconds
+USER_CARD_INTERVAL = int(os.getenv("USER_CARD_INTERVAL", 60))
+USER_CARD_CACHE_SIZE = 10_000
+# user_id -> monotonic time the admin last saw this user's card
+_cards_shown_at = {}
+
 async def send_reply_from_data(bot: Bot, chat_id: int, reply_data: dict):
     """
     يقوم بإعادة إرسال الرسالة المخزنة باستخدام الطريقة الصحيحة (copy_message).
@@ -26,31 +43,53 @@ async def send_reply_from_data(bot: Bot, chat_id: int, reply_data: dict):
     except Exception as e:
         logger.error(f"فشل إرسال الرد التلقائي للمستخدم {chat_id}: {e}")
 
-async def send_user_card_to_admin(user: types.User, bot: Bot):
-    """يرسل بطاقة تعريف المستخدم إلى المدير."""
-    try:
-        user_link = f'<a href="tg://user?id={user.id}">{user.full_name}</a>'
-        username = f"@{user.username}" if user.username else "لا يوجد"
-        
-        notification_text = (
-            f"👤 <b>رسالة من مستخدم</b>\n\n"
-            f"🗣️ <b>اسمه:</b> {user_link}\n"
-            f"🌀 <b>معرفه:</b> {username}\n"
-            f"🆔 <b>ايديه:</b> <code>{user.id}</code>"
-        )
-        
-        await bot.send_message(
-            chat_id=ADMIN_USER_ID,
-            text=notification_text,
-            parse_mode=types.ParseMode.HTML
-        )
-    except Exception as e:
-        logger.error(f"فشل إرسال بطاقة المستخدم: {e}")
+def build_user_card(user: types.User) -> str:
+    """بطاقة تعريف المستخدم (HTML)."""
+    user_link = f'<a href="tg://user?id={user.id}">{html.escape(user.full_name)}</a>'
+    username = f"@{user.username}" if user.username else "لا يوجد"
+    return (
+        f"👤 <b>رسالة من مستخدم</b>\n\n"
+        f"🗣️ <b>اسمه:</b> {user_link}\n"
+        f"🌀 <b>معرفه:</b> {username}\n"
+        f"🆔 <b>ايديه:</b> <code>{user.id}</code>"
+    )
+
+def _card_recently_shown(user_id: int, now: float) -> bool:
+    global _cards_shown_at
+    if len(_cards_shown_at) > USER_CARD_CACHE_SIZE:
+        _cards_shown_at = {uid: shown_at for uid, shown_at in _cards_shown_at.items() if now - shown_at < USER_CARD_INTERVAL}
+    shown_at = _cards_shown_at.get(user_id)
+    return shown_at is not None and now - shown_at < USER_CARD_INTERVAL
+
+async def forward_to_admin(message: types.Message) -> types.Message:
+    """
+    يوصل رسالة المستخدم إلى المدير مع بطاقته في رسالة واحدة: النص بعد البطاقة، أو البطاقة في وصف الوسائط.
+    ما لا يتسع للبطاقة يُنسخ كما هو، وتسبقه بطاقة منفصلة مرة واحدة لكل مستخدم خلال USER_CARD_INTERVAL.
+    يعيد رسالة المدير التي يرد عليها.
+    """
+    bot = message.bot
+    card = build_user_card(message.from_user)
+    now = time.monotonic()
+    if message.content_type == types.ContentType.TEXT:
+        text = f"{card}\n\n{message.html_text}"
+        if len(text) <= MESSAGE_MAX_LENGTH:
+            _cards_shown_at[message.from_user.id] = now
+            return await bot.send_message(ADMIN_USER_ID, text, parse_mode=types.ParseMode.HTML)
+    elif message.content_type in CAPTIONED_CONTENT_TYPES:
+        caption = f"{card}\n\n{message.html_text}" if message.caption else card
+        if len(caption) <= CAPTION_MAX_LENGTH:
+            _cards_shown_at[message.from_user.id] = now
+            return await message.copy_to(ADMIN_USER_ID, caption=caption, parse_mode=types.ParseMode.HTML)
+    if not _card_recently_shown(message.from_user.id, now):
+        await bot.send_message(ADMIN_USER_ID, card, parse_mode=types.ParseMode.HTML)
+        _cards_shown_at[message.from_user.id] = now
+    return await message.copy_to(ADMIN_USER_ID)
 
 # --- 💡 تم إعادة بناء هذه الدالة بالكامل لتطبيق منطق السرعة القصوى 💡 ---
 async def handle_user_message(message: types.Message):
     """
     يعالج رسائل المستخدم بمنطق "الصاروخ" (الأسرع أولاً).
+    فحوصات الحظر، حالة البوت، منع التكرار والوسائط الممنوعة تمت مسبقاً في PreprocessMiddleware.
     """
     user = message.from_user
     bot = message.bot
@@ -59,45 +98,21 @@ async def handle_user_message(message: types.Message):
     if user.id == ADMIN_USER_ID:
         return
 
-    # --- الخطوة 1: التحقق من إعدادات الأمان (سريعة جدًا) ---
-    # نجلب الإعدادات مرة واحدة فقط ونعيد استخدامها
-    settings = await db.get_security_settings()
-    if settings.get("bot_status") == "inactive":
-        return # أسرع فحص، نتوقف هنا فورًا
-
-    # --- الخطوة 2: التحقق من الرد التلقائي (سريع) ---
+    # --- الخطوة 1: التحقق من الرد التلقائي (سريع) ---
     if message.text:
         reply_data = await db.find_auto_reply_by_keyword(message.text)
         if reply_data:
             await send_reply_from_data(bot, message.chat.id, reply_data)
             return # وجدنا رداً، نتوقف هنا
 
-    # --- الخطوة 3: التحقق من الوسائط الممنوعة (سريع) ---
-    blocked_media = settings.get("blocked_media", {})
-    
-    # هذا الأسلوب أسرع من بناء قاموس في كل مرة
-    if (message.photo and blocked_media.get("photo")) or \
-       (message.video and blocked_media.get("video")) or \
-       (message.sticker and blocked_media.get("sticker")) or \
-       (message.document and blocked_media.get("document")) or \
-       (message.audio and blocked_media.get("audio")) or \
-       (message.voice and blocked_media.get("voice")) or \
-       ((message.entities and any(e.type in ['url', 'text_link'] for e in message.entities)) and blocked_media.get("link")):
-        
-        rejection_message = await db.get_text("security_rejection_message")
-        try:
-            await message.reply(rejection_message)
-        except Exception: pass
-        return # نرفض الرسالة ونتوقف هنا
-        
-    # --- الخطوة 4: التحقق من الاشتراك الإجباري (أبطأ عملية، نتركها للنهاية) ---
+    # --- الخطوة 2: التحقق من الاشتراك الإجباري (أبطأ عملية، نتركها للنهاية) ---
     if not await is_user_subscribed(user.id, bot):
         return # إذا لم يكن مشتركًا، نتوقف هنا
 
-    # --- الخطوة 5: إذا مرت الرسالة من كل شيء، يتم توجيهها للمدير ---
+    # --- الخطوة 3: إذا مرت الرسالة من كل شيء، يتم توجيهها للمدير ---
     try:
-        await send_user_card_to_admin(user, bot)
-        copied_message = await message.copy_to(ADMIN_USER_ID)
+        # PERFORMANCE: البطاقة ونسخة الرسالة في استدعاء واحد غالباً، فرسالة المستخدم لا تكلف رسالتين للمدير
+        copied_message = await forward_to_admin(message)
         await db.log_message_link(
             admin_message_id=copied_message.message_id,
             user_id=user.id,
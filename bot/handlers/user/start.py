@@ -6,7 +6,7 @@ from aiogram import types, Dispatcher, Bot
 from aiogram.utils.exceptions import ChatNotFound, BadRequest
 
 from bot.database.manager import db
-from config import ADMIN_USER_ID
+from bot.core.admin_notifier import admin_notifier
 
 async def notify_admin_of_new_user(user: types.User, bot: Bot):
     """يرسل إشعاراً للمدير عند دخول مستخدم جديد."""
@@ -21,11 +21,8 @@ async def notify_admin_of_new_user(user: types.User, bot: Bot):
             f"🆔 <b>ايديه:</b> <code>{user.id}</code>"
         )
         
-        await bot.send_message(
-            chat_id=ADMIN_USER_ID,
-            text=notification_text,
-            parse_mode=types.ParseMode.HTML
-        )
+        # يُرسل فوراً أو ضمن ملخص إذا كان هناك سيل من المستخدمين الجدد
+        await admin_notifier.notify(bot, notification_text)
     except Exception as e:
         print(f"فشل إرسال إشعار المستخدم الجديد: {e}")
 
@@ -1,108 +1,97 @@
 # -*- coding: utf-8 -*-
 
 import logging
-from datetime import datetime, timedelta
+import time
+from datetime import datetime, timezone
 from aiogram import types, Dispatcher
-from aiogram.dispatcher.middlewares import BaseMiddleware
 from aiogram.dispatcher.handler import CancelHandler
 from aiogram.utils.exceptions import TelegramAPIError
 
 from bot.database.manager import db
-from config import ADMIN_USER_ID
+from bot.core.flood_control import flood_limiter
+from bot.core.user_locks import user_locks
+from bot.core.admin_notifier import admin_notifier
 
 logger = logging.getLogger(__name__)
 
-class AntiFloodMiddleware(BaseMiddleware):
+async def enforce_antiflood(ctx, message: types.Message):
     """
-    بروتوكول سيربيروس 3.1: إصدار مُصحَح يضمن استمرارية التجاهل (الكتم) بشكل صحيح.
+    بروتوكول سيربيروس 4.0 (مرحلة منع التكرار في PreprocessMiddleware): الكشف عن الإزعاج يتم بالكامل في الذاكرة
+    (نافذة منزلقة بحلقة طوابع زمنية ثابتة الحجم). قاعدة البيانات لا تُستخدم إلا عند تطبيق عقوبة (كتم أو حظر).
     """
-    async def on_pre_process_message(self, message: types.Message, data: dict):
-        user = message.from_user
-        if not user or user.id == ADMIN_USER_ID:
-            return
-
-        settings = await db.get_antiflood_settings()
-        if not settings.get("enabled", True):
-            return
-
-        dp = Dispatcher.get_current()
-        storage = dp.storage
-        user_id = user.id
-        
-        user_data = await storage.get_data(chat=user_id, user=user_id) or {}
-        mute_until = user_data.get("mute_until")
-        now = datetime.now()
-
-        # الخطوة 1: التحقق مما إذا كان المستخدم قيد التجاهل (الكتم المؤقت)
-        # هذا الجزء سيعمل الآن بشكل صحيح لأننا لن نحذف 'mute_until' عن طريق الخطأ
-        if mute_until and now < datetime.fromisoformat(mute_until):
-            raise CancelHandler() # إذا كان مقيداً، نتجاهل الرسالة تماماً
-
-        timestamps = user_data.get("antiflood_timestamps", [])
-        timestamps.append(now)
-        rate_limit = settings.get("rate_limit", 7)
-        time_window = settings.get("time_window", 2)
-        
-        recent_timestamps = [ts for ts in timestamps if now - ts < timedelta(seconds=time_window)]
-
-        # الخطوة 2: التحقق من حدوث إزعاج
-        if len(recent_timestamps) >= rate_limit:
-            # تم اكتشاف إزعاج، لنبدأ بتطبيق العقوبات
-            
-            # نسجل المخالفة ونحصل على العدد الحالي
-            await db.record_antiflood_violation(user_id)
-            violation_count = await db.get_user_violation_count(user_id, within_hours=1)
-            
-            # الخطوة 3: تحديد العقوبة المناسبة
-            if violation_count >= 2:
-                # --- العقوبة الثانية: الحظر الدائم ---
-                await db.ban_user(user_id)
-                ban_notification = await db.get_text("af_ban_notification")
-                admin_notification_text = f"🚫 تم الحظر التلقائي\n\nالمستخدم: {user.get_mention(as_html=True)} (`{user_id}`)\nالسبب: الإزعاج المتكرر"
-                
-                try: 
-                    await message.answer(ban_notification)
-                except TelegramAPIError as e:
-                    logger.warning(f"Could not send ban notification to {user_id}: {e}")
-                
-                keyboard = types.InlineKeyboardMarkup().add(types.InlineKeyboardButton("✅ إلغاء الحظر", callback_data=f"bm_unban_direct:{user_id}"))
-                await message.bot.send_message(ADMIN_USER_ID, admin_notification_text, reply_markup=keyboard, parse_mode="HTML")
-                
-                # نمسح بيانات المستخدم من الذاكرة بعد حظره
-                await storage.set_data(chat=user_id, user=user_id, data={})
-
-            else:
-                # --- العقوبة الأولى: الكتم المؤقت (التجاهل) ---
-                mute_duration = settings.get("mute_duration", 30)
-                mute_end_time = now + timedelta(minutes=mute_duration)
-                
-                # نحصل على البيانات الحالية ونضيف إليها وقت التجاهل
-                current_data = await storage.get_data(chat=user_id, user=user_id) or {}
-                current_data['mute_until'] = mute_end_time.isoformat()
-                current_data['antiflood_timestamps'] = [] # نفرغ الطوابع الزمنية بعد العقوبة
-                await storage.set_data(chat=user_id, user=user_id, data=current_data)
-
-                mute_notification = (await db.get_text("af_mute_notification")).format(duration=mute_duration)
-                admin_notification_text = f"🔇 تم تجاهل المستخدم {user.get_mention(as_html=True)} (`{user_id}`) لمدة {mute_duration} دقيقة."
-
-                try: 
-                    await message.answer(mute_notification)
-                except TelegramAPIError as e: 
-                    logger.warning(f"Could not send mute notification to {user_id}: {e}")
-
-                await message.bot.send_message(ADMIN_USER_ID, admin_notification_text, parse_mode="HTML")
-
-            raise CancelHandler() # نوقف معالجة الرسالة بعد تطبيق العقوبة
-        else:
-            # --- 💡 بداية الإصلاح النهائي 💡 ---
-            # الكود القديم كان يمسح 'mute_until'. الكود الجديد يحافظ عليه.
-            # نحضر البيانات الحالية للمستخدم
-            current_data = await storage.get_data(chat=user_id, user=user_id) or {}
-            # نحدّث فقط قائمة الطوابع الزمنية
-            current_data['antiflood_timestamps'] = recent_timestamps
-            # نحفظ البيانات المحدثة كاملة دون أن نفقد شيئاً
-            await storage.set_data(chat=user_id, user=user_id, data=current_data)
-            # --- 💡 نهاية الإصلاح النهائي 💡 ---
+    settings = ctx.antiflood_settings
+    if not settings.get("enabled", True):
+        return
+
+    # رسائل المستخدم الواحد تُعالج بالتوازي، ومسار العقوبة ينتظر قاعدة البيانات؛ بدون القفل قد تُسجل
+    # دفعة واحدة من الرسائل مخالفتين (فيُحظر المستخدم بدلاً من كتمه). القفل خاص بالمستخدم فقط.
+    async with user_locks.hold(ctx.user_id):
+        await _check_flood(ctx, message, settings)
+
+
+async def _check_flood(ctx, message: types.Message, settings: dict):
+    user = ctx.user
+    user_id = ctx.user_id
+    now = time.time()
+
+    # الخطوة 1: التحقق مما إذا كان المستخدم قيد التجاهل (الكتم المؤقت)
+    if flood_limiter.is_muted(user_id, now):
+        raise CancelHandler() # إذا كان مقيداً، نتجاهل الرسالة تماماً
+
+    # PERFORMANCE: No FSM round trips for normal users, only a dict lookup and an O(1) ring update
+    rate_limit = settings.get("rate_limit", 7)
+    time_window = settings.get("time_window", 2)
+    if not flood_limiter.hit(user_id, rate_limit, time_window, now):
+        return
+
+    # الخطوة 2: تم اكتشاف إزعاج، لنبدأ بتطبيق العقوبات
+    # نسجل المخالفة ونحصل على العدد الحالي في استدعاء ذري واحد
+    violation_count = await db.record_antiflood_violation(user_id, reset_after_hours=1)
+
+    # الخطوة 3: تحديد العقوبة المناسبة
+    if violation_count >= 2:
+        # --- العقوبة الثانية: الحظر الدائم ---
+        await db.ban_user(user_id)
+        # المحظور لا يصل إلى هنا مجدداً، فلا داعي للاحتفاظ بحالته في الذاكرة
+        flood_limiter.forget(user_id)
+        ban_notification = await db.get_text("af_ban_notification")
+        admin_notification_text = f"🚫 تم الحظر التلقائي\n\nالمستخدم: {user.get_mention(as_html=True)} (`{user_id}`)\nالسبب: الإزعاج المتكرر"
+
+        try:
+            await message.answer(ban_notification)
+        except TelegramAPIError as e:
+            logger.warning(f"Could not send ban notification to {user_id}: {e}")
+
+        unban_button = types.InlineKeyboardButton(f"✅ إلغاء الحظر ({user_id})", callback_data=f"bm_unban_direct:{user_id}")
+        await admin_notifier.notify(message.bot, admin_notification_text, [unban_button])
+
+    else:
+        # --- العقوبة الأولى: الكتم المؤقت (التجاهل) ---
+        mute_duration = settings.get("mute_duration", 30)
+        mute_until = now + mute_duration * 60
+        flood_limiter.mute(user_id, mute_until)
+        # يُحفظ الكتم فقط عند تطبيقه حتى يبقى سارياً بعد إعادة التشغيل
+        await db.mute_user(user_id, datetime.utcfromtimestamp(mute_until))
+
+        mute_notification = (await db.get_text("af_mute_notification")).format(duration=mute_duration)
+        admin_notification_text = f"🔇 تم تجاهل المستخدم {user.get_mention(as_html=True)} (`{user_id}`) لمدة {mute_duration} دقيقة."
+
+        try:
+            await message.answer(mute_notification)
+        except TelegramAPIError as e:
+            logger.warning(f"Could not send mute notification to {user_id}: {e}")
+
+        await admin_notifier.notify(message.bot, admin_notification_text)
+
+    raise CancelHandler() # نوقف معالجة الرسالة بعد تطبيق العقوبة
+
+
+async def restore_persisted_mutes():
+    """يعيد تحميل حالات الكتم السارية من قاعدة البيانات إلى الذاكرة عند بدء التشغيل."""
+    mutes = await db.get_active_mutes()
+    flood_limiter.restore_mutes({user_id: mute_until.replace(tzinfo=timezone.utc).timestamp() for user_id, mute_until in mutes.items()})
+    if mutes:
+        logger.info(f"🔇 Restored {len(mutes)} active anti-flood mutes.")
 
 
 def register_direct_unban_handler(dp: Dispatcher):
@@ -111,8 +100,14 @@ def register_direct_unban_handler(dp: Dispatcher):
         user_id_to_unban = int(call.data.split(":")[-1])
         if await db.unban_user(user_id_to_unban):
             await call.answer(f"✅ تم إلغاء حظر المستخدم {user_id_to_unban}")
+            # In a digest the other unban buttons must survive the edit
+            remaining_buttons = [
+                button for row in (call.message.reply_markup.inline_keyboard if call.message.reply_markup else [])
+                for button in row if button.callback_data != call.data
+            ]
+            keyboard = types.InlineKeyboardMarkup(row_width=1).add(*remaining_buttons) if remaining_buttons else None
             try:
-                await call.message.edit_text(call.message.html_text + "\n\n---\n<i>تم إلغاء الحظر بنجاح.</i>", parse_mode="HTML")
+                await call.message.edit_text(call.message.html_text + f"\n\n---\n<i>تم إلغاء حظر {user_id_to_unban} بنجاح.</i>", reply_markup=keyboard, parse_mode="HTML")
             except Exception:
                 pass
         else:
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from bot.database.manager import db
+from bot.middlewares.ban_middleware import reject_banned_users
+from bot.middlewares.security_middleware import reject_when_bot_inactive, enforce_media_policy
+from bot.middlewares.antiflood_middleware import enforce_antiflood
+from config import ADMIN_USER_ID
+
+
+class UserContext:
+    """
+    كل ما تحتاجه المراحل والمعالجات عن صاحب التحديث، يُحسب مرة واحدة فقط.
+    يصل إلى المعالجات عبر المعامل `user_context`.
+    """
+    __slots__ = ("user", "user_id", "is_admin", "security_settings", "antiflood_settings")
+
+    def __init__(self, user: types.User, security_settings: dict, antiflood_settings: dict):
+        self.user = user
+        self.user_id = user.id
+        self.is_admin = user.id == ADMIN_USER_ID
+        self.security_settings = security_settings
+        self.antiflood_settings = antiflood_settings
+
+
+# Stages run in this order and exit early by raising CancelHandler.
+# Each one is `async def stage(ctx: UserContext, event)`.
+MESSAGE_STAGES = (reject_banned_users, reject_when_bot_inactive, enforce_antiflood, enforce_media_policy)
+CALLBACK_QUERY_STAGES = (reject_banned_users, reject_when_bot_inactive)
+
+
+class PreprocessMiddleware(BaseMiddleware):
+    """
+    خط معالجة مسبقة موحد بدلاً من عدة وسائط مستقلة: يحدد المستخدم وإعداداته مرة واحدة لكل تحديث،
+    ثم يمرر الرسالة على مراحل الحظر، حالة البوت، منع التكرار وسياسة الوسائط بالترتيب.
+    """
+    @staticmethod
+    async def _run(stages: tuple, event, data: dict):
+        user = event.from_user
+        if not user: return
+        ctx = UserContext(user, await db.get_security_settings(), await db.get_antiflood_settings())
+        data["user_context"] = ctx
+        # المدير معفى من جميع القيود
+        if ctx.is_admin: return
+        for stage in stages:
+            await stage(ctx, event)
+        # Feeds the "active within N days" broadcast segment (buffered, written in bulk)
+        await db.record_user_activity(ctx.user_id)
+
+    async def on_pre_process_message(self, message: types.Message, data: dict):
+        await self._run(MESSAGE_STAGES, message, data)
+
+    async def on_pre_process_callback_query(self, call: types.CallbackQuery, data: dict):
+        await self._run(CALLBACK_QUERY_STAGES, call, data)
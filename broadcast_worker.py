@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import signal
+
+from aiogram import Bot
+
+from config import TELEGRAM_TOKEN, MONGO_URI, STORAGE_BACKEND
+from bot.database.manager import db
+from bot.core.broadcast_jobs import broadcast_worker
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    """
+    عامل النشر الجماعي كعملية مستقلة عن البوت: يسحب المهام من طابور MongoDB ويرسلها بنفس التوكن،
+    فلا تنافس الحملات الطويلة معالجة الرسائل، وتعطل إحداهما لا يوقف الأخرى.
+    شغّله مع BROADCAST_WORKER=external في عملية البوت (يمكن تشغيل أكثر من عامل).
+    """
+    if STORAGE_BACKEND == "memory":
+        logger.critical("❌ التخزين في الذاكرة لا يُشارك بين العمليات؛ عامل النشر يعمل داخل البوت في هذا الوضع.")
+        return
+
+    if not await db.connect_to_database(MONGO_URI):
+        logger.critical("❌ فشل الاتصال بقاعدة البيانات، إيقاف عامل النشر.")
+        return
+
+    bot = Bot(token=TELEGRAM_TOKEN)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        # الإيقاف يحفظ نقطة استئناف ويعيد المهمة الحالية إلى الطابور
+        loop.add_signal_handler(sig, lambda: asyncio.create_task(broadcast_worker.shutdown()))
+    try:
+        await broadcast_worker.run(bot)
+    finally:
+        session = await bot.get_session()
+        await session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
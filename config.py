@@ -8,8 +8,15 @@ load_dotenv()
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 MONGO_URI = os.getenv("MONGO_URI")
 ADMIN_USER_ID = int(os.getenv("ADMIN_USER_ID", 0))
+# "mongo" (الافتراضي) أو "memory" لاختبارات الحمل بدون قاعدة بيانات
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo").lower()
+# "inline" (الافتراضي): عامل النشر يعمل داخل عملية البوت، "external": يعمل فقط عبر broadcast_worker.py
+# التخزين في الذاكرة لا يمكن مشاركته بين عمليتين، لذلك يبقى العامل داخلياً معه دائماً
+BROADCAST_WORKER = "inline" if STORAGE_BACKEND == "memory" else os.getenv("BROADCAST_WORKER", "inline").lower()
+# رمز سري لمسار /metrics/db على خادم الويب؛ بدونه لا يُفتح المسار (القياسات متاحة للمدير من "مراقبة النظام")
+DB_METRICS_TOKEN = os.getenv("DB_METRICS_TOKEN", "")
 
-# التأكد من وجود المتغيرات الأساسية
-if not TELEGRAM_TOKEN or not MONGO_URI or not ADMIN_USER_ID:
+# التأكد من وجود المتغيرات الأساسية (MONGO_URI غير مطلوب مع التخزين في الذاكرة)
+if not TELEGRAM_TOKEN or not ADMIN_USER_ID or (STORAGE_BACKEND != "memory" and not MONGO_URI):
     print("خطأ فادح: أحد متغيرات البيئة الأساسية (TELEGRAM_TOKEN, MONGO_URI, ADMIN_USER_ID) غير موجود.")
     exit()
@@ -1,20 +1,25 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
+import hmac
 import logging
 import os
 import re
 from aiogram import Bot, Dispatcher
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.contrib.fsm_storage.mongo import MongoStorage
 from aiohttp import web
 
 from bot.core.scheduler import scheduler, load_pending_jobs
-from config import TELEGRAM_TOKEN, MONGO_URI
+from config import TELEGRAM_TOKEN, MONGO_URI, STORAGE_BACKEND, BROADCAST_WORKER, DB_METRICS_TOKEN
 from bot.utils.loader import discover_handlers
-from bot.database.manager import db
+from bot.database.manager import db, USER_PROFILE_FLUSH_INTERVAL, STATS_RECONCILE_INTERVAL
+from bot.database.instrumentation import DB_METRICS
+from bot.core.admin_notifier import admin_notifier
+from bot.core.broadcast_jobs import broadcast_worker
 from bot.middlewares.admin_filter import IsAdminFilter
-from bot.middlewares.ban_middleware import BanMiddleware
-from bot.middlewares.antiflood_middleware import AntiFloodMiddleware, register_direct_unban_handler
+from bot.middlewares.preprocess_middleware import PreprocessMiddleware
+from bot.middlewares.antiflood_middleware import register_direct_unban_handler, restore_persisted_mutes
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
@@ -28,9 +33,10 @@ async def run_database_integrity_check():
     logger.info(" Gearing up for a database integrity check...")
     
     defined_functions = set()
-    manager_path = 'bot/database/manager.py'
+    # كل الواجهات الخلفية تنفذ StorageBackend، لذلك نفحص الدوال المعرفة في ملف الواجهة
+    interface_path = 'bot/database/backend.py'
     try:
-        with open(manager_path, 'r', encoding='utf-8') as f:
+        with open(interface_path, 'r', encoding='utf-8') as f:
             content = f.read()
             matches = re.findall(r'async def\s+(\w+)\s*\(|def\s+(\w+)\s*\(', content)
             for match in matches:
@@ -38,7 +44,7 @@ async def run_database_integrity_check():
                 if func_name:
                     defined_functions.add(func_name)
     except FileNotFoundError:
-        logger.error(f" FATAL: Diagnostic check failed. Could not find '{manager_path}'")
+        logger.error(f" FATAL: Diagnostic check failed. Could not find '{interface_path}'")
         return False
 
     called_functions = set()
@@ -70,12 +76,12 @@ async def run_database_integrity_check():
     
     logger.info("--- Database Integrity Report ---")
     if not missing_functions:
-        logger.info("✅ SUCCESS! All database functions are correctly defined in manager.py.")
+        logger.info("✅ SUCCESS! All database functions are correctly defined in the storage interface.")
         return True
     else:
         logger.error("❌ FAILED! Missing database functions found. The application will not start.")
         for func in sorted(list(missing_functions)):
-            logger.error(f"  - Function '{func}' is called in the project but NOT defined in manager.py.")
+            logger.error(f"  - Function '{func}' is called in the project but NOT defined in the storage interface.")
         logger.info("--- End of Report ---")
         return False
 
@@ -88,18 +94,29 @@ async def start_bot():
         return
 
     bot = Bot(token=TELEGRAM_TOKEN)
-    storage = MongoStorage(uri=MONGO_URI, db_name="aiogram_fsm")
+    # حالات FSM تتبع واجهة التخزين المختارة حتى لا يحتاج وضع الذاكرة إلى MongoDB إطلاقاً
+    if STORAGE_BACKEND == "memory":
+        storage = MemoryStorage()
+    else:
+        storage = MongoStorage(uri=MONGO_URI, db_name="aiogram_fsm")
     dp = Dispatcher(bot, storage=storage)
 
     dp.filters_factory.bind(IsAdminFilter)
-    dp.middleware.setup(BanMiddleware())
-    dp.middleware.setup(AntiFloodMiddleware())
+    # خط واحد للمعالجة المسبقة: الحظر، حالة البوت، منع التكرار وسياسة الوسائط
+    dp.middleware.setup(PreprocessMiddleware())
 
     if not await db.connect_to_database(MONGO_URI):
         logger.critical("❌ فشل الاتصال بقاعدة البيانات، إيقاف البوت.")
         return
 
+    await restore_persisted_mutes()
     await load_pending_jobs(bot)
+    broadcast_task = None
+    if BROADCAST_WORKER == "inline":
+        # مهام النشر تُنفذ في الخلفية داخل هذه العملية؛ مع "external" يتولاها broadcast_worker.py
+        broadcast_task = asyncio.create_task(broadcast_worker.run(bot))
+    scheduler.add_job(db.flush_user_profiles, "interval", seconds=USER_PROFILE_FLUSH_INTERVAL, id="flush_user_profiles", replace_existing=True)
+    scheduler.add_job(db.reconcile_statistics, "interval", seconds=STATS_RECONCILE_INTERVAL, id="reconcile_statistics", replace_existing=True)
 
     all_handler_modules = discover_handlers()
     logger.info("🚦 بدء تسجيل المعالجات...")
@@ -122,14 +139,30 @@ async def start_bot():
     register_direct_unban_handler(dp)
 
     logger.info("✅ البوت جاهز للعمل وينتظر الرسائل...")
-    await dp.start_polling()
+    try:
+        await dp.start_polling()
+    finally:
+        # نكتب أي تحديثات معلقة للمستخدمين قبل الإيقاف حتى لا تضيع
+        if broadcast_task:
+            await broadcast_worker.shutdown()
+            await broadcast_task
+        await db.flush_user_profiles()
+        await admin_notifier.shutdown()
 
 async def handle_root(request):
     return web.Response(text="Bot is alive and running!")
 
+async def handle_db_metrics(request):
+    """زمن استدعاءات التخزين بصيغة JSON (يتطلب DB_METRICS_ENABLED=true وترويسة Authorization: Bearer <DB_METRICS_TOKEN>)."""
+    if not hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {DB_METRICS_TOKEN}".encode()):
+        raise web.HTTPUnauthorized()
+    return web.json_response(DB_METRICS.snapshot())
+
 async def start_web_server():
     app = web.Application()
     app.router.add_get("/", handle_root)
+    if DB_METRICS_TOKEN:
+        app.router.add_get("/metrics/db", handle_db_metrics)
     runner = web.AppRunner(app)
     await runner.setup()
     port = int(os.environ.get("PORT", 10000))
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+# config.py exits without these; the tests never talk to Telegram or MongoDB
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:test")
+os.environ.setdefault("ADMIN_USER_ID", "1")
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import datetime
+
+import pytest
+
+pytest.importorskip("apscheduler")
+pytest.importorskip("aiogram")
+pytest.importorskip("motor")
+
+from bot.core import scheduler as scheduler_module
+
+
+def test_post_due_in_a_few_seconds_fires(monkeypatch):
+    """A post stored in naive UTC must fire at that instant, not at the same wall-clock time in Asia/Riyadh."""
+    monkeypatch.setattr(scheduler_module, "SCHEDULER_WAVE_WINDOW", 1)
+    fired = []
+
+    async def fake_wave(bot, wave_at):
+        fired.append((bot, wave_at))
+
+    monkeypatch.setattr(scheduler_module, "send_scheduled_wave", fake_wave)
+
+    async def run():
+        scheduler_module.scheduler.start()
+        try:
+            run_date = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) + datetime.timedelta(seconds=2)
+            scheduler_module.schedule_post("bot", run_date)
+            for _ in range(50):
+                if fired: break
+                await asyncio.sleep(0.1)
+        finally:
+            scheduler_module.scheduler.shutdown(wait=False)
+
+    asyncio.run(run())
+    assert len(fired) == 1
+    assert fired[0][0] == "bot"
+
+
+def test_posts_in_one_window_share_a_wave(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "SCHEDULER_WAVE_WINDOW", 60)
+
+    async def run():
+        scheduler_module.scheduler.start(paused=True)
+        try:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            wave_at = scheduler_module._wave_time(now + datetime.timedelta(minutes=2))
+            for seconds in (50, 20, 0):
+                scheduler_module.schedule_post("bot", (wave_at - datetime.timedelta(seconds=seconds)).replace(tzinfo=None))
+            jobs = [job for job in scheduler_module.scheduler.get_jobs() if job.id.startswith("sch_wave_")]
+            assert [job.id for job in jobs] == [f"sch_wave_{wave_at:%Y%m%d%H%M%S}"]
+            assert jobs[0].next_run_time == wave_at
+            assert jobs[0].args == ("bot", wave_at)
+        finally:
+            scheduler_module.scheduler.shutdown(wait=False)
+
+    asyncio.run(run())
+
+
+def test_wave_sends_the_posts_of_its_window(monkeypatch):
+    import bot.database.manager as manager_module
+    from bot.database.memory_backend import InMemoryDatabaseManager
+
+    memory_db = InMemoryDatabaseManager()
+    monkeypatch.setattr(manager_module, "db", memory_db)
+    monkeypatch.setattr(scheduler_module, "SCHEDULER_WAVE_WINDOW", 60)
+    deliveries = []
+
+    async def fake_fan_out_many(bot, wave_deliveries):
+        deliveries.extend(wave_deliveries)
+        return [[{"channel_id": channel_id, "ok": True, "error": None} for channel_id in channel_ids] for _, channel_ids in wave_deliveries]
+
+    monkeypatch.setattr(scheduler_module, "fan_out_many", fake_fan_out_many)
+
+    async def run():
+        await memory_db.connect_to_database()
+        await memory_db.add_publishing_channel(-100, "channel")
+        wave_at = datetime.datetime(2026, 10, 18, 9, 4, tzinfo=datetime.timezone.utc)
+        naive = wave_at.replace(tzinfo=None)
+        await memory_db.add_scheduled_post("early", {"chat_id": 1, "message_id": 1}, [], naive - datetime.timedelta(seconds=30))
+        await memory_db.add_scheduled_post("on_time", {"chat_id": 1, "message_id": 2}, [], naive)
+        await memory_db.add_scheduled_post("next_wave", {"chat_id": 1, "message_id": 3}, [], naive + datetime.timedelta(seconds=30))
+        await scheduler_module.send_scheduled_wave("bot", wave_at)
+        return {job_id: (await memory_db.get_scheduled_post(job_id))["status"] for job_id in ("early", "on_time", "next_wave")}
+
+    statuses = asyncio.run(run())
+    assert [message_data["message_id"] for message_data, _ in deliveries] == [1, 2]
+    assert statuses == {"early": "done", "on_time": "done", "next_wave": "pending"}